@@ -1,6 +1,7 @@
 from django.contrib import admin
 
-from .models import FriendShip, User
+from .models import FriendShip, User, UserStats
 
 admin.site.register(User)
 admin.site.register(FriendShip)
+admin.site.register(UserStats)
@@ -0,0 +1,11 @@
+from django.contrib.auth.backends import ModelBackend
+
+from .identity import get_cached_user
+
+
+class CachedModelBackend(ModelBackend):
+    """ModelBackend that loads the user of each session from the user cache instead of the database."""
+
+    def get_user(self, user_id):
+        user = get_cached_user(user_id)
+        return user if user is not None and self.user_can_authenticate(user) else None
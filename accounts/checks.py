@@ -0,0 +1,18 @@
+from django.conf import settings
+from django.core.checks import Warning, register
+
+
+@register()
+def check_user_cache_backend(app_configs, **kwargs):
+    """Warn when the user cache is enabled on a cache that each process keeps for itself."""
+    backend = settings.CACHES["default"]["BACKEND"]
+    if settings.ACCOUNTS_USER_CACHE_TIMEOUT and backend.endswith("LocMemCache"):
+        return [
+            Warning(
+                "ACCOUNTS_USER_CACHE_TIMEOUT is set but the default cache is per process.",
+                hint="Other worker processes keep changed and deactivated users until the timeout. Configure a "
+                "shared cache backend in CACHES, or set ACCOUNTS_USER_CACHE_TIMEOUT to 0.",
+                id="accounts.W001",
+            )
+        ]
+    return []
@@ -0,0 +1,167 @@
+import time
+
+from django.conf import settings
+from django.db import transaction
+from django.utils import timezone
+
+from mysite.workers import periodic_worker
+from tweets.models import Like, Mention, TimelineEntry, Tweet
+from tweets.purge import purge_tweet_chunk
+from tweets.services import set_like_states
+
+from .models import AccountDeletion, FollowRecommendation, FriendShip, User
+from .services import add_user_stats, bulk_add_user_stats, unfollow_many
+
+
+def _hide_tweets(user, batch_size):
+    tweet_ids = list(Tweet.objects.filter(user=user).values_list("pk", flat=True)[:batch_size])
+    if not tweet_ids:
+        return 0
+    # Changes the version of the home timelines showing these tweets, so that followers stop getting 304s.
+    add_user_stats(user.pk)
+    return Tweet.objects.filter(pk__in=tweet_ids).update(deleted_at=timezone.now())
+
+
+def _tweets(user, batch_size):
+    tweet_id = Tweet.all_objects.filter(user=user).values_list("pk", flat=True).first()
+    return purge_tweet_chunk(tweet_id, batch_size) if tweet_id is not None else 0
+
+
+def _likes(user, batch_size):
+    tweet_ids = list(Like.objects.filter(user=user).values_list("tweet_id", flat=True)[:batch_size])
+    if not tweet_ids:
+        return 0
+    # Takes the likes off the tweets' counts and their authors' stats, as if the user had unliked them.
+    set_like_states(user, dict.fromkeys(tweet_ids, False))
+    # Likes on deleted tweets are skipped by set_like_states; their counts no longer matter.
+    Like.objects.filter(user=user, tweet_id__in=tweet_ids).delete()
+    return len(tweet_ids)
+
+
+def _following(user, batch_size):
+    following_ids = list(FriendShip.objects.filter(follower=user).values_list("following_id", flat=True)[:batch_size])
+    unfollow_many(user, following_ids)
+    return len(following_ids)
+
+
+def _followers(user, batch_size):
+    follows = list(FriendShip.objects.filter(following=user).values_list("pk", "follower_id")[:batch_size])
+    if not follows:
+        return 0
+    FriendShip.objects.filter(pk__in=[pk for pk, _ in follows]).delete()
+    # The user's tweets, and so their followers' timeline entries of them, are already gone.
+    bulk_add_user_stats([follower_id for _, follower_id in follows], following_count=-1)
+    return len(follows)
+
+
+def _other(user, batch_size):
+    for queryset in [
+        TimelineEntry.objects.filter(owner=user),
+        Mention.objects.filter(user=user),
+        FollowRecommendation.objects.filter(user=user),
+        FollowRecommendation.objects.filter(candidate=user),
+    ]:
+        pks = list(queryset.values_list("pk", flat=True)[:batch_size])
+        if pks:
+            return queryset.model.objects.filter(pk__in=pks).delete()[0]
+    return 0
+
+
+def _user(user, batch_size):
+    # Everything else referencing the user is gone, so this only cascades to their stats and auth rows.
+    return User.objects.filter(pk=user.pk).delete()[0]
+
+
+# The batch function of each stage, run until it returns 0, except for "user" which deletes the user row in
+# one batch. Tweets are hidden first so that they disappear from every page at once, and the user row goes
+# last so that an interrupted deletion can always be resumed from it.
+STAGE_BATCHES = {
+    "hide_tweets": _hide_tweets,
+    "tweets": _tweets,
+    "likes": _likes,
+    "following": _following,
+    "followers": _followers,
+    "other": _other,
+    "user": _user,
+}
+
+
+def request_account_deletion(user):
+    """
+    Deactivate ``user`` at once, which ends their sessions and hides their profile, and queue the deletion of
+    their account. Return the AccountDeletion tracking it.
+    """
+    with transaction.atomic():
+        user.is_active = False
+        user.save(update_fields=["is_active"])
+        deletion, _ = AccountDeletion.objects.get_or_create(
+            user=user,
+            defaults={"username": user.username, "batch_size": settings.ACCOUNTS_DELETION["BATCH_SIZE"]},
+        )
+        transaction.on_commit(_wake_worker)
+    return deletion
+
+
+def _next_batch_size(batch_size, elapsed):
+    """Halve the batch size after a batch that held the write lock too long, and double it after a quick one."""
+    config = settings.ACCOUNTS_DELETION
+    if elapsed > config["MAX_LOCK_SECONDS"]:
+        return max(1, batch_size // 2)
+    if elapsed < config["MAX_LOCK_SECONDS"] / 4:
+        return min(config["MAX_BATCH_SIZE"], batch_size * 2)
+    return batch_size
+
+
+def run_account_deletion(deletion, max_batches=None):
+    """
+    Advance ``deletion`` by up to ``max_batches`` batches, or until the account is gone. Return True once done.
+
+    Each batch runs in its own transaction together with the progress it records, so the deletion resumes
+    where it stopped after a crash. The batch size adapts so that each transaction stays within
+    ACCOUNTS_DELETION["MAX_LOCK_SECONDS"].
+    """
+    user = deletion.user
+    batches = 0
+    while deletion.stage != "done" and (max_batches is None or batches < max_batches):
+        start = time.perf_counter()
+        with transaction.atomic():
+            deleted = STAGE_BATCHES[deletion.stage](user, deletion.batch_size) if user is not None else 0
+            deletion.rows_deleted += deleted
+            if not deleted or deletion.stage == "user":
+                deletion.stage = AccountDeletion.STAGES[AccountDeletion.STAGES.index(deletion.stage) + 1]
+            if deletion.stage == "done":
+                deletion.user = user = None
+                deletion.completed_at = timezone.now()
+            deletion.save()
+        deletion.batch_size = _next_batch_size(deletion.batch_size, time.perf_counter() - start)
+        batches += 1
+    return deletion.stage == "done"
+
+
+def run_pending_account_deletions(max_batches=None):
+    """Advance every unfinished account deletion, oldest request first, and return how many finished."""
+    finished = 0
+    for deletion in AccountDeletion.objects.filter(completed_at__isnull=True).order_by("requested_at"):
+        finished += run_account_deletion(deletion, max_batches)
+    return finished
+
+
+# Runs pending account deletions when woken after a request, and every INTERVAL seconds to resume deletions
+# interrupted by a restart.
+_worker = periodic_worker("ACCOUNTS_DELETION", lambda config: run_pending_account_deletions(), "account-deleter")
+
+
+def get_deletion_worker():
+    """Return the process-wide account deletion worker, or None when ACCOUNTS_DELETION is not enabled."""
+    return _worker.get()
+
+
+def stop_deletion_worker():
+    """Stop and discard the process-wide account deletion worker, if one was started."""
+    _worker.stop()
+
+
+def _wake_worker():
+    worker = get_deletion_worker()
+    if worker is not None:
+        worker.wake()
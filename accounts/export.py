@@ -0,0 +1,108 @@
+import csv
+import json
+from itertools import islice
+
+from django.conf import settings
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db.models import F
+
+from tweets.models import Like, Tweet
+
+from .models import FriendShip
+
+EXPORT_FORMATS = {"jsonl": "application/x-ndjson", "csv": "text/csv"}
+EXPORT_SECTIONS = ("tweets", "likes", "following", "followers")
+CSV_COLUMNS = ("cursor", "type", "id", "created_at", "content", "like_count", "tweet_id", "username")
+
+
+def _sections(user):
+    """Return ``(section, type, queryset of dicts)`` for each part of the export, in export order."""
+    # Keep in the order of EXPORT_SECTIONS, which cursors rely on.
+    return [
+        ("tweets", "tweet", Tweet.objects.filter(user=user).values("id", "created_at", "content", "like_count")),
+        (
+            "likes",
+            "like",
+            Like.objects.filter(user=user, tweet__deleted_at__isnull=True).values(
+                "id", "created_at", "tweet_id", username=F("tweet__user__username")
+            ),
+        ),
+        (
+            "following",
+            "following",
+            FriendShip.objects.filter(follower=user).values("id", "created_at", username=F("following__username")),
+        ),
+        (
+            "followers",
+            "follower",
+            FriendShip.objects.filter(following=user).values("id", "created_at", username=F("follower__username")),
+        ),
+    ]
+
+
+def parse_cursor(cursor):
+    """Split a ``"<section>:<id>"`` cursor into its parts. Raise ValueError if it is malformed."""
+    section, _, last_id = cursor.partition(":")
+    if section not in EXPORT_SECTIONS:
+        raise ValueError(f"Unknown export section {section!r}.")
+    return section, int(last_id)
+
+
+def export_rows(user, cursor=None, chunk_size=None):
+    """
+    Yield the tweets, likes and follow graph of ``user`` as flat dicts, each with the cursor to resume after it.
+
+    Every section is read in primary key order with ``iterator()``, so only ``chunk_size`` rows are held in
+    memory at a time however large the account is.
+    """
+    chunk_size = chunk_size or settings.ACCOUNTS_EXPORT_CHUNK_SIZE
+    resume_section, last_id = parse_cursor(cursor) if cursor else (None, None)
+    for section, row_type, queryset in _sections(user):
+        if resume_section is not None:
+            if section != resume_section:
+                continue
+            queryset = queryset.filter(id__gt=last_id)
+            resume_section = None
+        for row in queryset.order_by("id").iterator(chunk_size=chunk_size):
+            yield {"cursor": f"{section}:{row['id']}", "type": row_type, **row}
+
+
+def export_page(user, cursor=None, size=None):
+    """
+    Return up to ``size`` rows of export_rows, read at once, and the cursor to request the next page with, or
+    None after the last row.
+    """
+    size = size or settings.ACCOUNTS_EXPORT_CHUNK_SIZE
+    rows = export_rows(user, cursor, chunk_size=size + 1)
+    try:
+        page = list(islice(rows, size + 1))
+    finally:
+        rows.close()
+    return page[:size], page[size - 1]["cursor"] if len(page) > size else None
+
+
+def render_jsonl(rows, resume=False):
+    for row in rows:
+        yield json.dumps(row, cls=DjangoJSONEncoder, ensure_ascii=False) + "\n"
+
+
+class _Echo:
+    def write(self, value):
+        return value
+
+
+def render_csv(rows, resume=False):
+    writer = csv.DictWriter(_Echo(), CSV_COLUMNS)
+    if not resume:
+        yield writer.writerow(dict(zip(CSV_COLUMNS, CSV_COLUMNS)))
+    for row in rows:
+        row["created_at"] = row["created_at"].isoformat()
+        yield writer.writerow(row)
+
+
+def render_export(rows, export_format, resume=False):
+    """
+    Render ``export_rows`` as chunks of text in ``export_format``, one of EXPORT_FORMATS. When ``resume`` is
+    set the output continues an earlier export, so the CSV header is left out.
+    """
+    return {"jsonl": render_jsonl, "csv": render_csv}[export_format](rows, resume)
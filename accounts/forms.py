@@ -1,14 +1,24 @@
+from django import forms
 from django.contrib.auth import get_user_model
 from django.contrib.auth.forms import UserCreationForm
 
 User = get_user_model()
 
+# Paths of accounts.urls that precede "<str:username>/" and would hide the profile of a user with that name.
+RESERVED_USERNAMES = {"signup", "login", "logout", "export", "delete", "recommendations", "follows"}
+
 
 class SignUpForm(UserCreationForm):
     class Meta:
         model = User  # model = get_user_model() は NG
         fields = ("username", "email")
 
+    def clean_username(self):
+        username = self.cleaned_data["username"]
+        if username in RESERVED_USERNAMES:
+            raise forms.ValidationError("このユーザー名は使用できません。", code="reserved_username")
+        return username
+
 
 # password1, password2というフィールドはUserCreationFormの方で設定されているため、
 # fieldsの欄には、Userモデルの中にある、
@@ -0,0 +1,41 @@
+import asyncio
+import threading
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+from django.conf import settings
+from django.contrib.auth.hashers import make_password
+
+_executor = None
+_executor_lock = threading.Lock()
+
+
+def get_hashing_executor():
+    """
+    Return the process-wide pool that hashes passwords for async views, as configured by
+    ACCOUNTS_PASSWORD_HASHING.
+
+    PBKDF2 from hashlib releases the GIL, so a thread pool already hashes on several cores; a process pool
+    also isolates hashing from the server process at the cost of pickling each call.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            config = settings.ACCOUNTS_PASSWORD_HASHING
+            if config["EXECUTOR"] == "process":
+                _executor = ProcessPoolExecutor(max_workers=config["MAX_WORKERS"])
+            else:
+                _executor = ThreadPoolExecutor(max_workers=config["MAX_WORKERS"], thread_name_prefix="password-hasher")
+        return _executor
+
+
+def shutdown_hashing_executor():
+    global _executor
+    with _executor_lock:
+        if _executor is not None:
+            _executor.shutdown()
+            _executor = None
+
+
+async def make_password_async(password):
+    """Hash ``password`` in the hashing pool, so the event loop keeps serving other requests meanwhile."""
+    return await asyncio.get_running_loop().run_in_executor(get_hashing_executor(), make_password, password)
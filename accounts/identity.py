@@ -0,0 +1,85 @@
+import threading
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.core.cache import cache
+from django.db import transaction
+
+_stats = {"hits": 0, "misses": 0}
+_stats_lock = threading.Lock()
+
+
+def _id_key(user_id):
+    return f"accounts:user:{user_id}"
+
+
+def _username_key(username):
+    return f"accounts:username:{username}"
+
+
+def _count(result):
+    with _stats_lock:
+        _stats[result] += 1
+
+
+def get_user_cache_stats():
+    """Return the ``{"hits", "misses"}`` of the user cache in this process."""
+    with _stats_lock:
+        return dict(_stats)
+
+
+def reset_user_cache_stats():
+    with _stats_lock:
+        _stats.update(hits=0, misses=0)
+
+
+def _load_user(**lookup):
+    user = get_user_model().objects.filter(**lookup).first()
+    if user is not None:
+        cache.set_many(
+            {_id_key(user.pk): user, _username_key(user.username): user.pk}, settings.ACCOUNTS_USER_CACHE_TIMEOUT
+        )
+    return user
+
+
+def get_cached_user(user_id):
+    """
+    Return the user with primary key ``user_id``, or None if there is none.
+
+    Users are cached for ACCOUNTS_USER_CACHE_TIMEOUT seconds (0 disables the cache) without any related
+    objects, so counters such as ``user.stats`` are always read fresh. Misses are not cached.
+    """
+    if not settings.ACCOUNTS_USER_CACHE_TIMEOUT:
+        return get_user_model().objects.filter(pk=user_id).first()
+    user = cache.get(_id_key(user_id))
+    if user is not None:
+        _count("hits")
+        return user
+    _count("misses")
+    return _load_user(pk=user_id)
+
+
+def get_cached_user_by_username(username):
+    """Return the user named ``username``, or None. A hit costs two cache reads and no query."""
+    if not settings.ACCOUNTS_USER_CACHE_TIMEOUT:
+        return get_user_model().objects.filter(username=username).first()
+    user_id = cache.get(_username_key(username))
+    user = cache.get(_id_key(user_id)) if user_id is not None else None
+    # The name may have moved to another user since it was cached.
+    if user is not None and user.username == username:
+        _count("hits")
+        return user
+    _count("misses")
+    return _load_user(username=username)
+
+
+def forget_users(users):
+    """
+    Drop ``users`` from the cache now and again when the current transaction commits, so that a request
+    reading the old row in the meantime cannot cache it for long.
+    """
+    if not settings.ACCOUNTS_USER_CACHE_TIMEOUT:
+        return
+    keys = [_id_key(user.pk) for user in users] + [_username_key(user.username) for user in users]
+    cache.delete_many(keys)
+    transaction.on_commit(lambda: cache.delete_many(keys))
@@ -0,0 +1,23 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.deletion import request_account_deletion, run_pending_account_deletions
+from accounts.models import AccountDeletion, User
+
+
+class Command(BaseCommand):
+    help = "Request the deletion of the given accounts, then delete every account pending deletion in batches."
+
+    def add_arguments(self, parser):
+        parser.add_argument("usernames", nargs="*", help="Accounts to deactivate and queue for deletion.")
+        parser.add_argument("--max-batches", type=int, help="Stop each deletion after this many batches.")
+
+    def handle(self, *args, **options):
+        users = list(User.objects.filter(username__in=options["usernames"]))
+        missing = set(options["usernames"]).difference(user.username for user in users)
+        if missing:
+            raise CommandError(f"Unknown user(s): {', '.join(sorted(missing))}")
+        for user in users:
+            request_account_deletion(user)
+        finished = run_pending_account_deletions(options["max_batches"])
+        pending = AccountDeletion.objects.filter(completed_at__isnull=True).count()
+        self.stdout.write(f"Deleted {finished} account(s), {pending} still pending.")
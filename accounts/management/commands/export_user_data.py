@@ -0,0 +1,37 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from accounts.export import EXPORT_FORMATS, export_rows, parse_cursor, render_export
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Stream a user's tweets, likes and follow graph as JSON Lines or CSV."
+
+    def add_arguments(self, parser):
+        parser.add_argument("username")
+        parser.add_argument("--format", choices=EXPORT_FORMATS, default="jsonl")
+        parser.add_argument("--cursor", help="Resume after the row with this cursor.")
+        parser.add_argument("--chunk-size", type=int, help="Number of rows read from the database at a time.")
+        parser.add_argument("--output", help="Write to this file instead of standard output.")
+
+    def handle(self, *args, **options):
+        try:
+            user = User.objects.get(username=options["username"])
+        except User.DoesNotExist:
+            raise CommandError(f"User {options['username']} does not exist.")
+        if options["cursor"]:
+            try:
+                parse_cursor(options["cursor"])
+            except ValueError:
+                raise CommandError(f"Invalid cursor {options['cursor']!r}.")
+        rows = export_rows(user, options["cursor"], options["chunk_size"])
+        chunks = render_export(rows, options["format"], resume=bool(options["cursor"]))
+        if options["output"]:
+            # Append when resuming, so the cursor continues the file it came from.
+            with open(options["output"], "a" if options["cursor"] else "w", encoding="utf-8", newline="") as f:
+                f.writelines(chunks)
+        else:
+            for chunk in chunks:
+                self.stdout.write(chunk, ending="")
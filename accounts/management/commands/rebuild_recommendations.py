@@ -0,0 +1,19 @@
+from django.core.management.base import BaseCommand
+
+from accounts.recommendations import FollowGraph, np, rebuild_recommendations
+
+
+class Command(BaseCommand):
+    help = "Recompute the stored follow recommendations of every user from the whole follow graph."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Number of users written per transaction.")
+
+    def handle(self, *args, **options):
+        graph = FollowGraph.load()
+        self.stdout.write(
+            f"Loaded {len(graph)} users and {len(graph.following)} follows"
+            f"{'' if np is not None else ' (NumPy is not installed, scoring in pure Python)'}."
+        )
+        written = rebuild_recommendations(options["batch_size"], graph)
+        self.stdout.write(f"Stored {written} recommendations.")
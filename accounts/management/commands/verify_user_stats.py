@@ -0,0 +1,75 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+from django.db import transaction
+from django.db.models import Count
+
+from accounts.models import FriendShip, UserStats
+from tweets.models import Like, Tweet
+
+User = get_user_model()
+
+STAT_FIELDS = ("followers_count", "following_count", "tweets_count", "likes_received_count", "likes_count")
+
+
+def _counts(queryset, field):
+    return dict(queryset.values(field).annotate(n=Count("pk")).values_list(field, "n"))
+
+
+class Command(BaseCommand):
+    help = "Compare UserStats counters with the rows they count and optionally repair drift."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--repair", action="store_true", help="Overwrite drifted counters with actual counts.")
+        parser.add_argument("--batch-size", type=int, default=1000, help="Number of users checked per transaction.")
+
+    def handle(self, *args, **options):
+        checked = drifted = 0
+        last_pk = 0
+        while True:
+            with transaction.atomic():
+                user_ids = list(
+                    User.objects.filter(pk__gt=last_pk)
+                    .order_by("pk")
+                    .values_list("pk", flat=True)[: options["batch_size"]]
+                )
+                if not user_ids:
+                    break
+                last_pk = user_ids[-1]
+                actual = self.actual_stats(user_ids)
+                stored = {stats.user_id: stats for stats in UserStats.objects.filter(user_id__in=user_ids)}
+                wrong = []
+                for user_id in user_ids:
+                    stats = stored.get(user_id, UserStats(user_id=user_id))
+                    expected = {field: actual[field].get(user_id, 0) for field in STAT_FIELDS}
+                    if any(getattr(stats, field) != value for field, value in expected.items()):
+                        self.stdout.write(f"User {user_id}: stored {self.describe(stats)}, actual {expected}")
+                        wrong.append(UserStats(user_id=user_id, **expected))
+                if options["repair"]:
+                    UserStats.objects.bulk_create(
+                        wrong,
+                        update_conflicts=True,
+                        unique_fields=["user"],
+                        update_fields=[*STAT_FIELDS, "updated_at"],
+                    )
+            checked += len(user_ids)
+            drifted += len(wrong)
+
+        if drifted and not options["repair"]:
+            raise CommandError(f"{drifted} of {checked} user(s) have drifted stats. Run with --repair to fix them.")
+        action = "repaired" if options["repair"] else "found"
+        self.stdout.write(f"Checked {checked} user(s), {action} {drifted} drifted.")
+
+    def actual_stats(self, user_ids):
+        return {
+            "followers_count": _counts(FriendShip.objects.filter(following_id__in=user_ids), "following"),
+            "following_count": _counts(FriendShip.objects.filter(follower_id__in=user_ids), "follower"),
+            "tweets_count": _counts(Tweet.objects.filter(user_id__in=user_ids), "user"),
+            # Deleting a tweet takes its likes off the author's count at once; likers' counts drop when purged.
+            "likes_received_count": _counts(
+                Like.objects.filter(tweet__user_id__in=user_ids, tweet__deleted_at__isnull=True), "tweet__user"
+            ),
+            "likes_count": _counts(Like.objects.filter(user_id__in=user_ids), "user"),
+        }
+
+    def describe(self, stats):
+        return {field: getattr(stats, field) for field in STAT_FIELDS}
@@ -0,0 +1,66 @@
+# Generated by Django 4.1.13 on 2026-10-17 02:14
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count
+
+
+def populate_user_stats(apps, schema_editor):
+    FriendShip = apps.get_model("accounts", "FriendShip")
+    Like = apps.get_model("tweets", "Like")
+    Tweet = apps.get_model("tweets", "Tweet")
+    User = apps.get_model("accounts", "User")
+    UserStats = apps.get_model("accounts", "UserStats")
+
+    def counts(queryset, field):
+        return dict(queryset.values(field).annotate(n=Count("pk")).values_list(field, "n"))
+
+    followers = counts(FriendShip.objects, "following")
+    following = counts(FriendShip.objects, "follower")
+    tweets = counts(Tweet.objects, "user")
+    likes_received = counts(Like.objects, "tweet__user")
+    UserStats.objects.bulk_create(
+        [
+            UserStats(
+                user_id=pk,
+                followers_count=followers.get(pk, 0),
+                following_count=following.get(pk, 0),
+                tweets_count=tweets.get(pk, 0),
+                likes_received_count=likes_received.get(pk, 0),
+            )
+            for pk in User.objects.values_list("pk", flat=True)
+        ],
+        batch_size=1000,
+    )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0003_friendship_unique_friendship"),
+        ("tweets", "0003_tweet_like_count_likecountshard"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="UserStats",
+            fields=[
+                (
+                    "user",
+                    models.OneToOneField(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        primary_key=True,
+                        related_name="stats",
+                        serialize=False,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                ("followers_count", models.PositiveIntegerField(default=0)),
+                ("following_count", models.PositiveIntegerField(default=0)),
+                ("tweets_count", models.PositiveIntegerField(default=0)),
+                ("likes_received_count", models.PositiveIntegerField(default=0)),
+            ],
+        ),
+        migrations.RunPython(populate_user_stats, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,21 @@
+# Generated by Django 4.1.13 on 2026-10-17 02:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0004_userstats"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="friendship",
+            index=models.Index(fields=["follower", "created_at"], name="follower_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="friendship",
+            index=models.Index(fields=["following", "created_at"], name="following_created_idx"),
+        ),
+    ]
@@ -0,0 +1,33 @@
+# Generated by Django 4.1.13 on 2026-10-17 02:30
+
+from django.db import migrations, models
+from django.db.models import Count
+
+
+def populate_likes_count(apps, schema_editor):
+    Like = apps.get_model("tweets", "Like")
+    UserStats = apps.get_model("accounts", "UserStats")
+    for user_id, likes_count in Like.objects.values("user").annotate(n=Count("pk")).values_list("user", "n"):
+        UserStats.objects.filter(user_id=user_id).update(likes_count=likes_count)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0005_friendship_indexes"),
+        ("tweets", "0005_tweet_like_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="userstats",
+            name="likes_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.AddField(
+            model_name="userstats",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+        migrations.RunPython(populate_likes_count, migrations.RunPython.noop),
+    ]
@@ -0,0 +1,44 @@
+# Generated by Django 4.1.13 on 2026-10-17 03:13
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0006_userstats_likes_count_updated_at"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="FollowRecommendation",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("score", models.FloatField()),
+                (
+                    "candidate",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="+", to=settings.AUTH_USER_MODEL
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="recommendations",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="followrecommendation",
+            index=models.Index(fields=["user", "-score", "candidate"], name="recommendation_user_score_idx"),
+        ),
+        migrations.AddConstraint(
+            model_name="followrecommendation",
+            constraint=models.UniqueConstraint(fields=("user", "candidate"), name="unique_recommendation"),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.1.13 on 2026-10-17 03:45
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("accounts", "0007_followrecommendation"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="AccountDeletion",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("username", models.CharField(max_length=150)),
+                (
+                    "stage",
+                    models.CharField(
+                        choices=[
+                            ("hide_tweets", "hide_tweets"),
+                            ("tweets", "tweets"),
+                            ("likes", "likes"),
+                            ("following", "following"),
+                            ("followers", "followers"),
+                            ("other", "other"),
+                            ("user", "user"),
+                            ("done", "done"),
+                        ],
+                        default="hide_tweets",
+                        max_length=20,
+                    ),
+                ),
+                ("batch_size", models.PositiveIntegerField()),
+                ("rows_deleted", models.PositiveBigIntegerField(default=0)),
+                ("requested_at", models.DateTimeField(auto_now_add=True)),
+                ("updated_at", models.DateTimeField(auto_now=True)),
+                ("completed_at", models.DateTimeField(blank=True, null=True)),
+                (
+                    "user",
+                    models.OneToOneField(
+                        null=True,
+                        on_delete=django.db.models.deletion.SET_NULL,
+                        related_name="deletion",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+    ]
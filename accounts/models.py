@@ -13,3 +13,48 @@ class FriendShip(models.Model):
 
     class Meta:
         constraints = [models.UniqueConstraint(fields=["follower", "following"], name="unique_friendship")]
+        indexes = [
+            models.Index(fields=["follower", "created_at"], name="follower_created_idx"),
+            models.Index(fields=["following", "created_at"], name="following_created_idx"),
+        ]
+
+
+class UserStats(models.Model):
+    """Counters shown on a user's profile, kept in sync by accounts.services.add_user_stats."""
+
+    user = models.OneToOneField(User, on_delete=models.CASCADE, primary_key=True, related_name="stats")
+    followers_count = models.PositiveIntegerField(default=0)
+    following_count = models.PositiveIntegerField(default=0)
+    tweets_count = models.PositiveIntegerField(default=0)
+    likes_received_count = models.PositiveIntegerField(default=0)
+    likes_count = models.PositiveIntegerField(default=0)
+    # Bumped by every counter change, so it doubles as a version of everything shown about the user.
+    updated_at = models.DateTimeField(auto_now=True)
+
+
+class FollowRecommendation(models.Model):
+    """A user ``user`` may want to follow, precomputed by accounts.recommendations."""
+
+    user = models.ForeignKey(User, on_delete=models.CASCADE, related_name="recommendations")
+    candidate = models.ForeignKey(User, on_delete=models.CASCADE, related_name="+")
+    score = models.FloatField()
+
+    class Meta:
+        constraints = [models.UniqueConstraint(fields=["user", "candidate"], name="unique_recommendation")]
+        indexes = [models.Index(fields=["user", "-score", "candidate"], name="recommendation_user_score_idx")]
+
+
+class AccountDeletion(models.Model):
+    """Progress of deleting an account in batches, advanced by accounts.deletion."""
+
+    STAGES = ["hide_tweets", "tweets", "likes", "following", "followers", "other", "user", "done"]
+
+    # Set to NULL when the user row itself is finally deleted, so the record of the deletion remains.
+    user = models.OneToOneField(User, on_delete=models.SET_NULL, null=True, related_name="deletion")
+    username = models.CharField(max_length=150)
+    stage = models.CharField(max_length=20, choices=[(stage, stage) for stage in STAGES], default=STAGES[0])
+    batch_size = models.PositiveIntegerField()
+    rows_deleted = models.PositiveBigIntegerField(default=0)
+    requested_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    completed_at = models.DateTimeField(null=True, blank=True)
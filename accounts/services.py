@@ -0,0 +1,172 @@
+from django.conf import settings
+from django.db import connection, transaction
+from django.db.models import F, Q, Value
+from django.db.models.constants import OnConflict
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from mysite.pagination import KeysetPaginator
+from tweets.timeline import backfill_timeline, prune_timeline
+
+from .models import FriendShip, User, UserStats
+from .recommendations import record_follows, record_unfollows
+
+
+def add_user_stats(user_id, **deltas):
+    """
+    Apply counter ``deltas`` (e.g. ``followers_count=1``) to the stats of ``user_id``.
+
+    Must run inside the transaction that changed the counted rows, so counters and data commit together.
+    ``updated_at`` is bumped even when all deltas are zero, because the change may still show on the profile.
+    """
+    bulk_add_user_stats([user_id], **deltas)
+
+
+def bulk_add_user_stats(user_ids, **deltas):
+    """Apply the same counter ``deltas`` to the stats of every user in ``user_ids`` with one UPDATE."""
+    user_ids = set(user_ids)
+    updates = {field: Greatest(F(field) + delta, Value(0)) for field, delta in deltas.items() if delta}
+    updates["updated_at"] = timezone.now()
+    updated = UserStats.objects.filter(user_id__in=user_ids).update(**updates)
+    if updated < len(user_ids):
+        missing = user_ids
+        if updated:
+            missing = user_ids.difference(
+                UserStats.objects.filter(user_id__in=user_ids).values_list("user_id", flat=True)
+            )
+        UserStats.objects.bulk_create([UserStats(user_id=user_id) for user_id in missing], ignore_conflicts=True)
+        UserStats.objects.filter(user_id__in=missing).update(**updates)
+
+
+def get_user_stats(user):
+    try:
+        return user.stats
+    except UserStats.DoesNotExist:
+        return UserStats(user=user)
+
+
+def get_stats_versions(user_ids):
+    """Return ``{user id: UserStats.updated_at}`` for the users in ``user_ids`` that have stats."""
+    return dict(UserStats.objects.filter(user_id__in=user_ids).values_list("user_id", "updated_at"))
+
+
+def follow_list_page(user, listed, before=None, after=None):
+    """
+    Return a page of the FriendShip rows of the accounts ``user`` follows (``listed="following"``) or of its
+    followers (``listed="follower"``), most recent follow first, with the listed user selected.
+
+    The page is read from following_created_idx or follower_created_idx with a keyset condition, so it costs
+    the same however many followers the user has and however far the reader has scrolled.
+    """
+    owner = {"following": "follower", "follower": "following"}[listed]
+    paginator = KeysetPaginator(settings.ACCOUNTS_FOLLOW_LIST_PAGE_SIZE, fields=("created_at", "id"))
+    queryset = FriendShip.objects.filter(**{owner: user}).select_related(listed)
+    return paginator.paginate(queryset, before=before, after=after)
+
+
+def get_relationships(viewer, user_ids):
+    """Return ``(ids viewer follows, ids following viewer)`` among ``user_ids``, read with one query."""
+    following, followers = set(), set()
+    if not user_ids:
+        return following, followers
+    for follower_id, following_id in FriendShip.objects.filter(
+        Q(follower=viewer, following_id__in=user_ids) | Q(following=viewer, follower_id__in=user_ids)
+    ).values_list("follower_id", "following_id"):
+        if follower_id == viewer.pk:
+            following.add(following_id)
+        if following_id == viewer.pk:
+            followers.add(follower_id)
+    return following, followers
+
+
+def _write_follows(follower, user_ids, sql, params):
+    """
+    Run ``sql``, one INSERT or DELETE of ``follower``'s follows of ``user_ids``, and return the ids of the users
+    whose follow it wrote. The ids come from RETURNING where the database supports it, and otherwise from
+    reading the follows before and after in the same transaction.
+    """
+    with connection.cursor() as cursor:
+        if connection.features.can_return_columns_from_insert:
+            cursor.execute(f"{sql} RETURNING {connection.ops.quote_name('following_id')}", params)
+            return sorted(row[0] for row in cursor.fetchall())
+        follows = FriendShip.objects.filter(follower=follower, following_id__in=user_ids)
+        before = set(follows.values_list("following_id", flat=True))
+        cursor.execute(sql, params)
+        return sorted(before.symmetric_difference(follows.values_list("following_id", flat=True)))
+
+
+def follow_many(follower, user_ids):
+    """
+    Make ``follower`` follow every user in ``user_ids`` and return the ids of the users newly followed.
+
+    The follows are written by a single INSERT ... SELECT that skips ids of users that do not exist or are
+    inactive, such as accounts being deleted, and follows that already exist, so concurrent requests cannot
+    race into unique_friendship.
+    """
+    user_ids = sorted(set(user_ids) - {follower.pk})
+    if not user_ids:
+        return []
+    qn = connection.ops.quote_name
+    sql = (
+        f"{connection.ops.insert_statement(on_conflict=OnConflict.IGNORE)} {qn(FriendShip._meta.db_table)} "
+        f"({qn('follower_id')}, {qn('following_id')}, {qn('created_at')}) "
+        f"SELECT %s, {qn('id')}, %s FROM {qn(User._meta.db_table)} "
+        f"WHERE {qn('is_active')} AND {qn('id')} IN ({', '.join(['%s'] * len(user_ids))}) "
+        f"{connection.ops.on_conflict_suffix_sql([], OnConflict.IGNORE, None, None)}"
+    )
+    created_at = FriendShip._meta.get_field("created_at").get_db_prep_save(timezone.now(), connection)
+    with transaction.atomic():
+        followed = _write_follows(follower, user_ids, sql.rstrip(), [follower.pk, created_at, *user_ids])
+        if followed:
+            add_user_stats(follower.pk, following_count=len(followed))
+            bulk_add_user_stats(followed, followers_count=1)
+            backfill_timeline(follower, followed)
+            record_follows(follower.pk, followed)
+    return followed
+
+
+def unfollow_many(follower, user_ids):
+    """Make ``follower`` stop following every user in ``user_ids`` with a single DELETE. Return the ids unfollowed."""
+    user_ids = sorted(set(user_ids))
+    if not user_ids:
+        return []
+    qn = connection.ops.quote_name
+    sql = (
+        f"DELETE FROM {qn(FriendShip._meta.db_table)} "
+        f"WHERE {qn('follower_id')} = %s AND {qn('following_id')} IN ({', '.join(['%s'] * len(user_ids))})"
+    )
+    with transaction.atomic():
+        unfollowed = _write_follows(follower, user_ids, sql, [follower.pk, *user_ids])
+        if unfollowed:
+            add_user_stats(follower.pk, following_count=-len(unfollowed))
+            bulk_add_user_stats(unfollowed, followers_count=-1)
+            prune_timeline(follower, unfollowed)
+            record_unfollows(follower.pk, unfollowed)
+    return unfollowed
+
+
+def follow(follower, following):
+    """Make ``follower`` follow ``following``. Return False if they already did."""
+    return bool(follow_many(follower, [following.pk]))
+
+
+def unfollow(follower, following):
+    """Make ``follower`` stop following ``following``. Return False if they did not follow them."""
+    return bool(unfollow_many(follower, [following.pk]))
+
+
+def get_follow_counts(follower, user_id):
+    """
+    Return ``(following count of follower, followers count of user_id)`` read with one query, or None if
+    ``user_id`` does not exist or is inactive.
+    """
+    users = User.objects.filter(Q(pk=follower.pk) | Q(pk=user_id, is_active=True))
+    counts = {
+        pk: (following_count or 0, followers_count or 0)
+        for pk, following_count, followers_count in users.values_list(
+            "pk", "stats__following_count", "stats__followers_count"
+        )
+    }
+    if user_id not in counts:
+        return None
+    return counts.get(follower.pk, (0, 0))[0], counts[user_id][1]
@@ -0,0 +1,18 @@
+from django.db.models.signals import post_delete, post_save
+from django.dispatch import receiver
+
+from .identity import forget_users
+from .models import User, UserStats
+
+
+@receiver(post_save, sender=User)
+def create_user_stats(sender, instance, created, raw, **kwargs):
+    """Give every new user a stats row, so counter updates never have to create it on a hot path."""
+    if created and not raw:
+        UserStats.objects.bulk_create([UserStats(user=instance)], ignore_conflicts=True)
+
+
+@receiver(post_save, sender=User)
+@receiver(post_delete, sender=User)
+def forget_cached_user(sender, instance, **kwargs):
+    forget_users([instance])
@@ -1,10 +1,33 @@
+import json
+import threading
+from io import StringIO
+from unittest import mock
+from urllib.parse import urlencode
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth import SESSION_KEY, get_user_model
-from django.test import TestCase
+from django.contrib.auth.hashers import PBKDF2PasswordHasher
+from django.core.cache import cache
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.test import TestCase, override_settings
 from django.urls import reverse
 
-from tweets.models import Tweet
+from mysite.testing import QueryBudgetTestMixin, QueryPlanTestMixin
+from tweets.models import Like, Mention, TimelineEntry, Tweet
+from tweets.services import like_tweet, publish_tweet
 
-from .models import FriendShip
+from . import deletion, recommendations
+from . import urls as accounts_urls
+from .backends import CachedModelBackend
+from .checks import check_user_cache_backend
+from .deletion import request_account_deletion, run_account_deletion
+from .forms import RESERVED_USERNAMES
+from .identity import get_cached_user, get_cached_user_by_username, get_user_cache_stats, reset_user_cache_stats
+from .models import AccountDeletion, FollowRecommendation, FriendShip, UserStats
+from .recommendations import FollowGraph, rebuild_recommendations, recommendations_for
+from .services import follow, follow_many, unfollow, unfollow_many
 
 User = get_user_model()
 
@@ -36,6 +59,19 @@ class TestSignUpView(TestCase):
         self.assertTrue(User.objects.filter(username=valid_data["username"]).exists())
         self.assertIn(SESSION_KEY, self.client.session)
 
+    def test_hashes_password_once(self):
+        data = {
+            "username": "testuser",
+            "email": "test@test.com",
+            "password1": "testpassword",
+            "password2": "testpassword",
+        }
+        spy = mock.patch.object(PBKDF2PasswordHasher, "encode", autospec=True, side_effect=PBKDF2PasswordHasher.encode)
+        with spy as encode:
+            self.client.post(self.url, data)
+        self.assertEqual(encode.call_count, 1)
+        self.assertIn(SESSION_KEY, self.client.session)
+
     def test_failure_post_with_empty_form(self):
         data = {
             "username": "",
@@ -120,6 +156,25 @@ class TestSignUpView(TestCase):
         self.assertFalse(form.is_valid())
         self.assertEqual(form.errors["username"], ["同じユーザー名が既に登録済みです。"])
 
+    def test_failure_post_with_reserved_username(self):
+        data = {
+            "username": "delete",
+            "email": "tests4@icloud.com",
+            "password1": "QaZ105edc",
+            "password2": "QaZ105edc",
+        }
+        response = self.client.post(self.url, data)
+        form = response.context["form"]
+
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(User.objects.filter(username=data["username"]).exists())
+        self.assertEqual(form.errors["username"], ["このユーザー名は使用できません。"])
+
+    def test_reserved_usernames_cover_static_routes(self):
+        routes = [str(pattern.pattern) for pattern in accounts_urls.urlpatterns]
+        shadowing = routes[: routes.index("<str:username>/")]
+        self.assertEqual({route.split("/")[0] for route in shadowing}, RESERVED_USERNAMES)
+
     def test_failure_post_with_invalid_email(self):
         data = {
             "username": "ashizawa",
@@ -287,6 +342,53 @@ class TestUserProfileView(TestCase):
         context = response.context
         self.assertQuerysetEqual(context["tweet_list"], Tweet.objects.filter(user=self.user))
 
+    def test_counts_come_from_user_stats(self):
+        other = User.objects.create_user(username="other", password="testpassword")
+        follow(other, self.user)
+        follow(self.user, other)
+        UserStats.objects.filter(user=self.user).update(tweets_count=3, likes_received_count=7)
+        response = self.client.get(self.url)
+        self.assertEqual(response.context["follower"], 1)
+        self.assertEqual(response.context["following"], 1)
+        self.assertContains(response, "ツイート:3")
+        self.assertContains(response, "いいねされた数:7")
+
+
+@override_settings(ACCOUNTS_USER_CACHE_TIMEOUT=300)
+class TestUserProfileConditionalGet(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.other = User.objects.create_user(username="other", password="testpassword")
+        self.tweet = Tweet.objects.create(user=self.other, content="test")
+        publish_tweet(self.tweet)
+        self.client.force_login(self.user)
+        self.url = reverse("accounts:user_profile", kwargs={"username": "other"})
+
+    def test_not_modified(self):
+        # The first response sets the CSRF cookie for the follow form, which is part of the ETag.
+        self.client.get(self.url)
+        etag = self.client.get(self.url)["ETag"]
+        # Session and both users' stats; both users come from the user cache.
+        with self.assertNumQueries(2):
+            response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+
+    def test_modified_after_follow_and_like(self):
+        self.client.get(self.url)
+        etag = self.client.get(self.url)["ETag"]
+        follow(self.user, self.other)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context["is_following"])
+        like_tweet(self.user, self.tweet)
+        response = self.client.get(self.url, HTTP_IF_NONE_MATCH=response["ETag"])
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.context["liked_list"], {self.tweet.pk})
+
+    def test_not_exist_user(self):
+        response = self.client.get(reverse("accounts:user_profile", kwargs={"username": "nobody"}))
+        self.assertEqual(response.status_code, 404)
+
 
 class TestUserProfileEditView(TestCase):
     def test_success_get(self):
@@ -332,6 +434,22 @@ class TestFollowView(TestCase):
         self.assertEqual(self.user.following.count(), 0)
         self.assertEqual(self.user.following.first(), None)
 
+    def test_success_post_updates_stats(self):
+        self.client.post(reverse("accounts:follow", kwargs={"username": self.targetuser.username}))
+        self.assertEqual(UserStats.objects.get(user=self.user).following_count, 1)
+        self.assertEqual(UserStats.objects.get(user=self.targetuser).followers_count, 1)
+
+    def test_failure_post_with_already_following(self):
+        follow(self.user, self.targetuser)
+        response = self.client.post(reverse("accounts:follow", kwargs={"username": self.targetuser.username}))
+        self.assertEqual(response.status_code, 400)
+        self.assertEqual(UserStats.objects.get(user=self.targetuser).followers_count, 1)
+
+    def test_success_post_backfills_timeline(self):
+        tweet = Tweet.objects.create(user=self.targetuser, content="backfilled")
+        self.client.post(reverse("accounts:follow", kwargs={"username": self.targetuser.username}))
+        self.assertTrue(TimelineEntry.objects.filter(owner=self.user, tweet=tweet).exists())
+
     def test_failure_post_with_not_exist_user(self):
         response = self.client.post(
             reverse(
@@ -361,7 +479,7 @@ class TestUnfollowView(TestCase):
         self.user1 = User.objects.create_user(username="testuser1", password="testpassword")
         self.user2 = User.objects.create_user(username="testuser2", password="testpassword")
         self.client.login(username="testuser1", password="testpassword")
-        FriendShip.objects.create(follower=self.user1, following=self.user2)
+        follow(self.user1, self.user2)
 
     def test_success_post(self):
         response = self.client.post(reverse("accounts:unfollow", kwargs={"username": self.user2.username}))
@@ -373,6 +491,17 @@ class TestUnfollowView(TestCase):
         )
         self.assertFalse(FriendShip.objects.filter(follower=self.user2, following=self.user1).exists())
 
+    def test_success_post_updates_stats(self):
+        self.client.post(reverse("accounts:unfollow", kwargs={"username": self.user2.username}))
+        self.assertEqual(UserStats.objects.get(user=self.user1).following_count, 0)
+        self.assertEqual(UserStats.objects.get(user=self.user2).followers_count, 0)
+
+    def test_success_post_prunes_timeline(self):
+        tweet = Tweet.objects.create(user=self.user2, content="pruned")
+        TimelineEntry.objects.create(owner=self.user1, tweet=tweet, author=self.user2, created_at=tweet.created_at)
+        self.client.post(reverse("accounts:unfollow", kwargs={"username": self.user2.username}))
+        self.assertFalse(TimelineEntry.objects.filter(owner=self.user1).exists())
+
     def test_failure_post_with_not_exist_user(self):
         response = self.client.post(reverse("accounts:unfollow", kwargs={"username": "not_exist_user.username"}))
         self.assertEqual(response.status_code, 404)
@@ -384,6 +513,139 @@ class TestUnfollowView(TestCase):
         self.assertEqual(FriendShip.objects.count(), 1)
 
 
+class TestAsyncFollowViews(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.target = User.objects.create_user(username="target", password="testpassword")
+        self.async_client.force_login(self.user)
+
+    async def test_follow_and_unfollow(self):
+        response = await self.async_client.post(reverse("accounts:follow_async", kwargs={"username": "target"}))
+        self.assertRedirects(response, reverse("tweets:home"), fetch_redirect_response=False)
+        self.assertTrue(await FriendShip.objects.filter(follower=self.user, following=self.target).aexists())
+        response = await self.async_client.post(reverse("accounts:follow_async", kwargs={"username": "target"}))
+        self.assertEqual(response.status_code, 400)
+        await self.async_client.post(reverse("accounts:unfollow_async", kwargs={"username": "target"}))
+        self.assertFalse(await FriendShip.objects.aexists())
+
+    async def test_failure_post_with_self_or_not_exist_user(self):
+        response = await self.async_client.post(reverse("accounts:follow_async", kwargs={"username": "testuser"}))
+        self.assertEqual(response.status_code, 400)
+        response = await self.async_client.post(reverse("accounts:follow_async", kwargs={"username": "nobody"}))
+        self.assertEqual(response.status_code, 404)
+
+
+class TestFollowApi(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.others = [User.objects.create_user(username=f"user{i}", password="testpassword") for i in range(3)]
+        self.tweets = [Tweet.objects.create(user=other, content="test") for other in self.others]
+        self.client.force_login(self.user)
+
+    def test_follow_and_unfollow(self):
+        url = reverse("accounts:follow_api", kwargs={"user_id": self.others[0].pk})
+        data = self.client.post(url).json()
+        self.assertEqual((data["changed"], data["following_count"], data["followers_count"]), (True, 1, 1))
+        self.assertTrue(TimelineEntry.objects.filter(owner=self.user, tweet=self.tweets[0]).exists())
+        # Following again is a no-op rather than an IntegrityError.
+        data = self.client.post(url).json()
+        self.assertEqual((data["changed"], data["following_count"], data["followers_count"]), (False, 1, 1))
+        data = self.client.delete(url).json()
+        self.assertEqual((data["is_following"], data["changed"], data["followers_count"]), (False, True, 0))
+        self.assertFalse(FriendShip.objects.exists())
+        self.assertFalse(self.client.delete(url).json()["changed"])
+
+    def test_failure_with_self_or_not_exist_user(self):
+        response = self.client.post(reverse("accounts:follow_api", kwargs={"user_id": self.user.pk}))
+        self.assertEqual(response.status_code, 400)
+        response = self.client.post(reverse("accounts:follow_api", kwargs={"user_id": 0}))
+        self.assertEqual(response.status_code, 404)
+        self.assertFalse(FriendShip.objects.exists())
+
+    def test_failure_with_inactive_user(self):
+        request_account_deletion(self.others[0])
+        response = self.client.post(reverse("accounts:follow_api", kwargs={"user_id": self.others[0].pk}))
+        self.assertEqual(response.status_code, 404)
+        body = json.dumps({"follow": [self.others[0].pk, self.others[1].pk]})
+        data = self.client.post(reverse("accounts:follow_batch"), body, content_type="application/json").json()
+        self.assertEqual(data["followed"], [self.others[1].pk])
+        self.assertEqual(list(self.user.follower.values_list("following_id", flat=True)), [self.others[1].pk])
+        self.assertEqual(UserStats.objects.get(user=self.user).following_count, 1)
+
+    def test_batch(self):
+        follow(self.user, self.others[2])
+        ids = [other.pk for other in self.others]
+        body = json.dumps({"follow": [ids[0], ids[1], 0, self.user.pk], "unfollow": [ids[2]]})
+        data = self.client.post(reverse("accounts:follow_batch"), body, content_type="application/json").json()
+        self.assertEqual(data, {"followed": ids[:2], "unfollowed": [ids[2]], "following_count": 2})
+        self.assertEqual(set(self.user.follower.values_list("following_id", flat=True)), set(ids[:2]))
+        self.assertEqual(
+            set(TimelineEntry.objects.filter(owner=self.user).values_list("tweet_id", flat=True)),
+            {self.tweets[0].pk, self.tweets[1].pk},
+        )
+        self.assertEqual(UserStats.objects.get(user=self.others[1]).followers_count, 1)
+        self.assertEqual(UserStats.objects.get(user=self.others[2]).followers_count, 0)
+
+    def test_batch_failure_with_invalid_body(self):
+        invalid = ["not json", [1], {"follow": ["a"]}, {"follow": [1], "unfollow": [1]}, {"follow": list(range(101))}]
+        for body in invalid:
+            with self.subTest(body=body):
+                response = self.client.post(
+                    reverse("accounts:follow_batch"), json.dumps(body), content_type="application/json"
+                )
+                self.assertEqual(response.status_code, 400)
+
+    def test_without_returning(self):
+        ids = [other.pk for other in self.others]
+        follow(self.user, self.others[0])
+        with mock.patch.object(connection.features, "can_return_columns_from_insert", False):
+            self.assertEqual(follow_many(self.user, ids), ids[1:])
+            self.assertEqual(unfollow_many(self.user, [ids[0], 0]), ids[:1])
+        self.assertEqual(UserStats.objects.get(user=self.user).following_count, 2)
+
+
+class TestAsyncSignUpView(TestCase):
+    def setUp(self):
+        self.url = reverse("accounts:signup_async")
+
+    def post(self, **data):
+        body = {
+            "username": "testuser",
+            "email": "test@test.com",
+            "password1": "testpassword",
+            "password2": "testpassword",
+            **data,
+        }
+        return self.async_client.post(self.url, urlencode(body), content_type="application/x-www-form-urlencoded")
+
+    async def test_success_get(self):
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, "accounts/signup.html")
+
+    async def test_success_get_with_session(self):
+        user = await sync_to_async(User.objects.create_user)(username="other", password="testpassword")
+        await sync_to_async(self.async_client.force_login)(user)
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTrue(response.context["user"].is_authenticated)
+        response = await self.post(password2="otherpassword")
+        self.assertEqual(response.status_code, 200)
+
+    async def test_success_post(self):
+        response = await self.post()
+        self.assertRedirects(response, reverse("tweets:home"), fetch_redirect_response=False)
+        user = await User.objects.aget(username="testuser")
+        self.assertTrue(await sync_to_async(user.check_password)("testpassword"))
+        self.assertEqual(await sync_to_async(lambda: self.async_client.session[SESSION_KEY])(), str(user.pk))
+
+    async def test_failure_post_with_mismatched_passwords(self):
+        response = await self.post(password2="otherpassword")
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("password2", response.context["form"].errors)
+        self.assertFalse(await User.objects.aexists())
+
+
 class TestFollowingListView(TestCase):
     def test_success_get(self):
         self.user = User.objects.create_user(username="testuser", password="testpassword")
@@ -398,3 +660,500 @@ class TestFollowerListView(TestCase):
         self.client.login(username="testuser", password="testpassword")
         response = self.client.get(reverse("accounts:follower_list", kwargs={"username": self.user.username}))
         self.assertEqual(response.status_code, 200)
+
+
+@override_settings(ACCOUNTS_FOLLOW_LIST_PAGE_SIZE=2, ACCOUNTS_USER_CACHE_TIMEOUT=300)
+class TestFollowLists(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.viewer = User.objects.create_user(username="viewer", password="testpassword")
+        self.others = [User.objects.create_user(username=f"user{i}", password="testpassword") for i in range(3)]
+        for other in self.others:
+            follow(other, self.user)
+        follow(self.viewer, self.others[2])
+        follow(self.others[1], self.viewer)
+        self.client.force_login(self.viewer)
+
+    def test_paginates_newest_first(self):
+        url = reverse("accounts:follower_list", kwargs={"username": self.user.username})
+        response = self.client.get(url)
+        self.assertEqual([row.follower for row in response.context["follower_list"]], self.others[:0:-1])
+        older = self.client.get(url, {"before": response.context["page"].older_cursor})
+        self.assertEqual([row.follower for row in older.context["follower_list"]], self.others[:1])
+        self.assertFalse(older.context["page"].has_older)
+
+    def test_shows_relationships_to_viewer(self):
+        response = self.client.get(reverse("accounts:follower_list", kwargs={"username": self.user.username}))
+        self.assertEqual(response.context["following_ids"], {self.others[2].pk})
+        self.assertEqual(response.context["follower_ids"], {self.others[1].pk})
+        self.assertContains(response, "フォロー中")
+        self.assertContains(response, "フォローされています")
+
+    def test_json(self):
+        url = reverse("accounts:follower_list_json", kwargs={"username": self.user.username})
+        data = self.client.get(url).json()
+        self.assertEqual(
+            [(user["username"], user["is_following"], user["follows_you"]) for user in data["users"]],
+            [("user2", True, False), ("user1", False, True)],
+        )
+        data = self.client.get(url, {"before": data["older_cursor"]}).json()
+        self.assertEqual([user["username"] for user in data["users"]], ["user0"])
+        self.assertIsNone(data["older_cursor"])
+        following = self.client.get(reverse("accounts:following_list_json", kwargs={"username": "viewer"})).json()
+        self.assertEqual([user["username"] for user in following["users"]], ["user2"])
+
+    def test_query_count_does_not_grow_with_followers(self):
+        url = reverse("accounts:follower_list", kwargs={"username": self.user.username})
+        self.client.get(url)
+        with self.assertNumQueries(3):
+            self.client.get(url)
+        for i in range(20):
+            follow(User.objects.create_user(username=f"more{i}", password="testpassword"), self.user)
+        with self.assertNumQueries(3):
+            self.client.get(url)
+
+    def test_failure_with_invalid_cursor(self):
+        url = reverse("accounts:following_list_json", kwargs={"username": self.user.username})
+        self.assertEqual(self.client.get(url, {"before": "invalid"}).status_code, 400)
+
+
+@override_settings(ACCOUNTS_USER_CACHE_TIMEOUT=300)
+class TestUserCache(TestCase):
+    def setUp(self):
+        cache.clear()
+        reset_user_cache_stats()
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+
+    def test_hits_skip_the_database(self):
+        self.assertEqual(get_cached_user_by_username("testuser"), self.user)
+        with self.assertNumQueries(0):
+            self.assertEqual(get_cached_user_by_username("testuser"), self.user)
+            self.assertEqual(get_cached_user(self.user.pk), self.user)
+        self.assertEqual(get_user_cache_stats(), {"hits": 2, "misses": 1})
+
+    def test_unknown_users(self):
+        self.assertIsNone(get_cached_user_by_username("nobody"))
+        self.assertIsNone(get_cached_user(self.user.pk + 1))
+
+    def test_invalidated_on_save_and_delete(self):
+        get_cached_user_by_username("testuser")
+        self.user.username = "renamed"
+        self.user.save()
+        self.assertIsNone(get_cached_user_by_username("testuser"))
+        self.assertEqual(get_cached_user(self.user.pk).username, "renamed")
+        self.user.delete()
+        self.assertIsNone(get_cached_user_by_username("renamed"))
+
+    def test_session_user(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse("accounts:user_profile", kwargs={"username": "testuser"}))
+        with self.assertNumQueries(0):
+            self.assertEqual(CachedModelBackend().get_user(self.user.pk), self.user)
+        self.user.is_active = False
+        self.user.save()
+        self.assertIsNone(CachedModelBackend().get_user(self.user.pk))
+
+    @override_settings(ACCOUNTS_USER_CACHE_TIMEOUT=0)
+    def test_disabled(self):
+        get_cached_user_by_username("testuser")
+        with self.assertNumQueries(1):
+            get_cached_user_by_username("testuser")
+        self.assertEqual(get_user_cache_stats(), {"hits": 0, "misses": 0})
+
+    def test_warns_with_per_process_cache(self):
+        self.assertEqual([warning.id for warning in check_user_cache_backend(None)], ["accounts.W001"])
+        with override_settings(CACHES={"default": {"BACKEND": "django.core.cache.backends.redis.RedisCache"}}):
+            self.assertEqual(check_user_cache_backend(None), [])
+
+
+class TestVerifyUserStatsCommand(TestCase):
+    def setUp(self):
+        self.user1 = User.objects.create_user(username="testuser1", password="testpassword")
+        self.user2 = User.objects.create_user(username="testuser2", password="testpassword")
+        FriendShip.objects.create(follower=self.user1, following=self.user2)
+        tweet = Tweet.objects.create(user=self.user2, content="test")
+        Like.objects.create(user=self.user1, tweet=tweet)
+
+    def test_detects_drift(self):
+        with self.assertRaises(CommandError):
+            call_command("verify_user_stats", stdout=StringIO())
+
+    def test_repairs_drift(self):
+        call_command("verify_user_stats", "--repair", stdout=StringIO())
+        stats = UserStats.objects.get(user=self.user2)
+        self.assertEqual(
+            (stats.followers_count, stats.following_count, stats.tweets_count, stats.likes_received_count),
+            (1, 0, 1, 1),
+        )
+        self.assertEqual(UserStats.objects.get(user=self.user1).following_count, 1)
+        call_command("verify_user_stats", stdout=StringIO())
+
+
+class TestExportView(TestCase):
+    def setUp(self):
+        self.url = reverse("accounts:export")
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.other = User.objects.create_user(username="other", password="testpassword")
+        self.tweets = [Tweet.objects.create(user=self.user, content=f"test {i}") for i in range(3)]
+        like_tweet(self.user, Tweet.objects.create(user=self.other, content="other"))
+        follow(self.user, self.other)
+        follow(self.other, self.user)
+        self.client.force_login(self.user)
+
+    def get_rows(self, **params):
+        response = self.client.get(self.url, params)
+        self.assertEqual(response.status_code, 200)
+        return [json.loads(line) for line in b"".join(response.streaming_content).decode().splitlines()]
+
+    def test_success_jsonl(self):
+        rows = self.get_rows()
+        self.assertEqual([row["type"] for row in rows], ["tweet", "tweet", "tweet", "like", "following", "follower"])
+        self.assertEqual(rows[0]["content"], "test 0")
+        self.assertEqual(rows[3]["username"], "other")
+        self.assertEqual(rows[4]["username"], "other")
+
+    def test_success_csv(self):
+        response = self.client.get(self.url, {"format": "csv"})
+        self.assertEqual(response["Content-Type"], "text/csv; charset=utf-8")
+        lines = b"".join(response.streaming_content).decode().splitlines()
+        self.assertEqual(lines[0], "cursor,type,id,created_at,content,like_count,tweet_id,username")
+        self.assertEqual(len(lines), 7)
+
+    def test_resume_from_cursor(self):
+        rows = self.get_rows()
+        resumed = self.get_rows(cursor=rows[1]["cursor"])
+        self.assertEqual(resumed, rows[2:])
+
+    def test_does_not_export_other_users(self):
+        self.assertNotIn("other", [row.get("content") for row in self.get_rows()])
+
+    def test_failure_with_invalid_params(self):
+        for params in [{"format": "xml"}, {"cursor": "retweets:1"}, {"cursor": "tweets:x"}]:
+            with self.subTest(params=params):
+                self.assertEqual(self.client.get(self.url, params).status_code, 400)
+
+    @override_settings(ACCOUNTS_EXPORT_CHUNK_SIZE=4)
+    async def test_pages_under_asgi(self):
+        await sync_to_async(self.async_client.force_login)(self.user)
+        pages, cursor = [], None
+        while True:
+            response = await self.async_client.get(self.url, {"cursor": cursor} if cursor else {})
+            self.assertEqual(response.status_code, 200)
+            self.assertFalse(response.streaming)
+            pages.append([json.loads(line) for line in response.content.decode().splitlines()])
+            cursor = response.get("X-Export-Next-Cursor")
+            if cursor is None:
+                break
+        self.assertEqual([len(page) for page in pages], [4, 2])
+        self.assertEqual(pages[0] + pages[1], await sync_to_async(self.get_rows)())
+
+    def test_command(self):
+        out = StringIO()
+        call_command("export_user_data", "testuser", "--chunk-size", "2", stdout=out)
+        self.assertEqual([json.loads(line) for line in out.getvalue().splitlines()], self.get_rows())
+        with self.assertRaises(CommandError):
+            call_command("export_user_data", "nobody", stdout=StringIO())
+
+
+class TestRecommendations(TestCase):
+    def setUp(self):
+        self.users = {name: User.objects.create_user(username=name, password="testpassword") for name in "abcdef"}
+        for follower, following in ["ab", "ac", "bd", "cd", "ce", "ea", "df"]:
+            FriendShip.objects.create(follower=self.users[follower], following=self.users[following])
+
+    def stored(self, name):
+        return [(r.candidate.username, r.score) for r in recommendations_for(self.users[name])]
+
+    def expected(self, name):
+        graph = FollowGraph.load()
+        index = list(graph.user_ids).index(self.users[name].pk)
+        usernames = dict(User.objects.values_list("pk", "username"))
+        return [(usernames[pk], score) for pk, score in graph.recommend(index, 20, 2.0)]
+
+    def test_rebuild(self):
+        self.assertEqual(rebuild_recommendations(batch_size=2), FollowRecommendation.objects.count())
+        # b and c follow d, and e follows a without being followed back.
+        self.assertEqual(self.stored("a"), [("e", 3.0), ("d", 2.0)])
+        # a follows b without being followed back, d follows f.
+        self.assertEqual(self.stored("b"), [("a", 2.0), ("f", 1.0)])
+
+    def test_pure_python_matches_numpy(self):
+        if recommendations.np is None:
+            self.skipTest("NumPy is not installed.")
+        graph = FollowGraph.load()
+        with mock.patch.object(recommendations, "np", None):
+            fallback = FollowGraph.load()
+            expected = [fallback.recommend(i, 20, 2.0) for i in range(len(fallback))]
+        self.assertEqual([graph.recommend(i, 20, 2.0) for i in range(len(graph))], expected)
+
+    def test_follow_and_unfollow_update_incrementally(self):
+        rebuild_recommendations()
+        before = {name: self.stored(name) for name in "ad"}
+        follow(self.users["a"], self.users["d"])
+        for name in "ad":
+            with self.subTest(name=name):
+                self.assertEqual(self.stored(name), self.expected(name))
+        self.assertEqual(self.stored("a"), [("e", 3.0), ("f", 1.0)])
+        unfollow(self.users["a"], self.users["d"])
+        self.assertEqual(self.stored("a"), [("e", 3.0)])
+        self.assertEqual(self.stored("d"), before["d"])
+
+    def test_view(self):
+        rebuild_recommendations()
+        self.client.force_login(self.users["a"])
+        response = self.client.get(reverse("accounts:recommendations"))
+        self.assertEqual([r.candidate.username for r in response.context["recommendation_list"]], ["e", "d"])
+        self.assertContains(response, reverse("accounts:follow", kwargs={"username": "e"}))
+
+    def test_command(self):
+        out = StringIO()
+        call_command("rebuild_recommendations", "--batch-size", "2", stdout=out)
+        self.assertIn("Stored 11 recommendations.", out.getvalue())
+
+
+class TestAccountDeletion(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.others = [User.objects.create_user(username=f"user{i}", password="testpassword") for i in range(3)]
+        for other in self.others:
+            follow(self.user, other)
+            follow(other, self.user)
+            for i in range(2):
+                like_tweet(other, self.publish(self.user, f"@user0 test {i}"))
+            like_tweet(self.user, self.publish(other, "@testuser test"))
+        rebuild_recommendations()
+        self.client.force_login(self.user)
+
+    def publish(self, user, content):
+        tweet = Tweet.objects.create(user=user, content=content)
+        publish_tweet(tweet)
+        return tweet
+
+    def assertAccountDeleted(self):
+        self.assertFalse(User.objects.filter(username="testuser").exists())
+        self.assertFalse(Tweet.all_objects.filter(user_id=self.user.pk).exists())
+        self.assertFalse(Like.objects.filter(user_id=self.user.pk).exists())
+        self.assertFalse(TimelineEntry.objects.filter(author_id=self.user.pk).exists())
+        self.assertFalse(Mention.objects.filter(user_id=self.user.pk).exists())
+        self.assertFalse(FollowRecommendation.objects.filter(candidate_id=self.user.pk).exists())
+        self.assertEqual(FriendShip.objects.count(), 0)
+        # Followers, followings, likes and likes received of the other users were all adjusted.
+        call_command("verify_user_stats", stdout=StringIO())
+
+    def test_hiding_tweets_changes_followers_home_version(self):
+        self.client.force_login(self.others[0])
+        etag = self.client.get(reverse("tweets:home"))["ETag"]
+        job = request_account_deletion(self.user)
+        run_account_deletion(job, max_batches=1)
+        response = self.client.get(reverse("tweets:home"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertNotContains(response, "@user0 test")
+
+    def test_request_deactivates_at_once(self):
+        response = self.client.post(reverse("accounts:delete"))
+        self.assertRedirects(response, reverse("accounts:login"))
+        self.assertNotIn(SESSION_KEY, self.client.session)
+        self.assertFalse(User.objects.get(pk=self.user.pk).is_active)
+        self.assertEqual(AccountDeletion.objects.get().stage, "hide_tweets")
+        self.client.force_login(self.others[0])
+        response = self.client.get(reverse("accounts:user_profile", kwargs={"username": "testuser"}))
+        self.assertEqual(response.status_code, 404)
+
+    def test_get_asks_for_confirmation(self):
+        response = self.client.get(reverse("accounts:delete"))
+        self.assertTemplateUsed(response, "accounts/delete.html")
+        self.assertTrue(User.objects.get(pk=self.user.pk).is_active)
+
+    def test_deletes_everything(self):
+        job = request_account_deletion(self.user)
+        self.assertTrue(run_account_deletion(job))
+        self.assertAccountDeleted()
+        job.refresh_from_db()
+        self.assertEqual((job.user, job.username, job.stage), (None, "testuser", "done"))
+        self.assertIsNotNone(job.completed_at)
+        self.assertGreater(job.rows_deleted, 0)
+
+    @override_settings(ACCOUNTS_DELETION={**settings.ACCOUNTS_DELETION, "BATCH_SIZE": 1, "MAX_BATCH_SIZE": 1})
+    def test_resumes_in_batches(self):
+        request_account_deletion(self.user)
+        stages = []
+        while True:
+            # Each run reloads the job, as after a restart.
+            job = AccountDeletion.objects.get()
+            stages.append(job.stage)
+            if run_account_deletion(job, max_batches=1):
+                break
+            if job.stage != "hide_tweets":
+                # Tweets stay hidden while they are being deleted.
+                self.assertFalse(Tweet.objects.filter(user_id=self.user.pk).exists())
+        self.assertEqual(list(dict.fromkeys(stages)), AccountDeletion.STAGES[:-1])
+        self.assertGreater(len(stages), 20)
+        self.assertAccountDeleted()
+
+    def test_adapts_batch_size_to_lock_time(self):
+        job = request_account_deletion(self.user)
+        with mock.patch.object(deletion.time, "perf_counter", side_effect=[0, 1, 0, 0]):
+            run_account_deletion(job, max_batches=1)
+            self.assertEqual(job.batch_size, 250)
+            run_account_deletion(job, max_batches=1)
+            self.assertEqual(job.batch_size, 500)
+
+    def test_purge_leaves_account_deletions_alone(self):
+        request_account_deletion(self.user)
+        run_account_deletion(AccountDeletion.objects.get(), max_batches=1)
+        self.assertFalse(Tweet.objects.filter(user=self.user).exists())
+        call_command("purge_deleted_tweets", stdout=StringIO())
+        self.assertEqual(Tweet.all_objects.filter(user=self.user).count(), 6)
+
+    def test_command(self):
+        out = StringIO()
+        call_command("delete_accounts", "testuser", "--max-batches", "1", stdout=out)
+        self.assertIn("Deleted 0 account(s), 1 still pending.", out.getvalue())
+        out = StringIO()
+        call_command("delete_accounts", stdout=out)
+        self.assertIn("Deleted 1 account(s), 0 still pending.", out.getvalue())
+        self.assertAccountDeleted()
+        with self.assertRaises(CommandError):
+            call_command("delete_accounts", "nobody", stdout=StringIO())
+
+    def test_wakes_worker_on_commit(self):
+        worker = mock.Mock()
+        with mock.patch.object(deletion, "get_deletion_worker", return_value=worker):
+            with self.captureOnCommitCallbacks(execute=True):
+                request_account_deletion(self.user)
+        worker.wake.assert_called_once_with()
+
+    def test_worker(self):
+        ran = threading.Event()
+        with mock.patch.object(deletion, "run_pending_account_deletions", side_effect=ran.set):
+            worker = deletion.get_deletion_worker()
+            try:
+                worker.wake()
+                self.assertTrue(ran.wait(5))
+            finally:
+                deletion.stop_deletion_worker()
+        self.assertIsNone(deletion._worker._instance)
+
+
+class TestQueryBudgets(QueryBudgetTestMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.target = User.objects.create_user(username="target", password="testpassword")
+        for i in range(5):
+            other = User.objects.create_user(username=f"user{i}", password="testpassword")
+            follow(self.user, other)
+            follow(other, self.user)
+            follow(self.target, other)
+            for _ in range(3):
+                tweet = Tweet.objects.create(user=self.user, content="test")
+                publish_tweet(tweet)
+                like_tweet(other, tweet)
+        self.client.force_login(self.user)
+        self.async_client.force_login(self.user)
+
+    def test_pages(self):
+        for name in [
+            "accounts:user_profile",
+            "accounts:following_list",
+            "accounts:follower_list",
+            "accounts:following_list_json",
+            "accounts:follower_list_json",
+        ]:
+            with self.subTest(name=name):
+                response = self.client.get(reverse(name, kwargs={"username": "testuser"}))
+                self.assertEqual(response.status_code, 200)
+                self.assertWithinQueryBudget(response)
+
+    def test_export(self):
+        response = self.client.get(reverse("accounts:export"))
+        self.assertEqual(response.status_code, 200)
+        self.assertWithinQueryBudget(response)
+
+    def test_recommendations(self):
+        rebuild_recommendations()
+        response = self.client.get(reverse("accounts:recommendations"))
+        self.assertEqual(response.status_code, 200)
+        self.assertWithinQueryBudget(response)
+
+    def test_follow_api(self):
+        url = reverse("accounts:follow_api", kwargs={"user_id": self.target.pk})
+        for response in [self.client.post(url), self.client.delete(url)]:
+            self.assertEqual(response.status_code, 200)
+            self.assertWithinQueryBudget(response)
+
+    def test_follow_batch(self):
+        others = list(User.objects.exclude(pk=self.user.pk).values_list("pk", flat=True))
+        for body in [{"unfollow": others}, {"follow": others}]:
+            response = self.client.post(reverse("accounts:follow_batch"), body, content_type="application/json")
+            self.assertEqual(response.status_code, 200)
+            self.assertWithinQueryBudget(response)
+
+    def test_follow_and_unfollow(self):
+        for name in ["accounts:follow", "accounts:unfollow"]:
+            with self.subTest(name=name):
+                response = self.client.post(reverse(name, kwargs={"username": "target"}))
+                self.assertEqual(response.status_code, 302)
+                self.assertWithinQueryBudget(response)
+
+    def test_delete(self):
+        response = self.client.get(reverse("accounts:delete"))
+        self.assertEqual(response.status_code, 200)
+        self.assertWithinQueryBudget(response)
+        response = self.client.post(reverse("accounts:delete"))
+        self.assertEqual(response.status_code, 302)
+        self.assertWithinQueryBudget(response)
+
+    async def test_async_follow_and_unfollow(self):
+        for name in ["accounts:follow_async", "accounts:unfollow_async"]:
+            response = await self.async_client.post(reverse(name, kwargs={"username": "target"}))
+            self.assertEqual(response.status_code, 302)
+            self.assertWithinQueryBudget(response)
+
+
+class TestQueryPlans(QueryPlanTestMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.other = User.objects.create_user(username="other", password="testpassword")
+        follow(self.user, self.other)
+        follow(self.other, self.user)
+        publish_tweet(Tweet.objects.create(user=self.other, content="test"))
+        self.client.force_login(self.user)
+
+    def test_profile(self):
+        with self.assertUsesIndexes():
+            self.client.get(reverse("accounts:user_profile", kwargs={"username": self.other.username}))
+
+    def test_following_and_follower_lists(self):
+        with self.assertUsesIndexes():
+            self.client.get(reverse("accounts:following_list", kwargs={"username": self.other.username}))
+            self.client.get(reverse("accounts:follower_list", kwargs={"username": self.other.username}))
+
+    def test_follow_list_pages(self):
+        follow(User.objects.create_user(username="third", password="testpassword"), self.other)
+        url = reverse("accounts:follower_list_json", kwargs={"username": self.other.username})
+        with override_settings(ACCOUNTS_FOLLOW_LIST_PAGE_SIZE=1):
+            cursor = self.client.get(url).json()["older_cursor"]
+            with self.assertUsesIndexes():
+                self.client.get(url, {"before": cursor})
+                self.client.get(url, {"after": cursor})
+
+    def test_export(self):
+        with self.assertUsesIndexes():
+            b"".join(self.client.get(reverse("accounts:export")).streaming_content)
+
+    def test_recommendations(self):
+        rebuild_recommendations()
+        with self.assertUsesIndexes():
+            self.client.get(reverse("accounts:recommendations"))
+
+    def test_follow_and_unfollow(self):
+        with self.assertUsesIndexes():
+            self.client.post(reverse("accounts:unfollow", kwargs={"username": self.other.username}))
+            self.client.post(reverse("accounts:follow", kwargs={"username": self.other.username}))
+
+    def test_account_deletion(self):
+        like_tweet(self.user, Tweet.objects.get())
+        rebuild_recommendations()
+        job = request_account_deletion(self.other)
+        with self.assertUsesIndexes():
+            run_account_deletion(job)
@@ -7,6 +7,7 @@ app_name = "accounts"
 urlpatterns = [
     # path('', views.WelcomeView.as_view(), name='welcome'),
     path("signup/", views.SignUpView.as_view(), name="signup"),
+    path("signup/async/", views.AsyncSignUpView.as_view(), name="signup_async"),
     path(
         "login/",
         LoginView.as_view(template_name="accounts/login.html"),
@@ -14,6 +15,11 @@ urlpatterns = [
     ),
     path("logout/", LogoutView.as_view(), name="logout"),
     # path('', include('django.contrib.auth.urls')),
+    path("export/", views.ExportView.as_view(), name="export"),
+    path("delete/", views.AccountDeleteView.as_view(), name="delete"),
+    path("recommendations/", views.RecommendationsView.as_view(), name="recommendations"),
+    path("follows/", views.FollowBatchView.as_view(), name="follow_batch"),
+    path("follows/<int:user_id>/", views.FollowApiView.as_view(), name="follow_api"),
     path("<str:username>/", views.UserProfileView.as_view(), name="user_profile"),
     # path('profile/edit/', views.UserProfileEditView.as_view(), name='user_profile_edit'),
     path(
@@ -26,6 +32,10 @@ urlpatterns = [
         views.FollowerListView.as_view(),
         name="follower_list",
     ),
+    path("<str:username>/following_list/json/", views.FollowingListJsonView.as_view(), name="following_list_json"),
+    path("<str:username>/follower_list/json/", views.FollowerListJsonView.as_view(), name="follower_list_json"),
     path("<str:username>/follow/", views.FollowView.as_view(), name="follow"),
     path("<str:username>/unfollow/", views.UnFollowView.as_view(), name="unfollow"),
+    path("<str:username>/follow/async/", views.AsyncFollowView.as_view(), name="follow_async"),
+    path("<str:username>/unfollow/async/", views.AsyncUnFollowView.as_view(), name="unfollow_async"),
 ]
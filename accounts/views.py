@@ -1,17 +1,54 @@
-from django.contrib.auth import authenticate, get_user_model, login
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth import get_user_model, login, logout
 from django.contrib.auth.mixins import LoginRequiredMixin
-from django.http import HttpResponseBadRequest
-from django.shortcuts import get_object_or_404
-from django.urls import reverse_lazy
-from django.views import generic
+from django.core.handlers.asgi import ASGIRequest
+from django.db import transaction
+from django.http import Http404, HttpResponse, HttpResponseBadRequest, JsonResponse, StreamingHttpResponse
+from django.shortcuts import redirect, render
+from django.urls import reverse, reverse_lazy
+from django.views import View, generic
 
-from tweets.models import Like, Tweet
+from mysite.middleware import unbudgeted
+from mysite.mixins import AsyncLoginRequiredMixin, ConditionalGetMixin
+from tweets.buffer import pending_likes_version
+from tweets.models import Tweet
+from tweets.services import add_pending_like_counts, liked_tweet_ids
 
+from .deletion import request_account_deletion
+from .export import EXPORT_FORMATS, export_page, export_rows, parse_cursor, render_export
 from .forms import SignUpForm
+from .hashing import make_password_async
+from .identity import get_cached_user_by_username
 from .models import FriendShip
+from .recommendations import recommendations_for
+from .services import (
+    follow,
+    follow_list_page,
+    follow_many,
+    get_follow_counts,
+    get_relationships,
+    get_stats_versions,
+    get_user_stats,
+    unfollow,
+    unfollow_many,
+)
 
 User = get_user_model()
 
+MAX_FOLLOW_BATCH_SIZE = 100
+
+
+def get_user_or_404(username):
+    """Return the active user named ``username`` from the user cache, or raise Http404."""
+    user = get_cached_user_by_username(username)
+    # Accounts being deleted are deactivated first and disappear at once.
+    if user is None or not user.is_active:
+        raise Http404
+    return user
+
 
 class SignUpView(generic.CreateView):
     form_class = SignUpForm
@@ -20,73 +57,308 @@ class SignUpView(generic.CreateView):
 
     def form_valid(self, form):
         response = super().form_valid(form)
-        username = form.cleaned_data["username"]
-        password = form.cleaned_data["password1"]
-        user = authenticate(self.request, username=username, password=password)
-        login(self.request, user)
+        # Saving the form hashed the password; authenticate() would only hash it again to compare.
+        login(self.request, self.object, backend=settings.AUTHENTICATION_BACKENDS[0])
         return response
 
 
-class UserProfileView(LoginRequiredMixin, generic.DetailView):
-    model = User
+class AsyncSignUpView(View):
+    """SignUpView for ASGI. The password is hashed in the hashing pool instead of blocking the event loop."""
+
+    template_name = "accounts/signup.html"
+
+    async def get(self, request, *args, **kwargs):
+        return await self.render(request, SignUpForm())
+
+    async def post(self, request, *args, **kwargs):
+        form = SignUpForm(request.POST)
+        if not await sync_to_async(form.is_valid)():
+            return await self.render(request, form)
+        # Validation filled in the user without hashing; form.save() would hash on this thread.
+        user = form.instance
+        user.password = await make_password_async(form.cleaned_data["password1"])
+        await sync_to_async(user.save)()
+        await sync_to_async(login)(request, user, backend=settings.AUTHENTICATION_BACKENDS[0])
+        return redirect(SignUpView.success_url)
+
+    async def render(self, request, form):
+        # The template reads request.user, which loads the session and the user from the database.
+        return await sync_to_async(render)(request, self.template_name, {"form": form})
+
+
+class UserProfileView(LoginRequiredMixin, ConditionalGetMixin, generic.DetailView):
     template_name = "accounts/profile.html"
-    slug_field = "username"
-    slug_url_kwarg = "username"
+    query_budget = 9
+
+    def get_object(self, queryset=None):
+        return get_user_or_404(self.kwargs["username"])
+
+    def get_validators(self):
+        user = get_cached_user_by_username(self.kwargs["username"])
+        if user is None or not user.is_active:
+            return None, None
+        # Tweets, follows and likes of either user all bump their stats.
+        stats = get_stats_versions({user.pk, self.request.user.pk})
+        return (sorted(stats.items()), pending_likes_version()), max(stats.values(), default=None)
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
         user = self.object
-        context["tweet_list"] = Tweet.objects.select_related("user").filter(user=user)
+        context["tweet_list"] = tweet_list = list(
+            Tweet.objects.select_related("user").filter(user=user).order_by("-created_at", "-id")
+        )
         context["is_following"] = FriendShip.objects.filter(follower=self.request.user, following=user).exists()
-        context["following"] = FriendShip.objects.filter(follower=user).count()
-        context["follower"] = FriendShip.objects.filter(following=user).count()
-        context["liked_list"] = Like.objects.filter(user=self.request.user).values_list("tweet", flat=True)
+        context["stats"] = stats = get_user_stats(user)
+        context["following"] = stats.following_count
+        context["follower"] = stats.followers_count
+        add_pending_like_counts(tweet_list)
+        context["liked_list"] = liked_tweet_ids(self.request.user, [tweet.id for tweet in tweet_list])
         return context
 
 
 class FollowView(LoginRequiredMixin, generic.RedirectView):
     url = reverse_lazy("tweets:home")
     http_method_names = ["post"]
+    query_budget = 22
 
     def post(self, request, *args, **kwargs):
         follower = self.request.user
         if self.kwargs["username"] == request.user.username:
             return HttpResponseBadRequest("自分をフォローすることはできません。")
-        following = get_object_or_404(User, username=self.kwargs["username"])
-        if FriendShip.objects.filter(following=following, follower=follower).exists():
+        following = get_user_or_404(self.kwargs["username"])
+        if not follow(follower, following):
             return HttpResponseBadRequest("すでにフォローしています。")
-        FriendShip.objects.create(follower=follower, following=following)
         return super().post(request, *args, **kwargs)
 
 
 class UnFollowView(LoginRequiredMixin, generic.RedirectView):
     url = reverse_lazy("tweets:home")
     http_method_names = ["post"]
+    query_budget = 16
 
     def post(self, request, *args, **kwargs):
         follower = self.request.user
         if self.kwargs["username"] == request.user.username:
             return HttpResponseBadRequest("自分にリクエストできません。")
-        following = get_object_or_404(User, username=self.kwargs["username"])
-        FriendShip.objects.filter(follower=follower, following=following).delete()
+        following = get_user_or_404(self.kwargs["username"])
+        unfollow(follower, following)
         return super().post(request, *args, **kwargs)
 
 
-class FollowingListView(LoginRequiredMixin, generic.ListView):
-    model = FriendShip
-    template_name = "accounts/following_list.html"
-    context_object_name = "following_list"
+class AsyncFollowView(AsyncLoginRequiredMixin, View):
+    query_budget = 22
+
+    async def post(self, request, *args, **kwargs):
+        if kwargs["username"] == request.user.username:
+            return HttpResponseBadRequest("自分をフォローすることはできません。")
+        following = await sync_to_async(get_user_or_404)(kwargs["username"])
+        if not await sync_to_async(follow)(request.user, following):
+            return HttpResponseBadRequest("すでにフォローしています。")
+        return redirect("tweets:home")
+
+
+class AsyncUnFollowView(AsyncLoginRequiredMixin, View):
+    query_budget = 16
+
+    async def post(self, request, *args, **kwargs):
+        if kwargs["username"] == request.user.username:
+            return HttpResponseBadRequest("自分にリクエストできません。")
+        following = await sync_to_async(get_user_or_404)(kwargs["username"])
+        await sync_to_async(unfollow)(request.user, following)
+        return redirect("tweets:home")
+
+
+class FollowApiView(LoginRequiredMixin, View):
+    """Follow (POST) or unfollow (DELETE) the user ``user_id`` and return the updated counts as JSON."""
+
+    http_method_names = ["post", "delete"]
+    query_budget = 20
+
+    def post(self, request, *args, **kwargs):
+        if kwargs["user_id"] == request.user.pk:
+            return HttpResponseBadRequest("自分をフォローすることはできません。")
+        return self.apply(follow_many, is_following=True)
+
+    def delete(self, request, *args, **kwargs):
+        if kwargs["user_id"] == request.user.pk:
+            return HttpResponseBadRequest("自分にリクエストできません。")
+        return self.apply(unfollow_many, is_following=False)
+
+    def apply(self, write, is_following):
+        user_id = self.kwargs["user_id"]
+        changed = bool(write(self.request.user, [user_id]))
+        counts = get_follow_counts(self.request.user, user_id)
+        if counts is None:
+            raise Http404
+        following_count, followers_count = counts
+        context = {
+            "user_id": user_id,
+            "is_following": is_following,
+            "changed": changed,
+            "following_count": following_count,
+            "followers_count": followers_count,
+        }
+        return JsonResponse(context)
+
+
+class FollowBatchView(LoginRequiredMixin, View):
+    """Follow and unfollow many users at once from ``{"follow": [user ids], "unfollow": [user ids]}``."""
+
+    query_budget = 24
+
+    def post(self, request, *args, **kwargs):
+        try:
+            data = json.loads(request.body)
+            follow_ids, unfollow_ids = data.get("follow", []), data.get("unfollow", [])
+            for user_id in [*follow_ids, *unfollow_ids]:
+                if not isinstance(user_id, int) or isinstance(user_id, bool):
+                    raise TypeError
+        except (ValueError, TypeError, AttributeError):
+            return HttpResponseBadRequest("リクエストの形式が正しくありません。")
+        if len(follow_ids) + len(unfollow_ids) > MAX_FOLLOW_BATCH_SIZE:
+            return HttpResponseBadRequest(f"一度に変更できるフォローは{MAX_FOLLOW_BATCH_SIZE}件までです。")
+        if set(follow_ids) & set(unfollow_ids):
+            return HttpResponseBadRequest("同じユーザーをフォローとフォロー解除の両方に指定することはできません。")
+        with transaction.atomic():
+            followed = follow_many(request.user, follow_ids)
+            unfollowed = unfollow_many(request.user, unfollow_ids)
+        following_count, _ = get_follow_counts(request.user, request.user.pk)
+        return JsonResponse({"followed": followed, "unfollowed": unfollowed, "following_count": following_count})
+
+
+class FollowListMixin:
+    """A keyset-paginated list of the accounts a user follows or of its followers, as set by ``listed``."""
+
+    listed = None
+
+    def get_follow_list(self):
+        """Return the page and ``(ids the viewer follows, ids following the viewer)`` among its users."""
+        user = get_user_or_404(self.kwargs["username"])
+        page = follow_list_page(
+            user, self.listed, before=self.request.GET.get("before"), after=self.request.GET.get("after")
+        )
+        return page, get_relationships(self.request.user, [getattr(row, f"{self.listed}_id") for row in page])
+
+    def get_follow_list_json(self):
+        page, (following_ids, follower_ids) = self.get_follow_list()
+        users = []
+        for row in page:
+            listed = getattr(row, self.listed)
+            users.append(
+                {
+                    "username": listed.username,
+                    "url": reverse("accounts:user_profile", kwargs={"username": listed.username}),
+                    "followed_at": row.created_at.isoformat(),
+                    "is_following": listed.pk in following_ids,
+                    "follows_you": listed.pk in follower_ids,
+                }
+            )
+        return {"users": users, "older_cursor": page.older_cursor, "newer_cursor": page.newer_cursor}
+
+
+class FollowListView(LoginRequiredMixin, FollowListMixin, generic.ListView):
+    query_budget = 5
 
     def get_queryset(self):
-        user = get_object_or_404(User, username=self.kwargs["username"])
-        return FriendShip.objects.select_related("following").filter(follower=user).order_by("-created_at")
+        self.page, self.relationships = self.get_follow_list()
+        return self.page.object_list
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["page"] = self.page
+        context["following_ids"], context["follower_ids"] = self.relationships
+        return context
+
+
+class FollowListJsonView(LoginRequiredMixin, FollowListMixin, View):
+    query_budget = 5
 
+    def get(self, request, *args, **kwargs):
+        return JsonResponse(self.get_follow_list_json())
 
-class FollowerListView(LoginRequiredMixin, generic.ListView):
-    model = FriendShip
+
+class FollowingListView(FollowListView):
+    template_name = "accounts/following_list.html"
+    context_object_name = "following_list"
+    listed = "following"
+
+
+class FollowerListView(FollowListView):
     template_name = "accounts/follower_list.html"
     context_object_name = "follower_list"
+    listed = "follower"
+
+
+class FollowingListJsonView(FollowListJsonView):
+    listed = "following"
+
+
+class FollowerListJsonView(FollowListJsonView):
+    listed = "follower"
+
+
+class RecommendationsView(LoginRequiredMixin, generic.ListView):
+    template_name = "accounts/recommendations.html"
+    context_object_name = "recommendation_list"
+    query_budget = 3
 
     def get_queryset(self):
-        user = get_object_or_404(User, username=self.kwargs["username"])
-        return FriendShip.objects.select_related("follower").filter(following=user).order_by("-created_at")
+        return recommendations_for(self.request.user)
+
+
+class ExportView(LoginRequiredMixin, View):
+    """
+    Stream the logged-in user's tweets, likes and follow graph as JSON Lines or CSV.
+
+    Rows are read while the response is sent, after the middleware has counted the queries, so the budget
+    only covers the request itself. Pass the ``cursor`` of the last row received to resume an interrupted export.
+
+    Under ASGI, Django 4.1 iterates streaming responses on the event loop, where the ORM cannot run. There the
+    export is served in pages of ACCOUNTS_EXPORT_CHUNK_SIZE rows read by the view, and ``X-Export-Next-Cursor``
+    carries the cursor of the next page until the last one.
+    """
+
+    query_budget = 2
+
+    def get(self, request, *args, **kwargs):
+        export_format = request.GET.get("format", "jsonl")
+        if export_format not in EXPORT_FORMATS:
+            return HttpResponseBadRequest("エクスポート形式が正しくありません。")
+        cursor = request.GET.get("cursor")
+        if cursor:
+            try:
+                parse_cursor(cursor)
+            except ValueError:
+                return HttpResponseBadRequest("カーソルが正しくありません。")
+        content_type = f"{EXPORT_FORMATS[export_format]}; charset=utf-8"
+        if isinstance(request, ASGIRequest):
+            with unbudgeted():
+                rows, next_cursor = export_page(request.user, cursor)
+            response = HttpResponse(render_export(rows, export_format, resume=bool(cursor)), content_type=content_type)
+            if next_cursor is not None:
+                response["X-Export-Next-Cursor"] = next_cursor
+        else:
+            response = StreamingHttpResponse(
+                render_export(export_rows(request.user, cursor), export_format, resume=bool(cursor)),
+                content_type=content_type,
+            )
+        response["Content-Disposition"] = f'attachment; filename="{request.user.username}.{export_format}"'
+        return response
+
+
+class AccountDeleteView(LoginRequiredMixin, View):
+    """
+    Confirm (GET) and request (POST) the deletion of the logged-in user's account. The account is deactivated
+    and logged out at once, and its rows are deleted in the background by accounts.deletion.
+    """
+
+    template_name = "accounts/delete.html"
+    query_budget = 12
+
+    def get(self, request, *args, **kwargs):
+        return render(request, self.template_name)
+
+    def post(self, request, *args, **kwargs):
+        request_account_deletion(request.user)
+        logout(request)
+        return redirect("accounts:login")
@@ -0,0 +1,130 @@
+import heapq
+import itertools
+import random
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.hashers import make_password
+from django.db import transaction
+
+from accounts.identity import forget_users
+from accounts.models import FriendShip, UserStats
+from tweets.models import Like, TimelineEntry, Tweet
+
+User = get_user_model()
+
+PASSWORD = "benchpassword"
+
+
+def zipf_weights(n, exponent=1.0):
+    """Return cumulative weights of a Zipf distribution over ``n`` ranks, for ``random.choices``."""
+    total = 0.0
+    cumulative = []
+    for rank in range(1, n + 1):
+        total += 1 / rank**exponent
+        cumulative.append(total)
+    return cumulative
+
+
+def generate_dataset(users, tweets, likes, avg_following=20, prefix="seed", seed=0, batch_size=5000):
+    """
+    Fill the database with a synthetic social graph and return how many rows of each kind were created.
+
+    Follow targets and tweet authors are drawn from a Zipf distribution over users, and the number of accounts
+    each user follows from a Pareto distribution with mean ``avg_following``, so a few users get most of the
+    followers and post most of the tweets. Likes are likewise concentrated on a few tweets. Every row is
+    written with ``bulk_create``, all users share one pre-hashed password, and derived data (like counts,
+    UserStats and timelines) is computed rather than maintained row by row.
+    """
+    rng = random.Random(seed)
+    with transaction.atomic():
+        password = make_password(PASSWORD)
+        User.objects.bulk_create(
+            [User(username=f"{prefix}{i}", password=password) for i in range(users)], batch_size=batch_size
+        )
+        seeded = User.objects.filter(username__startswith=prefix)
+        user_ids = list(seeded.order_by("pk").values_list("pk", flat=True))
+        # bulk_create sends no post_save, so nothing else evicts users cached under reused ids.
+        forget_users(seeded.only("pk", "username"))
+        # Rank users randomly so popularity does not follow primary keys.
+        ranked = user_ids[:]
+        rng.shuffle(ranked)
+        popularity = zipf_weights(len(ranked))
+
+        follows = set()
+        for follower_id in user_ids:
+            count = min(int(rng.paretovariate(2) * avg_following / 2), len(user_ids) - 1)
+            for following_id in rng.choices(ranked, cum_weights=popularity, k=count):
+                if following_id != follower_id:
+                    follows.add((follower_id, following_id))
+        FriendShip.objects.bulk_create(
+            [FriendShip(follower_id=follower, following_id=following) for follower, following in follows],
+            batch_size=batch_size,
+        )
+
+        authors = rng.choices(ranked, cum_weights=popularity, k=tweets)
+        Tweet.objects.bulk_create(
+            [Tweet(user_id=author, content=f"ツイート {i}") for i, author in enumerate(authors)], batch_size=batch_size
+        )
+        tweet_rows = list(Tweet.objects.filter(user__in=seeded).values_list("pk", "user_id", "created_at"))
+        tweet_authors = {pk: user_id for pk, user_id, _ in tweet_rows}
+        tweet_ids = list(tweet_authors)
+        rng.shuffle(tweet_ids)
+        like_pairs = set()
+        if tweet_ids:
+            for tweet_id in rng.choices(tweet_ids, cum_weights=zipf_weights(len(tweet_ids)), k=likes):
+                like_pairs.add((rng.choice(user_ids), tweet_id))
+        Like.objects.bulk_create(
+            [Like(user_id=user_id, tweet_id=tweet_id) for user_id, tweet_id in like_pairs], batch_size=batch_size
+        )
+
+        like_counts = Counter(tweet_id for _, tweet_id in like_pairs)
+        Tweet.objects.bulk_update(
+            [Tweet(pk=pk, like_count=count) for pk, count in like_counts.items()],
+            ["like_count"],
+            batch_size=batch_size,
+        )
+        followers = Counter(following for _, following in follows)
+        following = Counter(follower for follower, _ in follows)
+        tweet_counts = Counter(authors)
+        likes_received = Counter(tweet_authors[tweet_id] for _, tweet_id in like_pairs)
+        likes_given = Counter(user_id for user_id, _ in like_pairs)
+        UserStats.objects.bulk_create(
+            [
+                UserStats(
+                    user_id=pk,
+                    followers_count=followers[pk],
+                    following_count=following[pk],
+                    tweets_count=tweet_counts[pk],
+                    likes_received_count=likes_received[pk],
+                    likes_count=likes_given[pk],
+                )
+                for pk in user_ids
+            ],
+            batch_size=batch_size,
+        )
+        entries = _timeline_entries(user_ids, follows, followers, tweet_rows)
+        while batch := list(itertools.islice(entries, batch_size)):
+            TimelineEntry.objects.bulk_create(batch)
+    return {"users": len(user_ids), "follows": len(follows), "tweets": len(tweet_ids), "likes": len(like_pairs)}
+
+
+def _timeline_entries(user_ids, follows, followers, tweet_rows):
+    """Yield the entries ``rebuild_timeline`` would create for every user, without querying per user."""
+    size = settings.TWEETS_TIMELINE_BACKFILL_SIZE
+    by_author = defaultdict(list)
+    for pk, author_id, created_at in tweet_rows:
+        by_author[author_id].append((created_at, pk, author_id))
+    for tweets in by_author.values():
+        tweets.sort(reverse=True)
+        del tweets[size:]
+    following = defaultdict(list)
+    for follower_id, following_id in follows:
+        if followers[following_id] < settings.TWEETS_FANOUT_MAX_FOLLOWERS:
+            following[follower_id].append(following_id)
+    for user_id in user_ids:
+        authors = [user_id, *following[user_id]]
+        merged = heapq.merge(*(by_author[author] for author in authors), reverse=True)
+        for created_at, tweet_id, author_id in itertools.islice(merged, size):
+            yield TimelineEntry(owner_id=user_id, tweet_id=tweet_id, author_id=author_id, created_at=created_at)
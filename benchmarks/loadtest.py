@@ -0,0 +1,250 @@
+import ipaddress
+import json
+import random
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+from urllib.error import HTTPError, URLError
+from urllib.parse import urlencode, urljoin, urlsplit
+from urllib.request import HTTPCookieProcessor, HTTPRedirectHandler, Request, build_opener
+
+from django.conf import settings
+from django.urls import reverse
+
+from .utils import summarize
+
+DEFAULT_MIX = {"home": 60, "home_json": 10, "like": 15, "create": 10, "follow": 5}
+
+
+def check_local_url(url):
+    """Raise ValueError unless ``url`` points at this machine, so the driver can never load a remote host."""
+    host = urlsplit(url).hostname
+    if host == "localhost":
+        return
+    try:
+        if ipaddress.ip_address(host).is_loopback:
+            return
+    except (TypeError, ValueError):
+        pass
+    raise ValueError(f"{url} is not a localhost URL.")
+
+
+def parse_mix(value):
+    """Parse ``"home=60,like=15"`` into ``{"home": 60, "like": 15}``."""
+    mix = {}
+    for part in value.split(","):
+        name, _, weight = part.partition("=")
+        if name not in OPERATIONS:
+            raise ValueError(f"Unknown operation {name!r}. Choose from {', '.join(OPERATIONS)}.")
+        mix[name] = int(weight)
+    return mix
+
+
+class _NoRedirect(HTTPRedirectHandler):
+    def redirect_request(self, req, fp, code, msg, headers, newurl):
+        return None
+
+
+class VirtualUser:
+    """One logged-in session against the server, with the state needed to pick sensible requests."""
+
+    def __init__(self, base_url, username, password, timeout=30):
+        self.base_url = base_url
+        self.username = username
+        self.password = password
+        self.timeout = timeout
+        self.cookies = CookieJar()
+        self.opener = build_opener(HTTPCookieProcessor(self.cookies), _NoRedirect)
+        self.tweet_ids = []
+        self.liked = set()
+        self.followed = set()
+
+    def csrf_token(self):
+        for cookie in self.cookies:
+            if cookie.name == settings.CSRF_COOKIE_NAME:
+                return cookie.value
+        return ""
+
+    def request(self, path, data=None):
+        """POST ``data`` if given, else GET, and return ``(status, seconds, body)``. Redirects are not followed."""
+        headers = {}
+        body = None
+        if data is not None:
+            body = urlencode(data).encode()
+            headers["X-CSRFToken"] = self.csrf_token()
+        request = Request(urljoin(self.base_url, path), data=body, headers=headers)
+        start = time.perf_counter()
+        try:
+            with self.opener.open(request, timeout=self.timeout) as response:
+                content = response.read()
+                status = response.status
+        except HTTPError as error:
+            content = error.read()
+            status = error.code
+        except (URLError, OSError):
+            content = b""
+            status = 0
+        return status, time.perf_counter() - start, content
+
+    def login(self):
+        self.request(reverse("accounts:login"))
+        status, _, _ = self.request(reverse("accounts:login"), {"username": self.username, "password": self.password})
+        if status != 302:
+            raise RuntimeError(f"Could not log in as {self.username} (HTTP {status}).")
+        self.refresh_tweets()
+
+    def refresh_tweets(self):
+        status, _, content = self.request(reverse("tweets:home_json"))
+        if status == 200:
+            tweets = json.loads(content)["tweets"]
+            self.tweet_ids = [tweet["id"] for tweet in tweets]
+            self.liked = {tweet["id"] for tweet in tweets if tweet["is_liked"]}
+
+
+def _home(user, rng, others):
+    return "tweets:home", user.request(reverse("tweets:home"))
+
+
+def _home_json(user, rng, others):
+    return "tweets:home_json", user.request(reverse("tweets:home_json"))
+
+
+def _like(user, rng, others):
+    if not user.tweet_ids:
+        return _home_json(user, rng, others)
+    tweet_id = rng.choice(user.tweet_ids)
+    name = "tweets:unlike" if tweet_id in user.liked else "tweets:like"
+    result = user.request(reverse(name, kwargs={"pk": tweet_id}), {})
+    if result[0] == 200:
+        user.liked ^= {tweet_id}
+    return name, result
+
+
+def _create(user, rng, others):
+    return "tweets:create", user.request(reverse("tweets:create"), {"content": f"負荷試験 {rng.random()}"})
+
+
+def _follow(user, rng, others):
+    username = rng.choice(others)
+    if username == user.username:
+        return _home(user, rng, others)
+    name = "accounts:unfollow" if username in user.followed else "accounts:follow"
+    result = user.request(reverse(name, kwargs={"username": username}), {})
+    if result[0] == 302:
+        user.followed ^= {username}
+    elif result[0] == 400 and name == "accounts:follow":
+        # Already followed in the dataset; unfollow next time.
+        user.followed.add(username)
+    return name, result
+
+
+OPERATIONS = {"home": _home, "home_json": _home_json, "like": _like, "create": _create, "follow": _follow}
+
+
+class LoadRecorder:
+    """
+    Thread-safe collection of latencies and errors per endpoint.
+
+    Server errors and failed connections count as errors. Other 4xx responses, such as following a user the
+    dataset already follows, are answered normally and only counted as ``rejected``.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.latencies = {}
+        self.errors = {}
+        self.rejected = {}
+
+    def record(self, endpoint, status, seconds):
+        with self._lock:
+            self.latencies.setdefault(endpoint, [])
+            self.errors.setdefault(endpoint, 0)
+            self.rejected.setdefault(endpoint, 0)
+            if status == 0 or status >= 500:
+                self.errors[endpoint] += 1
+                return
+            if status >= 400:
+                self.rejected[endpoint] += 1
+            self.latencies[endpoint].append(seconds)
+
+    def report(self, elapsed):
+        with self._lock:
+            endpoints = {
+                endpoint: summarize(self.latencies[endpoint], self.errors[endpoint], elapsed)
+                for endpoint in sorted(self.latencies)
+            }
+            for endpoint, summary in endpoints.items():
+                summary["rejected"] = self.rejected[endpoint]
+            total = summarize(
+                [latency for latencies in self.latencies.values() for latency in latencies],
+                sum(self.errors.values()),
+                elapsed,
+            )
+            total["rejected"] = sum(self.rejected.values())
+        for summary in [*endpoints.values(), total]:
+            summary["error_rate"] = round(summary["errors"] / summary["requests"], 4) if summary["requests"] else 0
+        return {"elapsed": round(elapsed, 2), "total": total, "endpoints": endpoints}
+
+
+class LoadTest:
+    """
+    Replay a weighted mix of operations as ``users`` against a server on localhost.
+
+    ``run_closed`` keeps ``concurrency`` users busy back to back, so throughput adapts to the server.
+    ``run_open`` starts requests at ``rate`` per second whatever the server does, and measures latency from the
+    scheduled start, so time spent queued behind a slow server is not hidden.
+    """
+
+    def __init__(self, users, mix, others, seed=None):
+        self.users = users
+        self.operations = [OPERATIONS[name] for name in mix]
+        self.weights = list(mix.values())
+        self.others = others
+        self.rng = random.Random(seed)
+        self.rng_lock = threading.Lock()
+        self.recorder = LoadRecorder()
+
+    def step(self, user, scheduled=None):
+        with self.rng_lock:
+            operation = self.rng.choices(self.operations, weights=self.weights)[0]
+            rng = random.Random(self.rng.random())
+        endpoint, (status, seconds, _) = operation(user, rng, self.others)
+        if scheduled is not None:
+            seconds = time.perf_counter() - scheduled
+        self.recorder.record(endpoint, status, seconds)
+
+    def run_closed(self, concurrency, duration=None, requests=None):
+        deadline = time.perf_counter() + duration if duration else None
+        remaining = [requests]
+        lock = threading.Lock()
+
+        def worker(index):
+            user = self.users[index % len(self.users)]
+            while deadline is None or time.perf_counter() < deadline:
+                if requests is not None:
+                    with lock:
+                        if remaining[0] <= 0:
+                            return
+                        remaining[0] -= 1
+                self.step(user)
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            list(executor.map(worker, range(concurrency)))
+        return self.recorder.report(time.perf_counter() - start)
+
+    def run_open(self, rate, duration, concurrency):
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            scheduled = start
+            i = 0
+            while scheduled < start + duration:
+                delay = scheduled - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+                executor.submit(self.step, self.users[i % len(self.users)], scheduled)
+                i += 1
+                with self.rng_lock:
+                    scheduled += self.rng.expovariate(rate)
+        return self.recorder.report(time.perf_counter() - start)
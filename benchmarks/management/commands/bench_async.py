@@ -0,0 +1,120 @@
+import asyncio
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+from django.urls import reverse
+
+from accounts.services import follow
+from benchmarks.utils import summarize, test_database, write_report
+from tweets.models import Tweet
+from tweets.services import publish_tweet
+
+User = get_user_model()
+
+SCENARIOS = {
+    "timeline": ("tweets:home_json", "tweets:home_json_async"),
+    "like": ("tweets:like", "tweets:like_async"),
+}
+
+
+class Command(BaseCommand):
+    help = "Compare the sync views under WSGI with their async counterparts under ASGI on a throwaway database."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--scenario", choices=SCENARIOS, default="timeline")
+        parser.add_argument("--requests", type=int, default=500, help="Requests sent to each stack.")
+        parser.add_argument("--concurrency", type=int, default=10)
+        parser.add_argument("--users", type=int, default=20)
+        parser.add_argument("--output", help="Write the results as JSON to this file.")
+
+    def handle(self, *args, **options):
+        with test_database():
+            users, tweets = self.seed(options["users"])
+            sync_name, async_name = SCENARIOS[options["scenario"]]
+            paths = [self.path(options["scenario"], sync_name, tweets, i) for i in range(options["requests"])]
+            async_paths = [self.path(options["scenario"], async_name, tweets, i) for i in range(options["requests"])]
+            report = {
+                "scenario": options["scenario"],
+                "concurrency": options["concurrency"],
+                "wsgi": self.run_wsgi(users, paths, options["concurrency"]),
+                "asgi": asyncio.run(self.run_asgi(users, async_paths, options["concurrency"])),
+            }
+        for stack in ("wsgi", "asgi"):
+            self.stdout.write(f"{stack}: " + ", ".join(f"{key}={value}" for key, value in report[stack].items()))
+        if options["output"]:
+            write_report(options["output"], report)
+
+    def seed(self, count):
+        users = [User.objects.create_user(username=f"bench{i}", password="benchpassword") for i in range(count)]
+        for user in users:
+            for other in users:
+                if other != user:
+                    follow(user, other)
+        tweets = []
+        for user in users:
+            tweet = Tweet.objects.create(user=user, content=f"{user.username} のツイート")
+            publish_tweet(tweet)
+            tweets.append(tweet)
+        return users, tweets
+
+    def path(self, scenario, name, tweets, i):
+        if scenario == "like":
+            return reverse(name, kwargs={"pk": tweets[i % len(tweets)].pk})
+        return reverse(name)
+
+    def send(self, client, path):
+        return client.post(path) if "like" in path else client.get(path)
+
+    def run_wsgi(self, users, paths, concurrency):
+        # Clients keep per-session state, so every thread gets its own.
+        clients = []
+        for i in range(concurrency):
+            client = Client(raise_request_exception=False)
+            client.force_login(users[i % len(users)])
+            clients.append(client)
+
+        def worker(i):
+            client = clients[i]
+            latencies, errors = [], 0
+            for j in range(i, len(paths), concurrency):
+                start = time.perf_counter()
+                response = self.send(client, paths[j])
+                if response.status_code == 200:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+            return latencies, errors
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            results = list(executor.map(worker, range(concurrency)))
+        elapsed = time.perf_counter() - start
+        return summarize(
+            [latency for latencies, _ in results for latency in latencies], sum(e for _, e in results), elapsed
+        )
+
+    async def run_asgi(self, users, paths, concurrency):
+        clients = []
+        for user in users:
+            client = AsyncClient(raise_request_exception=False)
+            await asyncio.to_thread(client.force_login, user)
+            clients.append(client)
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies, errors = [], 0
+
+        async def request(i):
+            nonlocal errors
+            async with semaphore:
+                start = time.perf_counter()
+                response = await self.send(clients[i % len(clients)], paths[i])
+                if response.status_code == 200:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(request(i) for i in range(len(paths))))
+        return summarize(latencies, errors, time.perf_counter() - start)
@@ -0,0 +1,104 @@
+import asyncio
+import os
+import time
+from concurrent.futures import ThreadPoolExecutor
+from urllib.parse import urlencode
+
+from django.core.management.base import BaseCommand
+from django.test import AsyncClient, Client
+from django.urls import reverse
+
+from accounts.hashing import shutdown_hashing_executor
+from benchmarks.utils import summarize, test_database, write_report
+
+
+def usable_cores():
+    try:
+        return len(os.sched_getaffinity(0))
+    except AttributeError:
+        return os.cpu_count()
+
+
+def signup_data(prefix, i):
+    return {
+        "username": f"{prefix}{i}",
+        "email": f"{prefix}{i}@example.com",
+        "password1": "benchpassword",
+        "password2": "benchpassword",
+    }
+
+
+class Command(BaseCommand):
+    help = (
+        "Measure signups per second and per core through accounts:signup under WSGI and through "
+        "accounts:signup_async, which hashes in the hashing pool, under ASGI."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--signups", type=int, default=50, help="Signups sent to each stack.")
+        parser.add_argument("--concurrency", type=int, default=4)
+        parser.add_argument("--output", help="Write the results as JSON to this file.")
+
+    def handle(self, *args, **options):
+        cores = usable_cores()
+        with test_database():
+            report = {
+                "cores": cores,
+                "concurrency": options["concurrency"],
+                "wsgi": self.run_wsgi(options["signups"], options["concurrency"]),
+                "asgi": asyncio.run(self.run_asgi(options["signups"], options["concurrency"])),
+            }
+            shutdown_hashing_executor()
+        for stack in ("wsgi", "asgi"):
+            summary = report[stack]
+            summary["rps_per_core"] = round(summary["rps"] / cores, 2) if summary["rps"] else None
+            self.stdout.write(f"{stack}: " + ", ".join(f"{key}={value}" for key, value in summary.items()))
+        if options["output"]:
+            write_report(options["output"], report)
+
+    def run_wsgi(self, signups, concurrency):
+        url = reverse("accounts:signup")
+
+        def worker(i):
+            latencies, errors = [], 0
+            for j in range(i, signups, concurrency):
+                # A fresh client per signup, as every signup starts without a session.
+                client = Client(raise_request_exception=False)
+                start = time.perf_counter()
+                response = client.post(url, signup_data("wsgi", j))
+                if response.status_code == 302:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+            return latencies, errors
+
+        start = time.perf_counter()
+        with ThreadPoolExecutor(concurrency) as executor:
+            results = list(executor.map(worker, range(concurrency)))
+        elapsed = time.perf_counter() - start
+        return summarize(
+            [latency for latencies, _ in results for latency in latencies], sum(e for _, e in results), elapsed
+        )
+
+    async def run_asgi(self, signups, concurrency):
+        url = reverse("accounts:signup_async")
+        semaphore = asyncio.Semaphore(concurrency)
+        latencies, errors = [], 0
+
+        async def signup(i):
+            nonlocal errors
+            async with semaphore:
+                client = AsyncClient(raise_request_exception=False)
+                start = time.perf_counter()
+                # Multipart bodies are read past their end by AsyncClient in Django 4.1, so send a form body.
+                response = await client.post(
+                    url, urlencode(signup_data("asgi", i)), content_type="application/x-www-form-urlencoded"
+                )
+                if response.status_code == 302:
+                    latencies.append(time.perf_counter() - start)
+                else:
+                    errors += 1
+
+        start = time.perf_counter()
+        await asyncio.gather(*(signup(i) for i in range(signups)))
+        return summarize(latencies, errors, time.perf_counter() - start)
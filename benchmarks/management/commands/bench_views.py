@@ -0,0 +1,59 @@
+import platform
+import time
+
+import django
+from django.core.management.base import BaseCommand
+from django.utils import timezone
+
+from benchmarks.dataset import generate_dataset
+from benchmarks.suite import dataset_shape, run_view_benchmarks
+from benchmarks.utils import test_database, write_report
+
+
+class Command(BaseCommand):
+    help = "Time the main views against generated datasets of several sizes on a throwaway database."
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--sizes", type=int, nargs="+", default=[100, 1000], help="Number of users of each dataset."
+        )
+        parser.add_argument("--tweets-per-user", type=int, default=10)
+        parser.add_argument("--likes-per-user", type=int, default=20)
+        parser.add_argument("--avg-following", type=int, default=20)
+        parser.add_argument("--repeat", type=int, default=20, help="Timed requests per view and size.")
+        parser.add_argument("--warmup", type=int, default=2)
+        parser.add_argument("--seed", type=int, default=0)
+        parser.add_argument("--output", help="Write the results as JSON to this file.")
+
+    def handle(self, *args, **options):
+        report = {
+            "started_at": timezone.now().isoformat(),
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "repeat": options["repeat"],
+            "runs": [],
+        }
+        for users in options["sizes"]:
+            with test_database():
+                start = time.perf_counter()
+                counts = generate_dataset(
+                    users=users,
+                    tweets=users * options["tweets_per_user"],
+                    likes=users * options["likes_per_user"],
+                    avg_following=options["avg_following"],
+                    seed=options["seed"],
+                )
+                seeded_in = time.perf_counter() - start
+                run = {
+                    "dataset": {**counts, **dataset_shape(), "seconds": round(seeded_in, 1)},
+                    "views": run_view_benchmarks(repeat=options["repeat"], warmup=options["warmup"]),
+                }
+            report["runs"].append(run)
+            self.stdout.write(f"{users} users ({counts['tweets']} tweets, {counts['likes']} likes):")
+            for label, summary in run["views"].items():
+                self.stdout.write(
+                    f"  {label:28} p50 {summary['p50_ms']} ms, p95 {summary['p95_ms']} ms, "
+                    f"{summary['queries']} queries, {summary['errors']} errors"
+                )
+        if options["output"]:
+            write_report(options["output"], report)
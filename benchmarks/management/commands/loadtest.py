@@ -0,0 +1,63 @@
+from concurrent.futures import ThreadPoolExecutor
+
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks.dataset import PASSWORD
+from benchmarks.loadtest import DEFAULT_MIX, LoadTest, VirtualUser, check_local_url, parse_mix
+from benchmarks.utils import write_report
+
+
+class Command(BaseCommand):
+    help = (
+        "Replay a mix of timeline reads, tweets, likes and follows against a server running on localhost, as "
+        "users created with seed_dataset, and report throughput and latency per endpoint."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("--url", default="http://127.0.0.1:8000/", help="Base URL of the server under test.")
+        parser.add_argument("--users", type=int, default=50, help="Number of seeded users to log in.")
+        parser.add_argument("--prefix", default="seed", help="Username prefix given to seed_dataset.")
+        parser.add_argument(
+            "--mix",
+            default=",".join(f"{name}={weight}" for name, weight in DEFAULT_MIX.items()),
+            help="Relative weights of the operations, e.g. home=60,like=30,follow=10.",
+        )
+        parser.add_argument("--concurrency", type=int, default=10, help="Closed loop: users sending at once.")
+        parser.add_argument("--rate", type=float, help="Open loop: requests started per second.")
+        parser.add_argument("--duration", type=float, default=30, help="Seconds to run for.")
+        parser.add_argument("--requests", type=int, help="Closed loop: stop after this many requests instead.")
+        parser.add_argument("--seed", type=int)
+        parser.add_argument("--output", help="Write the results as JSON to this file.")
+
+    def handle(self, *args, **options):
+        url = options["url"]
+        try:
+            check_local_url(url)
+            mix = parse_mix(options["mix"])
+        except ValueError as e:
+            raise CommandError(e)
+        names = [f"{options['prefix']}{i}" for i in range(options["users"])]
+        users = [VirtualUser(url, name, PASSWORD) for name in names]
+        with ThreadPoolExecutor(options["concurrency"]) as executor:
+            try:
+                list(executor.map(VirtualUser.login, users))
+            except RuntimeError as e:
+                raise CommandError(f"{e} Create the users with seed_dataset against the server's database.")
+        load = LoadTest(users, mix, names, seed=options["seed"])
+        if options["rate"]:
+            mode = "open"
+            results = load.run_open(options["rate"], options["duration"], options["concurrency"])
+        else:
+            mode = "closed"
+            duration = None if options["requests"] else options["duration"]
+            results = load.run_closed(options["concurrency"], duration=duration, requests=options["requests"])
+        report = {"url": url, "mode": mode, "concurrency": options["concurrency"], "rate": options["rate"]}
+        report.update(mix=mix, **results)
+        for endpoint, summary in [*results["endpoints"].items(), ("total", results["total"])]:
+            self.stdout.write(
+                f"{endpoint:20} {summary['requests']} requests, {summary['rps']} rps, p50 {summary['p50_ms']} ms, "
+                f"p95 {summary['p95_ms']} ms, p99 {summary['p99_ms']} ms, errors {summary['error_rate']:.1%}, "
+                f"{summary['rejected']} rejected"
+            )
+        if options["output"]:
+            write_report(options["output"], report)
@@ -0,0 +1,38 @@
+import time
+
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand, CommandError
+
+from benchmarks.dataset import PASSWORD, generate_dataset
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Generate synthetic users, a power-law follow graph, tweets and skewed likes in bulk."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--users", type=int, default=1000)
+        parser.add_argument("--tweets", type=int, help="Defaults to 10 per user.")
+        parser.add_argument("--likes", type=int, help="Defaults to 20 per user.")
+        parser.add_argument("--avg-following", type=int, default=20)
+        parser.add_argument("--prefix", default="seed", help="Prefix of the generated usernames.")
+        parser.add_argument("--seed", type=int, default=0, help="Random seed, for reproducible datasets.")
+        parser.add_argument("--batch-size", type=int, default=5000)
+
+    def handle(self, *args, **options):
+        if User.objects.filter(username__startswith=options["prefix"]).exists():
+            raise CommandError(f"Users starting with {options['prefix']!r} already exist. Choose another --prefix.")
+        start = time.perf_counter()
+        counts = generate_dataset(
+            users=options["users"],
+            tweets=options["tweets"] if options["tweets"] is not None else options["users"] * 10,
+            likes=options["likes"] if options["likes"] is not None else options["users"] * 20,
+            avg_following=options["avg_following"],
+            prefix=options["prefix"],
+            seed=options["seed"],
+            batch_size=options["batch_size"],
+        )
+        elapsed = time.perf_counter() - start
+        summary = ", ".join(f"{count} {kind}" for kind, count in counts.items())
+        self.stdout.write(f"Created {summary} in {elapsed:.1f}s. Every user's password is {PASSWORD!r}.")
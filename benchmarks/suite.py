@@ -0,0 +1,87 @@
+import json
+import time
+
+from django.db.models import Max
+from django.test import Client, override_settings
+from django.urls import reverse
+
+from accounts.models import UserStats
+from tweets.models import Tweet
+
+from .utils import summarize
+
+
+def pick_targets():
+    """Return the user following the most accounts, the most followed user and the most liked tweet."""
+    stats = UserStats.objects.select_related("user")
+    viewer = stats.order_by("-following_count", "pk").first().user
+    celebrity = stats.order_by("-followers_count", "pk").first().user
+    tweet = Tweet.objects.order_by("-like_count", "pk").first()
+    return viewer, celebrity, tweet
+
+
+def view_requests(viewer, celebrity, tweet):
+    """Return ``(label, method, url, body)`` for every request the suite times, in order."""
+    batch_tweets = Tweet.objects.order_by("-like_count", "pk").values_list("pk", flat=True)[:20]
+    like_batch = json.dumps({"likes": [{"tweet_id": pk, "liked": True} for pk in batch_tweets]})
+    unlike_batch = json.dumps({"likes": [{"tweet_id": pk, "liked": False} for pk in batch_tweets]})
+    return [
+        ("tweets:home", "get", reverse("tweets:home"), None),
+        ("tweets:home_json", "get", reverse("tweets:home_json"), None),
+        ("tweets:detail", "get", reverse("tweets:detail", kwargs={"pk": tweet.pk}), None),
+        ("accounts:user_profile", "get", reverse("accounts:user_profile", args=[celebrity.username]), None),
+        ("accounts:follower_list", "get", reverse("accounts:follower_list", args=[celebrity.username]), None),
+        ("accounts:following_list", "get", reverse("accounts:following_list", args=[viewer.username]), None),
+        ("tweets:like", "post", reverse("tweets:like", kwargs={"pk": tweet.pk}), None),
+        ("tweets:unlike", "post", reverse("tweets:unlike", kwargs={"pk": tweet.pk}), None),
+        ("tweets:like_batch (like)", "post", reverse("tweets:like_batch"), like_batch),
+        ("tweets:like_batch (unlike)", "post", reverse("tweets:like_batch"), unlike_batch),
+    ]
+
+
+@override_settings(QUERY_BUDGET_STRICT=False)
+def run_view_benchmarks(repeat=20, warmup=2):
+    """
+    Time each view of ``view_requests`` ``repeat`` times as the heaviest viewer and return
+    ``{label: summary}`` with latency percentiles and the largest number of queries seen.
+
+    Every like request is followed by the matching unlike, so each repetition does the same work.
+    """
+    viewer, celebrity, tweet = pick_targets()
+    client = Client(raise_request_exception=False)
+    client.force_login(viewer)
+    requests = view_requests(viewer, celebrity, tweet)
+    latencies = {label: [] for label, *_ in requests}
+    errors = dict.fromkeys(latencies, 0)
+    queries = dict.fromkeys(latencies, 0)
+    started = time.perf_counter()
+    for i in range(warmup + repeat):
+        for label, method, url, body in requests:
+            start = time.perf_counter()
+            if body is None:
+                response = getattr(client, method)(url)
+            else:
+                response = client.post(url, body, content_type="application/json")
+            elapsed = time.perf_counter() - start
+            if i < warmup:
+                continue
+            if response.status_code >= 400:
+                errors[label] += 1
+            else:
+                latencies[label].append(elapsed)
+            queries[label] = max(queries[label], response.wsgi_request.query_metrics.count)
+    elapsed = time.perf_counter() - started
+    results = {}
+    for label in latencies:
+        summary = summarize(latencies[label], errors[label], elapsed)
+        del summary["rps"]
+        summary["queries"] = queries[label]
+        results[label] = summary
+    return results
+
+
+def dataset_shape():
+    """Return the largest fan-in, fan-out and like count of the current dataset."""
+    shape = UserStats.objects.aggregate(max_followers=Max("followers_count"), max_following=Max("following_count"))
+    shape.update(Tweet.objects.aggregate(max_likes=Max("like_count")))
+    return shape
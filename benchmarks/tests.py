@@ -0,0 +1,101 @@
+from io import StringIO
+
+from django.contrib.auth import get_user_model
+from django.core.management import CommandError, call_command
+from django.test import LiveServerTestCase, TestCase
+
+from accounts.models import FriendShip, UserStats
+from tweets.models import Like, TimelineEntry, Tweet
+from tweets.timeline import rebuild_timeline
+
+from .dataset import PASSWORD, generate_dataset
+from .loadtest import check_local_url, parse_mix
+from .suite import run_view_benchmarks
+
+User = get_user_model()
+
+
+class TestGenerateDataset(TestCase):
+    def setUp(self):
+        self.counts = generate_dataset(users=50, tweets=300, likes=600, avg_following=5)
+
+    def test_counts(self):
+        self.assertEqual(self.counts["users"], User.objects.count())
+        self.assertEqual(self.counts["follows"], FriendShip.objects.count())
+        self.assertEqual(self.counts["tweets"], Tweet.objects.count())
+        self.assertEqual(self.counts["likes"], Like.objects.count())
+        self.assertTrue(self.client.login(username="seed0", password=PASSWORD))
+
+    def test_derived_data_is_consistent(self):
+        call_command("verify_user_stats", stdout=StringIO())
+        out = StringIO()
+        call_command("reconcile_like_counts", stdout=out)
+        self.assertIn("fixed 0 drifted", out.getvalue())
+        for user in User.objects.order_by("pk")[:10]:
+            entries = set(TimelineEntry.objects.filter(owner=user).values_list("tweet_id", flat=True))
+            rebuild_timeline(user)
+            self.assertEqual(set(TimelineEntry.objects.filter(owner=user).values_list("tweet_id", flat=True)), entries)
+
+    def test_followers_are_skewed(self):
+        followers = sorted(UserStats.objects.values_list("followers_count", flat=True), reverse=True)
+        self.assertGreater(followers[0], 5 * followers[len(followers) // 2])
+
+    def test_same_seed_same_dataset(self):
+        follows = set(FriendShip.objects.values_list("follower__username", "following__username"))
+        generate_dataset(users=50, tweets=300, likes=600, avg_following=5, prefix="again")
+        again = FriendShip.objects.filter(follower__username__startswith="again")
+        renamed = {
+            (follower.replace("again", "seed"), following.replace("again", "seed"))
+            for follower, following in again.values_list("follower__username", "following__username")
+        }
+        self.assertEqual(renamed, follows)
+
+    def test_seed_dataset_refuses_existing_prefix(self):
+        with self.assertRaises(CommandError):
+            call_command("seed_dataset", users=1, stdout=StringIO())
+
+
+class TestRunViewBenchmarks(TestCase):
+    def test_every_view_is_timed(self):
+        generate_dataset(users=20, tweets=100, likes=200, avg_following=5)
+        results = run_view_benchmarks(repeat=2, warmup=0)
+        self.assertIn("tweets:home", results)
+        self.assertIn("accounts:follower_list", results)
+        for label, summary in results.items():
+            with self.subTest(label=label):
+                self.assertEqual(summary["errors"], 0)
+                self.assertEqual(summary["requests"], 2)
+                self.assertGreater(summary["queries"], 0)
+
+
+class TestLoadTest(LiveServerTestCase):
+    def setUp(self):
+        generate_dataset(users=5, tweets=30, likes=30, avg_following=3)
+
+    def test_closed_loop(self):
+        out = StringIO()
+        call_command("loadtest", url=self.live_server_url, users=5, concurrency=1, requests=40, seed=0, stdout=out)
+        self.assertIn("tweets:home", out.getvalue())
+        self.assertIn("total                40 requests", out.getvalue())
+        self.assertIn("errors 0.0%", out.getvalue())
+
+    def test_open_loop(self):
+        out = StringIO()
+        call_command(
+            "loadtest", url=self.live_server_url, users=5, concurrency=1, rate=20, duration=1, mix="home=1", stdout=out
+        )
+        self.assertIn("tweets:home ", out.getvalue())
+        self.assertIn("errors 0.0%", out.getvalue())
+
+    def test_refuses_remote_urls(self):
+        check_local_url("http://localhost:8000/")
+        check_local_url("http://[::1]:8000/")
+        with self.assertRaises(ValueError):
+            check_local_url("http://example.com/")
+        with self.assertRaises(CommandError):
+            call_command("loadtest", url="http://192.0.2.1/", stdout=StringIO())
+
+    def test_parse_mix(self):
+        self.assertEqual(parse_mix("home=3,like=1"), {"home": 3, "like": 1})
+        with self.assertRaises(ValueError):
+            parse_mix("home=3,retweet=1")
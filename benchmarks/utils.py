@@ -0,0 +1,56 @@
+import json
+import math
+import os
+import tempfile
+from contextlib import contextmanager
+
+from django.db import connection
+from django.test.utils import setup_test_environment, teardown_test_environment
+
+
+@contextmanager
+def test_database():
+    """Run the block against a freshly created test database so benchmarks never touch real data.
+
+    SQLite's shared in-memory test database locks whole tables between threads, so it is replaced by a
+    temporary file there.
+    """
+    setup_test_environment()
+    old_name = connection.settings_dict["NAME"]
+    test_settings = connection.settings_dict["TEST"]
+    old_test_name = test_settings.get("NAME")
+    if connection.vendor == "sqlite" and not old_test_name:
+        fd, test_settings["NAME"] = tempfile.mkstemp(suffix=".sqlite3")
+        os.close(fd)
+    connection.creation.create_test_db(verbosity=0, autoclobber=True)
+    try:
+        yield
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+        test_settings["NAME"] = old_test_name
+        teardown_test_environment()
+
+
+def percentile(sorted_values, q):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, math.ceil(q / 100 * len(sorted_values)) - 1)]
+
+
+def summarize(latencies, errors, elapsed):
+    """Summarize request latencies in seconds as requests per second and p50/p95/p99 in milliseconds."""
+    latencies = sorted(latencies)
+    summary = {
+        "requests": len(latencies) + errors,
+        "errors": errors,
+        "rps": round(len(latencies) / elapsed, 1) if elapsed else None,
+    }
+    for q in (50, 95, 99):
+        value = percentile(latencies, q)
+        summary[f"p{q}_ms"] = None if value is None else round(value * 1000, 2)
+    return summary
+
+
+def write_report(path, report):
+    with open(path, "w") as f:
+        json.dump(report, f, indent=2)
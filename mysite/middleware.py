@@ -0,0 +1,137 @@
+import contextvars
+import logging
+import threading
+import time
+from collections import defaultdict
+from contextlib import ExitStack, contextmanager
+
+from django.conf import settings
+from django.db import connections
+from django.utils.deprecation import MiddlewareMixin
+
+logger = logging.getLogger(__name__)
+
+
+class QueryBudgetExceeded(Exception):
+    pass
+
+
+WRITE_STATEMENTS = ("INSERT", "UPDATE", "DELETE", "REPLACE")
+
+
+class QueryMetrics:
+    """
+    Database execute wrapper counting the queries of a request and the time spent in them.
+
+    ``allowance`` is added to the view's budget by allow_queries and unbudgeted, and ``wrote`` is set once
+    the request has run an INSERT, UPDATE or DELETE.
+    """
+
+    def __init__(self):
+        self.count = 0
+        self.duration = 0.0
+        self.allowance = 0
+        self.wrote = False
+
+    def __call__(self, execute, sql, params, many, context):
+        if not self.wrote and sql.lstrip()[:7].upper().startswith(WRITE_STATEMENTS):
+            self.wrote = True
+        start = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            self.count += 1
+            self.duration += time.perf_counter() - start
+
+
+_current_metrics = contextvars.ContextVar("query_metrics", default=None)
+
+
+def allow_queries(count):
+    """Raise the query budget of the current request, if any, by ``count`` for work that grows with the data."""
+    metrics = _current_metrics.get()
+    if metrics is not None:
+        metrics.allowance += count
+
+
+@contextmanager
+def unbudgeted():
+    """Leave the queries run in the block out of the current request's query budget. They are still counted."""
+    metrics = _current_metrics.get()
+    start = metrics.count if metrics is not None else 0
+    try:
+        yield
+    finally:
+        if metrics is not None:
+            metrics.allowance += metrics.count - start
+
+
+_stats = defaultdict(lambda: {"requests": 0, "queries": 0, "db_time": 0.0, "max_queries": 0})
+_stats_lock = threading.Lock()
+
+
+def get_query_stats():
+    """Return ``{url name: {"requests", "queries", "db_time", "max_queries"}}`` for this process."""
+    with _stats_lock:
+        return {view_name: dict(stats) for view_name, stats in _stats.items()}
+
+
+def reset_query_stats():
+    with _stats_lock:
+        _stats.clear()
+
+
+def get_query_budget(resolver_match):
+    """Return the ``query_budget`` declared by the view ``resolver_match`` points to, or None."""
+    view = getattr(resolver_match.func, "view_class", resolver_match.func)
+    return getattr(view, "query_budget", None)
+
+
+class QueryMetricsMiddleware(MiddlewareMixin):
+    """
+    Record the number of queries and the database time of each request per URL name, and check them against
+    the view's ``query_budget``.
+
+    Requests over budget are logged, or raise QueryBudgetExceeded when QUERY_BUDGET_STRICT is set and the
+    request wrote nothing, so that a client never sees an error for a change that was committed. Work that
+    grows with the data raises the budget of its request with allow_queries or unbudgeted. In DEBUG the
+    response carries the figures in ``X-Query-Count`` and ``Server-Timing`` headers.
+
+    MiddlewareMixin runs both hooks in the thread that runs the request's synchronous code, also under ASGI,
+    so the queries of async views that go through ``sync_to_async`` are counted as well.
+    """
+
+    def process_request(self, request):
+        request.query_metrics = QueryMetrics()
+        _current_metrics.set(request.query_metrics)
+        request._query_metrics_stack = stack = ExitStack()
+        for connection in connections.all():
+            stack.enter_context(connection.execute_wrapper(request.query_metrics))
+
+    def process_response(self, request, response):
+        stack = getattr(request, "_query_metrics_stack", None)
+        if stack is None:
+            return response
+        stack.close()
+        _current_metrics.set(None)
+        metrics = request.query_metrics
+        if settings.DEBUG:
+            response.headers["X-Query-Count"] = str(metrics.count)
+            response.headers["Server-Timing"] = f'db;dur={metrics.duration * 1000:.1f};desc="{metrics.count} queries"'
+        match = request.resolver_match
+        if match is None:
+            return response
+        with _stats_lock:
+            stats = _stats[match.view_name]
+            stats["requests"] += 1
+            stats["queries"] += metrics.count
+            stats["db_time"] += metrics.duration
+            stats["max_queries"] = max(stats["max_queries"], metrics.count)
+        budget = get_query_budget(match)
+        if budget is not None and metrics.count > budget + metrics.allowance:
+            budget += metrics.allowance
+            message = f"{match.view_name} ran {metrics.count} queries, over its budget of {budget}."
+            if settings.QUERY_BUDGET_STRICT and not metrics.wrote:
+                raise QueryBudgetExceeded(message)
+            logger.warning(message)
+        return response
@@ -0,0 +1,53 @@
+from calendar import timegm
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
+from django.contrib.auth.mixins import AccessMixin
+from django.utils.cache import get_conditional_response, patch_cache_control, quote_etag
+from django.utils.crypto import md5
+from django.utils.http import http_date
+
+
+class AsyncLoginRequiredMixin(AccessMixin):
+    """LoginRequiredMixin for views whose handlers are coroutines."""
+
+    async def dispatch(self, request, *args, **kwargs):
+        # Resolving request.user reads the session and user tables, which Django 4.1 can only do synchronously.
+        is_authenticated = await sync_to_async(lambda: request.user.is_authenticated)()
+        if not is_authenticated:
+            return self.handle_no_permission()
+        return await super().dispatch(request, *args, **kwargs)
+
+
+class ConditionalGetMixin:
+    """
+    Answer conditional GETs with 304 Not Modified before the view runs its queries and renders.
+
+    ``get_validators`` returns ``(version, last_modified)``: a cheap tuple of values the page depends on and the
+    newest timestamp among them (or None). The ETag hashes the version with the viewer, their CSRF cookie,
+    which forms on the page are derived from, and the query string. Return ``(None, None)`` to always render.
+    """
+
+    def get_validators(self):
+        return None, None
+
+    def get_etag(self, version):
+        request = self.request
+        key = (request.user.pk, request.COOKIES.get(settings.CSRF_COOKIE_NAME), request.get_full_path(), version)
+        return quote_etag(md5(repr(key).encode(), usedforsecurity=False).hexdigest())
+
+    def get(self, request, *args, **kwargs):
+        version, last_modified = self.get_validators()
+        if version is None:
+            return super().get(request, *args, **kwargs)
+        etag = self.get_etag(version)
+        timestamp = last_modified and timegm(last_modified.utctimetuple())
+        response = get_conditional_response(request, etag=etag, last_modified=timestamp)
+        if response is None:
+            response = super().get(request, *args, **kwargs)
+        response.headers.setdefault("ETag", etag)
+        if timestamp:
+            response.headers.setdefault("Last-Modified", http_date(timestamp))
+        # Pages differ per viewer, so only the browser may keep them, and it has to revalidate every time.
+        patch_cache_control(response, private=True, no_cache=True)
+        return response
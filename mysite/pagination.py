@@ -0,0 +1,113 @@
+import base64
+import binascii
+import json
+
+from django.core.exceptions import BadRequest, ValidationError
+from django.db.models import Q
+
+
+class InvalidCursor(BadRequest):
+    pass
+
+
+class KeysetPage:
+    """One page of a keyset-paginated listing, ordered newest first."""
+
+    def __init__(self, object_list, older_cursor=None, newer_cursor=None):
+        self.object_list = object_list
+        self.older_cursor = older_cursor
+        self.newer_cursor = newer_cursor
+
+    def __iter__(self):
+        return iter(self.object_list)
+
+    def __len__(self):
+        return len(self.object_list)
+
+    @property
+    def has_older(self):
+        return self.older_cursor is not None
+
+    @property
+    def has_newer(self):
+        return self.newer_cursor is not None
+
+
+class KeysetPaginator:
+    """
+    Paginate newest first on ``fields`` (e.g. ``created_at, id``) with opaque cursors.
+
+    Each page is fetched with a range condition on the key columns instead of OFFSET, so the cost of a page
+    only depends on ``page_size`` and not on how deep the reader has scrolled. The last field must be unique.
+    """
+
+    def __init__(self, page_size, fields=("created_at", "id")):
+        self.page_size = page_size
+        self.fields = tuple(fields)
+
+    def paginate(self, *querysets, before=None, after=None):
+        """
+        Return the page of rows older than ``before`` or newer than ``after`` (the newest page if neither).
+
+        Several querysets sharing the key fields may be given; their rows are merged into one page and rows
+        with the same key are only listed once.
+        """
+        if before and after:
+            raise InvalidCursor("before と after は同時に指定できません。")
+        newer = bool(after)
+        cursor = self.decode_cursor(after or before, querysets[0].model) if (after or before) else None
+        ordering = [field if newer else f"-{field}" for field in self.fields]
+
+        rows = []
+        for queryset in querysets:
+            if cursor is not None:
+                queryset = queryset.filter(self._seek(cursor, newer))
+            rows.extend(queryset.order_by(*ordering)[: self.page_size + 1])
+        rows.sort(key=self._key, reverse=not newer)
+        if len(querysets) > 1:
+            rows = [row for i, row in enumerate(rows) if i == 0 or self._key(row) != self._key(rows[i - 1])]
+        has_more = len(rows) > self.page_size
+        rows = rows[: self.page_size]
+        if newer:
+            rows.reverse()
+
+        if not rows:
+            return KeysetPage(rows, older_cursor=after or None, newer_cursor=before or None)
+        if newer:
+            return KeysetPage(
+                rows,
+                older_cursor=self.encode_cursor(rows[-1]),
+                newer_cursor=self.encode_cursor(rows[0]) if has_more else None,
+            )
+        return KeysetPage(
+            rows,
+            older_cursor=self.encode_cursor(rows[-1]) if has_more else None,
+            newer_cursor=self.encode_cursor(rows[0]) if cursor is not None else None,
+        )
+
+    def encode_cursor(self, row):
+        values = [value.isoformat() if hasattr(value, "isoformat") else value for value in self._key(row)]
+        return base64.urlsafe_b64encode(json.dumps(values).encode()).decode().rstrip("=")
+
+    def decode_cursor(self, cursor, model):
+        try:
+            values = json.loads(base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4)))
+            if not isinstance(values, list) or len(values) != len(self.fields):
+                raise ValueError
+            return tuple(model._meta.get_field(field).to_python(value) for field, value in zip(self.fields, values))
+        except (binascii.Error, ValueError, ValidationError):
+            raise InvalidCursor("不正なカーソルです。")
+
+    def _key(self, row):
+        if isinstance(row, dict):
+            return tuple(row[field] for field in self.fields)
+        return tuple(getattr(row, field) for field in self.fields)
+
+    def _seek(self, cursor, newer):
+        """Build ``(fields) < cursor`` (or ``>`` when ``newer``) as a filter the database can serve from an index."""
+        op = "gt" if newer else "lt"
+        condition = Q()
+        for i in range(len(self.fields)):
+            equal = {field: value for field, value in zip(self.fields[:i], cursor[:i])}
+            condition |= Q(**equal, **{f"{self.fields[i]}__{op}": cursor[i]})
+        return Q(**{f"{self.fields[0]}__{op}e": cursor[0]}) & condition
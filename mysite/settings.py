@@ -40,9 +40,11 @@ INSTALLED_APPS = [
     "accounts.apps.AccountsConfig",
     "tweets.apps.TweetsConfig",
     "welcome.apps.WelcomeConfig",
+    "benchmarks.apps.BenchmarksConfig",
 ]
 
 MIDDLEWARE = [
+    "mysite.middleware.QueryMetricsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -129,6 +131,155 @@ DEFAULT_AUTO_FIELD = "django.db.models.BigAutoField"
 
 AUTH_USER_MODEL = "accounts.User"
 
+# Sessions load their user from the user cache. ModelBackend stays listed so sessions started before
+# CachedModelBackend was added remain valid.
+
+AUTHENTICATION_BACKENDS = [
+    "accounts.backends.CachedModelBackend",
+    "django.contrib.auth.backends.ModelBackend",
+]
+
 LOGIN_URL = "accounts:login"
 LOGIN_REDIRECT_URL = "tweets:home"
 LOGOUT_REDIRECT_URL = "accounts:login"
+
+# Password hashing for accounts:signup_async, which hashes in a pool of MAX_WORKERS threads, or processes
+# with EXECUTOR = "process", so that PBKDF2 does not block the event loop.
+
+ACCOUNTS_PASSWORD_HASHING = {
+    "EXECUTOR": "thread",
+    "MAX_WORKERS": 4,
+}
+
+# Caches. The default LocMemCache is private to each process: with several worker processes, configure a
+# shared backend such as Redis or Memcached instead, or the caches below stay disabled.
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    }
+}
+
+# Seconds to cache users by id and username for session and profile lookups. 0 disables the cache. A change
+# to a user only evicts it from the cache the changing process sees, so a per-process cache would keep
+# deactivated users and sessions of changed passwords alive in other workers until the timeout. The cache is
+# therefore only on with a shared backend; `manage.py check` warns when it is enabled with LocMemCache.
+
+ACCOUNTS_USER_CACHE_TIMEOUT = 0 if CACHES["default"]["BACKEND"].endswith("LocMemCache") else 300
+
+# Data export. `accounts:export` and `manage.py export_user_data` stream rows read from the database
+# ACCOUNTS_EXPORT_CHUNK_SIZE at a time.
+
+ACCOUNTS_EXPORT_CHUNK_SIZE = 2000
+
+# Users per page of the following and follower lists.
+
+ACCOUNTS_FOLLOW_LIST_PAGE_SIZE = 50
+
+# "Who to follow". `manage.py rebuild_recommendations`, run periodically, stores the TOP_N best candidates of
+# every user: each account they follow that follows a candidate scores 1, and a candidate following them
+# without being followed back scores MUTUAL_WEIGHT. Between rebuilds a follow or unfollow adjusts the scores
+# of the two users involved, from at most INCREMENTAL_LIMIT of the followed user's latest follows.
+
+ACCOUNTS_RECOMMENDATIONS = {
+    "TOP_N": 20,
+    "MUTUAL_WEIGHT": 2.0,
+    "INCREMENTAL_LIMIT": 100,
+}
+
+# Account deletion. `accounts:delete` deactivates the account at once; a background thread, woken after each
+# request and every INTERVAL seconds, then deletes its rows in batches of one transaction each. Batches start
+# at BATCH_SIZE rows and are halved when one holds the write lock longer than MAX_LOCK_SECONDS, or doubled up
+# to MAX_BATCH_SIZE when one takes under a quarter of it. With ENABLED off, run `manage.py delete_accounts`
+# periodically instead.
+
+ACCOUNTS_DELETION = {
+    "ENABLED": True,
+    "INTERVAL": 60,
+    "BATCH_SIZE": 500,
+    "MAX_BATCH_SIZE": 5000,
+    "MAX_LOCK_SECONDS": 0.1,
+}
+
+# Timeline
+
+TWEETS_TIMELINE_PAGE_SIZE = 20
+
+# Tweets are copied into each follower's timeline when posted, except for authors with at least
+# TWEETS_FANOUT_MAX_FOLLOWERS followers, whose tweets are merged into timelines at read time instead.
+
+TWEETS_FANOUT_MAX_FOLLOWERS = 10000
+TWEETS_FANOUT_BATCH_SIZE = 1000
+TWEETS_TIMELINE_BACKFILL_SIZE = 100
+
+# Search. Tweets are indexed in SQLite FTS5 tables by tweets.search, a trigram one for terms of three or more
+# characters and a bigram one for two-character words; `manage.py rebuild_search_index` recreates them, e.g.
+# after a migration that rebuilt tweets_tweet and dropped its triggers. Single characters cannot be looked up:
+# they only filter the matches of the other terms, and queries made only of them, as well as every query on
+# other databases, search just the newest TWEETS_SEARCH_SCAN_LIMIT tweets.
+
+TWEETS_SEARCH_PAGE_SIZE = 20
+TWEETS_SEARCH_SCAN_LIMIT = 10000
+
+# Deleting a tweet only hides it. A background thread, woken after each deletion and every INTERVAL seconds,
+# then removes its likes, timeline entries and index rows CHUNK_SIZE rows per transaction. With ENABLED off,
+# run `manage.py purge_deleted_tweets` periodically instead.
+
+TWEETS_PURGE = {
+    "ENABLED": True,
+    "CHUNK_SIZE": 1000,
+    "INTERVAL": 300,
+}
+
+# Like counters
+# Tweets with at least TWEETS_LIKE_COUNT_SHARD_THRESHOLD likes spread their counter updates over
+# TWEETS_LIKE_COUNT_SHARDS rows, which `manage.py reconcile_like_counts` folds back into Tweet.like_count.
+# Until then pages add the pending shard totals to the counts they show, with one more query per page.
+# Set TWEETS_LIKE_COUNT_SHARDS to 0 to always update Tweet.like_count directly.
+
+TWEETS_LIKE_COUNT_SHARDS = 0
+TWEETS_LIKE_COUNT_SHARD_THRESHOLD = 1000
+
+# Seconds to cache whether a user liked a tweet, for heavy likers. 0 disables the cache.
+
+TWEETS_LIKED_CACHE_TIMEOUT = 0
+
+# Write-behind buffering of like toggles. When enabled, like requests are answered from an in-process buffer
+# that a background thread flushes to the database every FLUSH_INTERVAL seconds, or as soon as MAX_PENDING
+# toggles are waiting. Buffered toggles are lost if the process crashes unless JOURNAL names a file to log
+# them to before they are acknowledged (FSYNC additionally forces each entry to disk).
+
+TWEETS_LIKE_WRITE_BEHIND = {
+    "ENABLED": False,
+    "FLUSH_INTERVAL": 1.0,
+    "MAX_PENDING": 10000,
+    "JOURNAL": None,
+    "FSYNC": False,
+}
+
+# Trending. Likes and hashtags of new tweets are counted in per-process time buckets of BUCKET_SECONDS kept
+# for WINDOW seconds; a count loses half its weight every HALF_LIFE seconds. The TOP_K best tweets and
+# hashtags are recomputed every REFRESH_INTERVAL seconds.
+
+TWEETS_TRENDING = {
+    "WINDOW": 3600,
+    "BUCKET_SECONDS": 60,
+    "HALF_LIFE": 900,
+    "TOP_K": 20,
+    "REFRESH_INTERVAL": 10,
+}
+
+# Live updates. `tweets:events` holds a long poll open for up to TWEETS_EVENTS_TIMEOUT seconds, and clients
+# that fall more than TWEETS_EVENTS_BUFFER_SIZE events behind are told to resynchronize.
+
+TWEETS_EVENTS_TIMEOUT = 25
+TWEETS_EVENTS_BUFFER_SIZE = 1000
+
+# Query budgets. Views declare the most queries a request may run in a `query_budget` attribute, and
+# mysite.middleware.QueryMetricsMiddleware logs requests over it. With QUERY_BUDGET_STRICT it raises instead,
+# unless the request already wrote to the database. Leave it off outside tests: mysite.testing.TestRunner
+# turns it on for the test suite.
+
+QUERY_BUDGET_STRICT = False
+
+TEST_RUNNER = "mysite.testing.TestRunner"
@@ -0,0 +1,65 @@
+from contextlib import contextmanager
+
+from django.conf import settings
+from django.db import connection
+from django.test.runner import DiscoverRunner
+from django.test.utils import CaptureQueriesContext
+
+from .middleware import get_query_budget
+
+
+class TestRunner(DiscoverRunner):
+    """Test runner making views over their query budget raise, so that the test that caused it fails."""
+
+    def setup_test_environment(self, **kwargs):
+        super().setup_test_environment(**kwargs)
+        settings.QUERY_BUDGET_STRICT = True
+
+
+def explain_query_plan(sql):
+    """Return the detail column of SQLite's ``EXPLAIN QUERY PLAN`` for ``sql``."""
+    with connection.cursor() as cursor:
+        cursor.execute(f"EXPLAIN QUERY PLAN {sql}")
+        return [row[-1] for row in cursor.fetchall()]
+
+
+def plan_problems(detail):
+    """Return why a query plan step is too slow for a hot path, or None if it is fine."""
+    if "TEMP B-TREE" in detail:
+        return "sorts in a temporary B-tree"
+    if detail.startswith("SCAN ") and not detail.startswith("SCAN CONSTANT ROW"):
+        return "scans the whole table"
+    return None
+
+
+class QueryPlanTestMixin:
+    """TestCase mixin asserting that the queries of a block are all served by indexes."""
+
+    @contextmanager
+    def assertUsesIndexes(self):
+        with CaptureQueriesContext(connection) as context:
+            yield
+        failures = []
+        for query in context.captured_queries:
+            sql = query["sql"]
+            if not sql.lstrip().upper().startswith("SELECT"):
+                continue
+            for detail in explain_query_plan(sql):
+                problem = plan_problems(detail)
+                if problem:
+                    failures.append(f"{problem} ({detail}):\n    {sql}")
+        if failures:
+            self.fail("Queries not served by an index:\n" + "\n".join(failures))
+
+
+class QueryBudgetTestMixin:
+    """TestCase mixin checking responses against the ``query_budget`` of the view that produced them."""
+
+    def assertWithinQueryBudget(self, response):
+        request = getattr(response, "wsgi_request", None) or response.asgi_request
+        budget = get_query_budget(request.resolver_match)
+        view_name = request.resolver_match.view_name
+        self.assertIsNotNone(budget, f"{view_name} declares no query_budget.")
+        budget += request.query_metrics.allowance
+        count = request.query_metrics.count
+        self.assertLessEqual(count, budget, f"{view_name} ran {count} queries, over its budget of {budget}.")
@@ -0,0 +1,97 @@
+import atexit
+import logging
+import threading
+
+from django.conf import settings
+from django.db import close_old_connections
+
+logger = logging.getLogger(__name__)
+
+
+class PeriodicWorker:
+    """
+    Background thread calling ``task`` when woken and every ``interval`` seconds. A failing run is logged and
+    retried on the next one, and the thread's database connections are closed after each run.
+    """
+
+    def __init__(self, task, interval, name):
+        self.task = task
+        self.interval = interval
+        self.name = name
+        self._wake = threading.Event()
+        self._stopping = threading.Event()
+        self._thread = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name=self.name, daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        """Stop the thread, waiting for a run in progress to finish."""
+        self._stopping.set()
+        self._wake.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def wake(self):
+        self._wake.set()
+
+    def _run(self):
+        while not self._stopping.is_set():
+            self._wake.wait(self.interval)
+            self._wake.clear()
+            if self._stopping.is_set():
+                break
+            try:
+                self.task()
+            except Exception:
+                logger.exception("%s failed; retrying on the next run.", self.name)
+            finally:
+                close_old_connections()
+
+
+class ProcessSingleton:
+    """
+    The process-wide instance of a background service, built by ``factory`` and started on first use, and
+    stopped at exit. ``factory`` returns None when the service is disabled.
+    """
+
+    def __init__(self, factory):
+        self.factory = factory
+        self._instance = None
+        self._lock = threading.Lock()
+
+    def get(self):
+        with self._lock:
+            if self._instance is None:
+                instance = self.factory()
+                if instance is None:
+                    return None
+                # Kept only once started, so that a failed start is retried by the next call.
+                instance.start()
+                self._instance = instance
+                atexit.register(self.stop)
+            return self._instance
+
+    def stop(self):
+        """Stop and discard the instance, if one was started."""
+        with self._lock:
+            if self._instance is not None:
+                self._instance.stop()
+                self._instance = None
+
+
+def periodic_worker(settings_key, task, name):
+    """
+    Return the ProcessSingleton of a PeriodicWorker calling ``task(config)``, where ``config`` is the settings
+    dict named ``settings_key``. The worker runs every ``config["INTERVAL"]`` seconds, and only exists while
+    ``config["ENABLED"]`` is set.
+    """
+
+    def factory():
+        config = getattr(settings, settings_key)
+        if not config["ENABLED"]:
+            return None
+        return PeriodicWorker(lambda: task(config), config["INTERVAL"], name)
+
+    return ProcessSingleton(factory)
@@ -9,29 +9,112 @@ const getCookie = (name) => {
   }
 };
 const csrftoken = getCookie('csrftoken');
+const likeBatchUrl = document.currentScript.dataset.likeBatchUrl;
+const eventsUrl = document.currentScript.dataset.eventsUrl;
 
+// Clicks are applied to the page immediately and sent in one batch once the user stops clicking,
+// so toggling a button several times only sends its final state.
+const LIKE_DEBOUNCE_MS = 500;
+const pendingLikes = new Map();
+let likeTimer = null;
 
-const data = {
-  method: "POST",
-  headers: {
-    "Content-Type": "application/json",
-    "X-CSRFToken": csrftoken,
-  },
-}
-const response = await fetch(url, data);
-const tweet_data = await response.json();
-changeStyle(tweet_data, tweet);
-
-
-if (tweet_data.is_liked) {
-  unlike_url = `/tweets/${tweet_data.tweet_id}/unlike/`
-  selector.setAttribute('data-url', unlike_url);
-  selector.innerHTML = "いいね解除";
-  console.log(tweet_data.liked_count)
-  count.innerHTML = `いいね数 ${tweet_data.liked_count}`;
-} else {
-  like_url = `/tweets/${tweet_data.tweet_id}/like/`
-  selector.setAttribute('data-url', like_url);
-  selector.innerHTML = "いいね";
-  count.innerHTML = `いいね数 ${tweet_data.liked_count}`;
+const renderCount = (tweetId, likedCount) => {
+  document.getElementById(`count_${tweetId}`).innerHTML = `いいね数 ${likedCount}`;
+};
+
+const renderLike = (tweetId, isLiked, likedCount) => {
+  const button = document.querySelector(`.like-button[data-tweet-id="${tweetId}"]`);
+  button.dataset.liked = isLiked;
+  button.innerHTML = isLiked ? "いいね解除" : "いいね";
+  if (likedCount !== undefined) {
+    renderCount(tweetId, likedCount);
+  }
+};
+
+const flushLikes = async () => {
+  clearTimeout(likeTimer);
+  likeTimer = null;
+  if (pendingLikes.size === 0) {
+    return;
+  }
+  const likes = Array.from(pendingLikes, ([tweet_id, liked]) => ({ tweet_id, liked }));
+  pendingLikes.clear();
+  const response = await fetch(likeBatchUrl, {
+    method: "POST",
+    headers: {
+      "Content-Type": "application/json",
+      "X-CSRFToken": csrftoken,
+    },
+    body: JSON.stringify({ likes }),
+    keepalive: true,
+  });
+  if (!response.ok) {
+    return;
+  }
+  const data = await response.json();
+  for (const result of data.results) {
+    // Leave buttons that were toggled again while the request was in flight to the next batch.
+    if (!pendingLikes.has(result.tweet_id)) {
+      renderLike(result.tweet_id, result.is_liked, result.liked_count);
+    }
+  }
+};
+
+document.addEventListener("click", (event) => {
+  const button = event.target.closest(".like-button");
+  if (!button) {
+    return;
+  }
+  const tweetId = Number(button.dataset.tweetId);
+  const isLiked = button.dataset.liked !== "true";
+  pendingLikes.set(tweetId, isLiked);
+  renderLike(tweetId, isLiked);
+  clearTimeout(likeTimer);
+  likeTimer = setTimeout(flushLikes, LIKE_DEBOUNCE_MS);
+});
+
+window.addEventListener("pagehide", flushLikes);
+
+// Like counts of the tweets on the page and the number of new tweets in the timeline are kept up to date
+// with a long poll, which the server answers as soon as one of them changes.
+const EVENTS_RETRY_MS = 5000;
+const newTweetsNotice = document.getElementById("new-tweets");
+let newTweetCount = 0;
+
+const pollEvents = async () => {
+  let since = null;
+  for (;;) {
+    const tweetIds = Array.from(document.querySelectorAll(".like-button"), (button) => button.dataset.tweetId);
+    const params = new URLSearchParams({ tweets: tweetIds.join(",") });
+    if (since !== null) {
+      params.set("since", since);
+    }
+    try {
+      const response = await fetch(`${eventsUrl}?${params}`);
+      if (!response.ok) {
+        throw new Error(`events: ${response.status}`);
+      }
+      const data = await response.json();
+      // After a reset, e.g. a server restart, events were missed: start over without since, which answers
+      // with the current counts of the tweets on the page.
+      since = data.reset ? null : data.last_id;
+      for (const like of data.likes) {
+        // The user's own toggles that are not sent yet win over counts from the server.
+        if (!pendingLikes.has(like.tweet_id)) {
+          renderCount(like.tweet_id, like.liked_count);
+        }
+      }
+      if (newTweetsNotice && data.new_tweets) {
+        newTweetCount += data.new_tweets;
+        newTweetsNotice.querySelector("a").innerHTML = `新しいツイートが${newTweetCount}件あります`;
+        newTweetsNotice.hidden = false;
+      }
+    } catch (error) {
+      await new Promise((resolve) => setTimeout(resolve, EVENTS_RETRY_MS));
+    }
+  }
+};
+
+if (eventsUrl) {
+  pollEvents();
 }
@@ -1,6 +1,8 @@
 from django.contrib import admin
 
-from .models import Like, Tweet
+from .models import Like, LikeCountShard, TimelineEntry, Tweet
 
 admin.site.register(Tweet)
 admin.site.register(Like)
+admin.site.register(LikeCountShard)
+admin.site.register(TimelineEntry)
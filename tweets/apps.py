@@ -4,3 +4,6 @@ from django.apps import AppConfig
 class TweetsConfig(AppConfig):
     default_auto_field = "django.db.models.BigAutoField"
     name = "tweets"
+
+    def ready(self):
+        from . import search  # noqa: F401
@@ -0,0 +1,235 @@
+import json
+import logging
+import os
+import threading
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from mysite.workers import PeriodicWorker, ProcessSingleton
+
+from .models import Like
+from .services import set_like_states
+
+logger = logging.getLogger(__name__)
+
+
+class LikeBuffer:
+    """
+    Write-behind buffer for like toggles.
+
+    ``record`` only remembers the desired liked state of a (user, tweet) pair and answers with the stored like
+    count plus the pending delta. A background thread applies the buffered states every ``flush_interval``
+    seconds through ``set_like_states``, so a burst of likes on one tweet becomes a few batched writes.
+
+    With a ``journal_path`` every toggle is also appended to a file before it is acknowledged, and entries left
+    there by a crash are applied when the buffer starts. Without it, toggles not flushed yet are lost if the
+    process dies; ``stop`` flushes them on a graceful shutdown.
+    """
+
+    def __init__(self, flush_interval=1.0, max_pending=10000, journal_path=None, fsync=False):
+        self.flush_interval = flush_interval
+        self.max_pending = max_pending
+        self.journal_path = journal_path
+        self.fsync = fsync
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._pending = {}
+        self._flushing = {}
+        self._deltas = Counter()
+        self._flushing_deltas = Counter()
+        # Incremented by every recorded toggle, so pages can tell that buffered state changed.
+        self.generation = 0
+        self._journal = None
+        self._worker = PeriodicWorker(self.flush, flush_interval, "like-buffer-flusher")
+
+    def start(self):
+        if self.journal_path:
+            self._replay_journal()
+            self._journal = open(self.journal_path, "a")
+        self._worker.start()
+
+    def stop(self):
+        """Stop the flusher thread and flush everything still buffered."""
+        self._worker.stop()
+        self.flush()
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def record(self, user_id, tweet, liked):
+        """Buffer ``liked`` as the desired state of ``user_id``'s like on ``tweet``; return the new like count."""
+        key = (user_id, tweet.pk)
+        with self._lock:
+            was_liked = self._pending.get(key, self._flushing.get(key))
+        if was_liked is None:
+            was_liked = Like.objects.filter(user_id=user_id, tweet_id=tweet.pk).exists()
+        with self._lock:
+            was_liked = self._pending.get(key, self._flushing.get(key, was_liked))
+            self._write_journal(user_id, tweet.pk, liked)
+            self._pending[key] = liked
+            self._deltas[tweet.pk] += int(liked) - int(was_liked)
+            self.generation += 1
+            count = tweet.like_count + self._deltas[tweet.pk] + self._flushing_deltas[tweet.pk]
+            if len(self._pending) >= self.max_pending:
+                self._worker.wake()
+        return max(count, 0)
+
+    def pending_states(self, user_id, tweet_ids):
+        """Return ``{tweet id: liked}`` for the toggles of ``user_id`` on ``tweet_ids`` that are not flushed yet."""
+        with self._lock:
+            return {
+                tweet_id: self._pending[(user_id, tweet_id)]
+                for tweet_id in tweet_ids
+                if (user_id, tweet_id) in self._pending
+            }
+
+    def flush(self):
+        """Write all buffered toggles to the database. Return the number of toggles written."""
+        with self._flush_lock:
+            with self._lock:
+                pending = self._flushing = self._pending
+                self._pending = {}
+                self._flushing_deltas, self._deltas = self._deltas, Counter()
+                self._rotate_journal()
+            if not pending:
+                self._remove_flushing_journal()
+                return 0
+            by_user = defaultdict(dict)
+            for (user_id, tweet_id), liked in pending.items():
+                by_user[user_id][tweet_id] = liked
+            try:
+                written, failed = self._apply(by_user)
+                stored = self._stored_likes(failed)
+            except Exception:
+                with self._lock:
+                    # Keep toggles made since the swap; they are newer than the ones that failed to flush.
+                    self._pending = {**pending, **self._pending}
+                    self._deltas.update(self._flushing_deltas)
+                    self._flushing, self._flushing_deltas = {}, Counter()
+                raise
+            with self._lock:
+                self._restore(failed, stored)
+                self._flushing, self._flushing_deltas = {}, Counter()
+            self._remove_flushing_journal()
+            return written
+
+    def _apply(self, by_user):
+        """
+        Write ``{user id: {tweet id: liked}}`` one user at a time, so that one user's failure does not hold back
+        the others. Return the number of toggles written and the states of the users whose write failed.
+
+        States of users that no longer exist or are inactive, such as accounts being deleted, are dropped, as are
+        those of tweets that no longer exist, which set_like_states ignores.
+        """
+        User = get_user_model()
+        active = set(User.objects.filter(pk__in=by_user, is_active=True).values_list("pk", flat=True))
+        written, failed = 0, {}
+        for user_id, states in by_user.items():
+            if user_id not in active:
+                logger.warning("Dropped %d buffered likes of inactive or deleted user %s.", len(states), user_id)
+                continue
+            try:
+                set_like_states(User(pk=user_id), states)
+            except Exception:
+                logger.exception("Failed to write buffered likes of user %s; retrying on the next flush.", user_id)
+                failed[user_id] = states
+            else:
+                written += len(states)
+        return written, failed
+
+    def _stored_likes(self, by_user):
+        """Return the (user id, tweet id) pairs among ``by_user``'s states that are liked in the database."""
+        stored = set()
+        for user_id, states in by_user.items():
+            liked = Like.objects.filter(user_id=user_id, tweet_id__in=states).values_list("tweet_id", flat=True)
+            stored.update((user_id, tweet_id) for tweet_id in liked)
+        return stored
+
+    def _restore(self, by_user, stored):
+        """Buffer again the states that failed to flush. Must be called with ``_lock`` held."""
+        for user_id, states in by_user.items():
+            for tweet_id, liked in states.items():
+                key = (user_id, tweet_id)
+                # A toggle made since the swap is newer and its delta already counts from ``liked``.
+                if key not in self._pending:
+                    self._write_journal(user_id, tweet_id, liked)
+                    self._pending[key] = liked
+                self._deltas[tweet_id] += int(liked) - int(key in stored)
+
+    @property
+    def _flushing_journal_path(self):
+        return f"{self.journal_path}.flushing"
+
+    def _write_journal(self, user_id, tweet_id, liked):
+        if self._journal is None:
+            return
+        self._journal.write(json.dumps([user_id, tweet_id, liked]) + "\n")
+        self._journal.flush()
+        if self.fsync:
+            os.fsync(self._journal.fileno())
+
+    def _rotate_journal(self):
+        """Move the journal aside for the flush in progress and start a new one for later toggles."""
+        if self._journal is None:
+            return
+        self._journal.close()
+        with open(self.journal_path) as current, open(self._flushing_journal_path, "a") as flushing:
+            flushing.write(current.read())
+        self._journal = open(self.journal_path, "w")
+
+    def _remove_flushing_journal(self):
+        if self.journal_path and os.path.exists(self._flushing_journal_path):
+            os.remove(self._flushing_journal_path)
+
+    def _replay_journal(self):
+        states = defaultdict(dict)
+        for path in (self._flushing_journal_path, self.journal_path):
+            if os.path.exists(path):
+                with open(path) as journal:
+                    for line in journal:
+                        try:
+                            user_id, tweet_id, liked = json.loads(line)
+                        except ValueError:
+                            continue  # A line cut short by a crash.
+                        states[user_id][tweet_id] = liked
+        _, failed = self._apply(states)
+        if failed:
+            # The journal is kept, so that these states survive another crash until a flush writes them.
+            self._restore(failed, self._stored_likes(failed))
+            return
+        for path in (self._flushing_journal_path, self.journal_path):
+            if os.path.exists(path):
+                os.remove(path)
+
+
+def _create_buffer():
+    config = settings.TWEETS_LIKE_WRITE_BEHIND
+    if not config["ENABLED"]:
+        return None
+    return LikeBuffer(
+        flush_interval=config["FLUSH_INTERVAL"],
+        max_pending=config["MAX_PENDING"],
+        journal_path=config["JOURNAL"],
+        fsync=config["FSYNC"],
+    )
+
+
+_buffer = ProcessSingleton(_create_buffer)
+
+
+def get_like_buffer():
+    """Return the process-wide like buffer, or None when TWEETS_LIKE_WRITE_BEHIND is not enabled."""
+    return _buffer.get()
+
+
+def pending_likes_version():
+    """Return a value that changes whenever buffered like toggles change, or None without write-behind."""
+    buffer = get_like_buffer()
+    return None if buffer is None else buffer.generation
+
+
+def stop_like_buffer():
+    """Flush and discard the process-wide like buffer, if one was started."""
+    _buffer.stop()
@@ -0,0 +1,101 @@
+import asyncio
+import threading
+from collections import deque
+
+from django.conf import settings
+from django.db import transaction
+
+
+class EventBroker:
+    """
+    In-process publish/subscribe for live updates.
+
+    Events are numbered and kept in a ring buffer of the last ``buffer_size`` events, so a client that polls
+    with the last id it saw receives everything published since, without the broker tracking subscribers.
+    ``publish`` may be called from any thread; waiters on an event loop are woken with
+    ``call_soon_threadsafe``.
+
+    Only processes that share this broker see each other's events; with several server processes a client
+    still gets the updates published by the process it polls.
+    """
+
+    def __init__(self, buffer_size=1000):
+        self._events = deque(maxlen=buffer_size)
+        self._last_id = 0
+        self._lock = threading.Lock()
+        self._waiters = set()
+
+    @property
+    def last_id(self):
+        return self._last_id
+
+    def publish(self, kind, data):
+        """Append an event and wake everyone waiting for one. Return its id."""
+        with self._lock:
+            self._last_id += 1
+            self._events.append((self._last_id, kind, data))
+            waiters, self._waiters = self._waiters, set()
+        for loop, event in waiters:
+            try:
+                loop.call_soon_threadsafe(event.set)
+            except RuntimeError:
+                # The loop of an abandoned request is already closed.
+                pass
+        return self._last_id
+
+    def events_since(self, last_id):
+        """
+        Return ``(events, complete)`` for the events published after ``last_id``.
+
+        ``complete`` is False when some of those events already fell out of the ring buffer, or when ``last_id``
+        was handed out before the process restarted.
+        """
+        with self._lock:
+            events = [event for event in self._events if event[0] > last_id]
+            complete = len(events) == self._last_id - last_id
+        return events, complete
+
+    async def wait(self, last_id, timeout):
+        """Wait up to ``timeout`` seconds for events after ``last_id`` and return them like ``events_since``."""
+        event = asyncio.Event()
+        waiter = (asyncio.get_running_loop(), event)
+        with self._lock:
+            waiting = self._last_id == last_id
+            if waiting:
+                self._waiters.add(waiter)
+        if waiting:
+            try:
+                await asyncio.wait_for(event.wait(), timeout)
+            except asyncio.TimeoutError:
+                pass
+            finally:
+                with self._lock:
+                    self._waiters.discard(waiter)
+        return self.events_since(last_id)
+
+
+_broker = None
+_broker_lock = threading.Lock()
+
+
+def get_event_broker():
+    """Return the process-wide event broker."""
+    global _broker
+    with _broker_lock:
+        if _broker is None:
+            _broker = EventBroker(buffer_size=settings.TWEETS_EVENTS_BUFFER_SIZE)
+        return _broker
+
+
+def publish_like_counts(counts):
+    """Publish ``{tweet id: like count}`` once the current transaction commits."""
+    broker = get_event_broker()
+    for tweet_id, like_count in counts.items():
+        transaction.on_commit(lambda t=tweet_id, c=like_count: broker.publish("like", {"tweet_id": t, "count": c}))
+
+
+def publish_new_tweet(tweet):
+    """Publish that ``tweet`` was posted once the current transaction commits."""
+    broker = get_event_broker()
+    data = {"tweet_id": tweet.pk, "author_id": tweet.user_id}
+    transaction.on_commit(lambda: broker.publish("tweet", data))
@@ -0,0 +1,29 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from tweets.models import Tweet
+from tweets.tags import index_tweets
+
+
+class Command(BaseCommand):
+    help = "Extract the hashtags and mentions of existing tweets into the tag and mention index."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Number of tweets indexed per transaction.")
+
+    def handle(self, *args, **options):
+        indexed = 0
+        last_pk = 0
+        while True:
+            with transaction.atomic():
+                tweets = list(
+                    Tweet.objects.filter(pk__gt=last_pk)
+                    .order_by("pk")
+                    .only("pk", "content", "created_at")[: options["batch_size"]]
+                )
+                if not tweets:
+                    break
+                last_pk = tweets[-1].pk
+                index_tweets(tweets)
+            indexed += len(tweets)
+        self.stdout.write(f"Indexed the hashtags and mentions of {indexed} tweet(s).")
@@ -0,0 +1,15 @@
+from django.core.management.base import BaseCommand
+
+from tweets.purge import purge_deleted_tweets
+
+
+class Command(BaseCommand):
+    help = "Remove deleted tweets with their likes, timeline entries and index rows."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, help="Number of rows deleted per transaction.")
+        parser.add_argument("--limit", type=int, help="Stop after purging this many tweets.")
+
+    def handle(self, *args, **options):
+        purged = purge_deleted_tweets(options["batch_size"], options["limit"])
+        self.stdout.write(f"Purged {purged} tweet(s).")
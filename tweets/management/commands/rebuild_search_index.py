@@ -0,0 +1,13 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from tweets.search import create_search_index, has_search_index
+
+
+class Command(BaseCommand):
+    help = "Recreate the full-text search index of tweets and its triggers, and reindex every tweet."
+
+    def handle(self, *args, **options):
+        if not has_search_index():
+            raise CommandError("Full-text search needs SQLite; other databases search without an index.")
+        create_search_index()
+        self.stdout.write("Rebuilt the search index.")
@@ -0,0 +1,25 @@
+from django.contrib.auth import get_user_model
+from django.core.management.base import BaseCommand
+from django.db import transaction
+
+from tweets.timeline import rebuild_timeline
+
+User = get_user_model()
+
+
+class Command(BaseCommand):
+    help = "Rebuild materialized home timelines from tweets and the follow graph."
+
+    def add_arguments(self, parser):
+        parser.add_argument("usernames", nargs="*", help="Only rebuild the timelines of these users.")
+
+    def handle(self, *args, **options):
+        users = User.objects.order_by("pk")
+        if options["usernames"]:
+            users = users.filter(username__in=options["usernames"])
+        rebuilt = 0
+        for user in users.iterator():
+            with transaction.atomic():
+                rebuild_timeline(user)
+            rebuilt += 1
+        self.stdout.write(f"Rebuilt {rebuilt} timeline(s).")
@@ -0,0 +1,66 @@
+from django.core.management.base import BaseCommand
+from django.db import transaction
+from django.db.models import Count, F, Sum, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from tweets.models import Like, LikeCountShard, Tweet
+
+
+class Command(BaseCommand):
+    help = "Recompute Tweet.like_count from the Like table and fold pending counter shards."
+
+    def add_arguments(self, parser):
+        parser.add_argument("--batch-size", type=int, default=1000, help="Number of tweets checked per transaction.")
+        parser.add_argument(
+            "--shards-only",
+            action="store_true",
+            help="Only fold pending counter shards into Tweet.like_count without recounting likes.",
+        )
+
+    def handle(self, *args, **options):
+        if options["shards_only"]:
+            folded = self.fold_shards()
+            self.stdout.write(f"Folded counter shards of {folded} tweet(s).")
+            return
+        checked = fixed = 0
+        last_pk = 0
+        while True:
+            with transaction.atomic():
+                stored = dict(
+                    Tweet.objects.filter(pk__gt=last_pk)
+                    .order_by("pk")
+                    .values_list("pk", "like_count")[: options["batch_size"]]
+                )
+                if not stored:
+                    break
+                last_pk = max(stored)
+                actual = dict(
+                    Like.objects.filter(tweet_id__in=stored)
+                    .values("tweet_id")
+                    .annotate(n=Count("pk"))
+                    .values_list("tweet_id", "n")
+                )
+                now = timezone.now()
+                drifted = [
+                    Tweet(pk=pk, like_count=actual.get(pk, 0), updated_at=now)
+                    for pk in stored
+                    if stored[pk] != actual.get(pk, 0)
+                ]
+                Tweet.objects.bulk_update(drifted, ["like_count", "updated_at"])
+                LikeCountShard.objects.filter(tweet_id__in=stored).delete()
+            checked += len(stored)
+            fixed += len(drifted)
+        self.stdout.write(f"Checked {checked} tweet(s), fixed {fixed} drifted like count(s).")
+
+    def fold_shards(self):
+        folded = 0
+        with transaction.atomic():
+            pending = (
+                LikeCountShard.objects.values("tweet_id").annotate(total=Sum("count")).values_list("tweet_id", "total")
+            )
+            for tweet_id, total in pending:
+                Tweet.objects.filter(pk=tweet_id).update(like_count=Greatest(F("like_count") + total, Value(0)))
+                folded += 1
+            LikeCountShard.objects.all().delete()
+        return folded
@@ -0,0 +1,49 @@
+# Generated by Django 4.1.13 on 2026-10-17 02:09
+
+from django.db import migrations, models
+import django.db.models.deletion
+from django.db.models import Count, OuterRef, Subquery
+from django.db.models.functions import Coalesce
+
+
+def backfill_like_count(apps, schema_editor):
+    Like = apps.get_model("tweets", "Like")
+    Tweet = apps.get_model("tweets", "Tweet")
+    likes = Like.objects.filter(tweet=OuterRef("pk")).values("tweet").annotate(n=Count("pk")).values("n")
+    Tweet.objects.update(like_count=Coalesce(Subquery(likes), 0))
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tweets", "0002_like_like_like_unique"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tweet",
+            name="like_count",
+            field=models.PositiveIntegerField(default=0),
+        ),
+        migrations.RunPython(backfill_like_count, migrations.RunPython.noop),
+        migrations.CreateModel(
+            name="LikeCountShard",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("shard", models.PositiveSmallIntegerField()),
+                ("count", models.IntegerField(default=0)),
+                (
+                    "tweet",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="like_count_shards",
+                        to="tweets.tweet",
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddConstraint(
+            model_name="likecountshard",
+            constraint=models.UniqueConstraint(fields=("tweet", "shard"), name="like_count_shard_unique"),
+        ),
+    ]
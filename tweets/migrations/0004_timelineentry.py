@@ -0,0 +1,73 @@
+# Generated by Django 4.1.13 on 2026-10-17 02:12
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+def populate_timelines(apps, schema_editor):
+    FriendShip = apps.get_model("accounts", "FriendShip")
+    TimelineEntry = apps.get_model("tweets", "TimelineEntry")
+    Tweet = apps.get_model("tweets", "Tweet")
+    User = apps.get_model(*settings.AUTH_USER_MODEL.split("."))
+    for user in User.objects.iterator():
+        authors = [user.pk, *FriendShip.objects.filter(follower=user).values_list("following_id", flat=True)]
+        tweets = Tweet.objects.filter(user_id__in=authors).order_by("-created_at", "-id")[:100]
+        TimelineEntry.objects.bulk_create(
+            [
+                TimelineEntry(owner=user, tweet=tweet, author_id=tweet.user_id, created_at=tweet.created_at)
+                for tweet in tweets
+            ]
+        )
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("accounts", "0003_friendship_unique_friendship"),
+        ("tweets", "0003_tweet_like_count_likecountshard"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="TimelineEntry",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("created_at", models.DateTimeField()),
+                (
+                    "author",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="+", to=settings.AUTH_USER_MODEL
+                    ),
+                ),
+                (
+                    "owner",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="timeline_entries",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+                (
+                    "tweet",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="timeline_entries", to="tweets.tweet"
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="timelineentry",
+            index=models.Index(fields=["owner", "created_at", "tweet"], name="timeline_owner_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="timelineentry",
+            index=models.Index(fields=["owner", "author"], name="timeline_owner_author_idx"),
+        ),
+        migrations.AddConstraint(
+            model_name="timelineentry",
+            constraint=models.UniqueConstraint(fields=("owner", "tweet"), name="timeline_entry_unique"),
+        ),
+        migrations.RunPython(populate_timelines, migrations.RunPython.noop),
+    ]
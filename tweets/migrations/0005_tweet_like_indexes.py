@@ -0,0 +1,21 @@
+# Generated by Django 4.1.13 on 2026-10-17 02:17
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tweets", "0004_timelineentry"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="like",
+            index=models.Index(fields=["user", "created_at"], name="like_user_created_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="tweet",
+            index=models.Index(fields=["user", "created_at"], name="tweet_user_created_idx"),
+        ),
+    ]
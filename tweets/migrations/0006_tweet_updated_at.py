@@ -0,0 +1,18 @@
+# Generated by Django 4.1.13 on 2026-10-17 02:30
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tweets", "0005_tweet_like_indexes"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tweet",
+            name="updated_at",
+            field=models.DateTimeField(auto_now=True),
+        ),
+    ]
@@ -0,0 +1,53 @@
+# Generated by Django 4.1.13 on 2026-10-17 09:40
+
+from django.db import migrations
+
+# A copy of the DDL in tweets.search as of this migration, so that later changes there do not change it.
+CREATE_SEARCH_INDEX = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS tweets_tweet_search
+        USING fts5(content, content='tweets_tweet', content_rowid='id', tokenize='trigram')""",
+    """CREATE TRIGGER IF NOT EXISTS tweets_tweet_search_insert AFTER INSERT ON tweets_tweet BEGIN
+        INSERT INTO tweets_tweet_search(rowid, content) VALUES (new.id, new.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tweets_tweet_search_delete AFTER DELETE ON tweets_tweet BEGIN
+        INSERT INTO tweets_tweet_search(tweets_tweet_search, rowid, content) VALUES ('delete', old.id, old.content);
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tweets_tweet_search_update AFTER UPDATE OF content ON tweets_tweet BEGIN
+        INSERT INTO tweets_tweet_search(tweets_tweet_search, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO tweets_tweet_search(rowid, content) VALUES (new.id, new.content);
+    END""",
+    "INSERT INTO tweets_tweet_search(tweets_tweet_search) VALUES ('rebuild')",
+]
+DROP_SEARCH_INDEX = [
+    "DROP TRIGGER IF EXISTS tweets_tweet_search_insert",
+    "DROP TRIGGER IF EXISTS tweets_tweet_search_delete",
+    "DROP TRIGGER IF EXISTS tweets_tweet_search_update",
+    "DROP TABLE IF EXISTS tweets_tweet_search",
+]
+
+
+def _execute(schema_editor, statements):
+    # Other databases search without an index.
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for sql in statements:
+        schema_editor.execute(sql)
+
+
+def forwards(apps, schema_editor):
+    _execute(schema_editor, CREATE_SEARCH_INDEX)
+
+
+def backwards(apps, schema_editor):
+    _execute(schema_editor, DROP_SEARCH_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tweets", "0006_tweet_updated_at"),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
@@ -0,0 +1,67 @@
+# Generated by Django 4.1.13 on 2026-10-17 02:59
+
+from django.conf import settings
+from django.db import migrations, models
+import django.db.models.deletion
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        ("tweets", "0007_tweet_search"),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="Mention",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("created_at", models.DateTimeField()),
+                (
+                    "tweet",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="mentions", to="tweets.tweet"
+                    ),
+                ),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        related_name="mentions",
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+        ),
+        migrations.CreateModel(
+            name="Hashtag",
+            fields=[
+                ("id", models.BigAutoField(auto_created=True, primary_key=True, serialize=False, verbose_name="ID")),
+                ("tag", models.CharField(max_length=200)),
+                ("created_at", models.DateTimeField()),
+                (
+                    "tweet",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE, related_name="hashtags", to="tweets.tweet"
+                    ),
+                ),
+            ],
+        ),
+        migrations.AddIndex(
+            model_name="mention",
+            index=models.Index(fields=["user", "created_at", "tweet"], name="mention_user_created_idx"),
+        ),
+        migrations.AddConstraint(
+            model_name="mention",
+            constraint=models.UniqueConstraint(fields=("tweet", "user"), name="mention_unique"),
+        ),
+        migrations.AddIndex(
+            model_name="hashtag",
+            index=models.Index(fields=["tag", "created_at", "tweet"], name="hashtag_tag_created_idx"),
+        ),
+        migrations.AddConstraint(
+            model_name="hashtag",
+            constraint=models.UniqueConstraint(fields=("tweet", "tag"), name="hashtag_unique"),
+        ),
+    ]
@@ -0,0 +1,24 @@
+# Generated by Django 4.1.13 on 2026-10-17 03:37
+
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tweets", "0008_hashtag_mention"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="tweet",
+            name="deleted_at",
+            field=models.DateTimeField(blank=True, null=True),
+        ),
+        migrations.AddIndex(
+            model_name="tweet",
+            index=models.Index(
+                condition=models.Q(("deleted_at__isnull", False)), fields=["deleted_at"], name="tweet_deleted_idx"
+            ),
+        ),
+    ]
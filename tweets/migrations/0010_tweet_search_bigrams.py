@@ -0,0 +1,65 @@
+# Generated by Django 4.1.13 on 2026-10-17 11:20
+
+import re
+
+from django.db import migrations
+
+# A copy of the DDL in tweets.search as of this migration, so that later changes there do not change it. The
+# triggers call tweets_bigrams(), which tweets.search registers on every connection.
+CREATE_BIGRAM_INDEX = [
+    """CREATE VIRTUAL TABLE IF NOT EXISTS tweets_tweet_search_bigrams
+        USING fts5(bigrams, content='', tokenize='unicode61 remove_diacritics 0')""",
+    """CREATE TRIGGER IF NOT EXISTS tweets_tweet_search_bigrams_insert AFTER INSERT ON tweets_tweet BEGIN
+        INSERT INTO tweets_tweet_search_bigrams(rowid, bigrams) VALUES (new.id, tweets_bigrams(new.content));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tweets_tweet_search_bigrams_delete AFTER DELETE ON tweets_tweet BEGIN
+        INSERT INTO tweets_tweet_search_bigrams(tweets_tweet_search_bigrams, rowid, bigrams)
+            VALUES ('delete', old.id, tweets_bigrams(old.content));
+    END""",
+    """CREATE TRIGGER IF NOT EXISTS tweets_tweet_search_bigrams_update AFTER UPDATE OF content ON tweets_tweet BEGIN
+        INSERT INTO tweets_tweet_search_bigrams(tweets_tweet_search_bigrams, rowid, bigrams)
+            VALUES ('delete', old.id, tweets_bigrams(old.content));
+        INSERT INTO tweets_tweet_search_bigrams(rowid, bigrams) VALUES (new.id, tweets_bigrams(new.content));
+    END""",
+]
+DROP_BIGRAM_INDEX = [
+    "DROP TRIGGER IF EXISTS tweets_tweet_search_bigrams_insert",
+    "DROP TRIGGER IF EXISTS tweets_tweet_search_bigrams_delete",
+    "DROP TRIGGER IF EXISTS tweets_tweet_search_bigrams_update",
+    "DROP TABLE IF EXISTS tweets_tweet_search_bigrams",
+]
+WORD = re.compile(r"[^\W_]+")
+
+
+def bigrams(text):
+    return " ".join(word[i : i + 2] for word in WORD.findall(text or "") for i in range(len(word) - 1))
+
+
+def forwards(apps, schema_editor):
+    # Other databases search without an index.
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for sql in CREATE_BIGRAM_INDEX:
+        schema_editor.execute(sql)
+    with schema_editor.connection.cursor() as cursor:
+        cursor.execute("SELECT id, content FROM tweets_tweet")
+        rows = [(pk, bigrams(content)) for pk, content in cursor.fetchall()]
+        cursor.executemany("INSERT INTO tweets_tweet_search_bigrams(rowid, bigrams) VALUES (%s, %s)", rows)
+
+
+def backwards(apps, schema_editor):
+    if schema_editor.connection.vendor != "sqlite":
+        return
+    for sql in DROP_BIGRAM_INDEX:
+        schema_editor.execute(sql)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("tweets", "0009_tweet_deleted_at"),
+    ]
+
+    operations = [
+        migrations.RunPython(forwards, backwards),
+    ]
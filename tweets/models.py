@@ -2,10 +2,32 @@ from django.conf import settings
 from django.db import models
 
 
+class LiveTweetManager(models.Manager):
+    """Tweets that have not been deleted. Deleted tweets stay in ``Tweet.all_objects`` until they are purged."""
+
+    def get_queryset(self):
+        return super().get_queryset().filter(deleted_at__isnull=True)
+
+
 class Tweet(models.Model):
     user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     content = models.TextField(max_length=200)
     created_at = models.DateTimeField(auto_now_add=True)
+    updated_at = models.DateTimeField(auto_now=True)
+    like_count = models.PositiveIntegerField(default=0)
+    # Set by tweets.services.delete_tweet; tweets.purge removes the row and everything referencing it later.
+    deleted_at = models.DateTimeField(null=True, blank=True)
+
+    objects = LiveTweetManager()
+    all_objects = models.Manager()
+
+    class Meta:
+        indexes = [
+            models.Index(fields=["user", "created_at"], name="tweet_user_created_idx"),
+            models.Index(
+                fields=["deleted_at"], name="tweet_deleted_idx", condition=models.Q(deleted_at__isnull=False)
+            ),
+        ]
 
     def __str__(self):
         return self.content
@@ -20,3 +42,69 @@ class Like(models.Model):
         constraints = [
             models.UniqueConstraint(fields=["tweet", "user"], name="like_unique"),
         ]
+        indexes = [
+            models.Index(fields=["user", "created_at"], name="like_user_created_idx"),
+        ]
+
+
+class LikeCountShard(models.Model):
+    """Pending like count delta for a hot tweet, folded into ``Tweet.like_count`` later."""
+
+    tweet = models.ForeignKey("Tweet", on_delete=models.CASCADE, related_name="like_count_shards")
+    shard = models.PositiveSmallIntegerField()
+    count = models.IntegerField(default=0)
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["tweet", "shard"], name="like_count_shard_unique"),
+        ]
+
+
+class TimelineEntry(models.Model):
+    """A tweet delivered to the home timeline of ``owner``."""
+
+    owner = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="timeline_entries")
+    tweet = models.ForeignKey("Tweet", on_delete=models.CASCADE, related_name="timeline_entries")
+    author = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="+")
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["owner", "tweet"], name="timeline_entry_unique"),
+        ]
+        indexes = [
+            models.Index(fields=["owner", "created_at", "tweet"], name="timeline_owner_created_idx"),
+            models.Index(fields=["owner", "author"], name="timeline_owner_author_idx"),
+        ]
+
+
+class Hashtag(models.Model):
+    """A hashtag of ``tweet``, normalized, with the tweet's creation time so tag pages are range scans."""
+
+    tweet = models.ForeignKey("Tweet", on_delete=models.CASCADE, related_name="hashtags")
+    tag = models.CharField(max_length=200)
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["tweet", "tag"], name="hashtag_unique"),
+        ]
+        indexes = [
+            models.Index(fields=["tag", "created_at", "tweet"], name="hashtag_tag_created_idx"),
+        ]
+
+
+class Mention(models.Model):
+    """A mention of ``user`` in ``tweet``, with the tweet's creation time so mention feeds are range scans."""
+
+    tweet = models.ForeignKey("Tweet", on_delete=models.CASCADE, related_name="mentions")
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE, related_name="mentions")
+    created_at = models.DateTimeField()
+
+    class Meta:
+        constraints = [
+            models.UniqueConstraint(fields=["tweet", "user"], name="mention_unique"),
+        ]
+        indexes = [
+            models.Index(fields=["user", "created_at", "tweet"], name="mention_user_created_idx"),
+        ]
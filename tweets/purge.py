@@ -0,0 +1,84 @@
+from django.conf import settings
+from django.db import transaction
+
+from accounts.services import bulk_add_user_stats
+from mysite.workers import periodic_worker
+
+from .models import Hashtag, Like, LikeCountShard, Mention, TimelineEntry, Tweet
+
+# Rows referencing a tweet, removed before the tweet itself so that its final DELETE cascades to nothing.
+PURGED_MODELS = (Like, TimelineEntry, Hashtag, Mention, LikeCountShard)
+
+
+def purge_tweet_chunk(tweet_id, chunk_size):
+    """
+    Delete up to ``chunk_size`` rows referencing the deleted tweet ``tweet_id`` in one transaction, or the tweet
+    itself once nothing references it any more. Return the number of rows deleted, 0 when the tweet is gone.
+    """
+    with transaction.atomic():
+        for model in PURGED_MODELS:
+            rows = model.objects.filter(tweet_id=tweet_id)[:chunk_size]
+            if model is Like:
+                likes = list(rows.values_list("pk", "user_id"))
+                if likes:
+                    # Likers' counters were left alone by delete_tweet and drop as their likes go.
+                    bulk_add_user_stats([user_id for _, user_id in likes], likes_count=-1)
+                pks = [pk for pk, _ in likes]
+            else:
+                pks = list(rows.values_list("pk", flat=True))
+            if pks:
+                return model.objects.filter(pk__in=pks).delete()[0]
+        # Nothing references the tweet any more, so this does not cascade. Its trigger drops the search entry.
+        return Tweet.all_objects.filter(pk=tweet_id, deleted_at__isnull=False).delete()[0]
+
+
+def purge_deleted_tweets(chunk_size=None, limit=None):
+    """
+    Remove up to ``limit`` deleted tweets, oldest deletion first, and return how many were removed.
+
+    Likes, timeline entries, hashtags and mentions of each tweet are deleted ``chunk_size`` rows per
+    transaction, so that purging a viral tweet never holds the write lock for long. Tweets of accounts being
+    deleted are left to accounts.deletion, which purges them in its own batches.
+    """
+    chunk_size = chunk_size or settings.TWEETS_PURGE["CHUNK_SIZE"]
+    purged = 0
+    while limit is None or purged < limit:
+        tweet_id = (
+            Tweet.all_objects.filter(deleted_at__isnull=False)
+            .exclude(user__deletion__isnull=False)
+            .order_by("deleted_at")
+            .values_list("pk", flat=True)
+            .first()
+        )
+        if tweet_id is None:
+            break
+        while purge_tweet_chunk(tweet_id, chunk_size):
+            pass
+        purged += 1
+    return purged
+
+
+# Runs purge_deleted_tweets when woken after a deletion, and every INTERVAL seconds to pick up tweets deleted by
+# processes that stopped before purging them.
+_purger = periodic_worker("TWEETS_PURGE", lambda config: purge_deleted_tweets(config["CHUNK_SIZE"]), "tweet-purger")
+
+
+def get_purger():
+    """Return the process-wide purger, or None when TWEETS_PURGE is not enabled."""
+    return _purger.get()
+
+
+def stop_purger():
+    """Stop and discard the process-wide purger, if one was started."""
+    _purger.stop()
+
+
+def schedule_purge():
+    """Wake the purger once the current transaction commits."""
+
+    def wake():
+        purger = get_purger()
+        if purger is not None:
+            purger.wake()
+
+    transaction.on_commit(wake)
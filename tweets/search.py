@@ -0,0 +1,152 @@
+import re
+
+from django.conf import settings
+from django.db import connection
+from django.db.backends.signals import connection_created
+from django.dispatch import receiver
+
+from .models import Tweet
+
+SEARCH_TABLE = "tweets_tweet_search"
+BIGRAM_TABLE = "tweets_tweet_search_bigrams"
+
+# Runs of letters and digits, which the unicode61 tokenizer keeps together.
+_WORD = re.compile(r"[^\W_]+")
+
+
+def bigrams(text):
+    """Return every two-character run of each word of ``text``, separated by spaces."""
+    return " ".join(word[i : i + 2] for word in _WORD.findall(text or "") for i in range(len(word) - 1))
+
+
+@receiver(connection_created)
+def register_search_functions(sender, connection, **kwargs):
+    # The bigram triggers call tweets_bigrams(), so every connection writing tweets needs it.
+    if connection.vendor == "sqlite":
+        connection.connection.create_function("tweets_bigrams", 1, bigrams, deterministic=True)
+
+
+# The trigram tokenizer indexes every run of three characters, which suits Japanese text without word
+# boundaries. Two-character terms, common in Japanese, are looked up in a second, contentless table fed
+# with the bigrams of each tweet. Triggers keep both in step with tweets_tweet however rows are written or
+# deleted. Migrations 0007 and 0010 keep their own copies of this DDL; changes here reach existing
+# databases through the rebuild_search_index command or a new migration.
+CREATE_SEARCH_INDEX = [
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {SEARCH_TABLE}
+        USING fts5(content, content='tweets_tweet', content_rowid='id', tokenize='trigram')""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_insert AFTER INSERT ON tweets_tweet BEGIN
+        INSERT INTO {SEARCH_TABLE}(rowid, content) VALUES (new.id, new.content);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_delete AFTER DELETE ON tweets_tweet BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, content) VALUES ('delete', old.id, old.content);
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {SEARCH_TABLE}_update AFTER UPDATE OF content ON tweets_tweet BEGIN
+        INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}, rowid, content) VALUES ('delete', old.id, old.content);
+        INSERT INTO {SEARCH_TABLE}(rowid, content) VALUES (new.id, new.content);
+    END""",
+    f"""CREATE VIRTUAL TABLE IF NOT EXISTS {BIGRAM_TABLE}
+        USING fts5(bigrams, content='', tokenize='unicode61 remove_diacritics 0')""",
+    f"""CREATE TRIGGER IF NOT EXISTS {BIGRAM_TABLE}_insert AFTER INSERT ON tweets_tweet BEGIN
+        INSERT INTO {BIGRAM_TABLE}(rowid, bigrams) VALUES (new.id, tweets_bigrams(new.content));
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {BIGRAM_TABLE}_delete AFTER DELETE ON tweets_tweet BEGIN
+        INSERT INTO {BIGRAM_TABLE}({BIGRAM_TABLE}, rowid, bigrams)
+            VALUES ('delete', old.id, tweets_bigrams(old.content));
+    END""",
+    f"""CREATE TRIGGER IF NOT EXISTS {BIGRAM_TABLE}_update AFTER UPDATE OF content ON tweets_tweet BEGIN
+        INSERT INTO {BIGRAM_TABLE}({BIGRAM_TABLE}, rowid, bigrams)
+            VALUES ('delete', old.id, tweets_bigrams(old.content));
+        INSERT INTO {BIGRAM_TABLE}(rowid, bigrams) VALUES (new.id, tweets_bigrams(new.content));
+    END""",
+]
+REINDEX_SEARCH_INDEX = [
+    f"INSERT INTO {SEARCH_TABLE}({SEARCH_TABLE}) VALUES ('rebuild')",
+    f"INSERT INTO {BIGRAM_TABLE}({BIGRAM_TABLE}) VALUES ('delete-all')",
+    f"INSERT INTO {BIGRAM_TABLE}(rowid, bigrams) SELECT id, tweets_bigrams(content) FROM tweets_tweet",
+]
+DROP_SEARCH_INDEX = [
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_insert",
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_delete",
+    f"DROP TRIGGER IF EXISTS {SEARCH_TABLE}_update",
+    f"DROP TABLE IF EXISTS {SEARCH_TABLE}",
+    f"DROP TRIGGER IF EXISTS {BIGRAM_TABLE}_insert",
+    f"DROP TRIGGER IF EXISTS {BIGRAM_TABLE}_delete",
+    f"DROP TRIGGER IF EXISTS {BIGRAM_TABLE}_update",
+    f"DROP TABLE IF EXISTS {BIGRAM_TABLE}",
+]
+
+# Shorter terms cannot be looked up in a trigram index.
+MIN_INDEXED_LENGTH = 3
+
+
+def has_search_index(using=connection):
+    return using.vendor == "sqlite"
+
+
+def create_search_index(using=connection):
+    """Create the search table and its triggers if they are missing, and reindex every tweet."""
+    if not has_search_index(using):
+        return
+    with using.cursor() as cursor:
+        for sql in CREATE_SEARCH_INDEX + REINDEX_SEARCH_INDEX:
+            cursor.execute(sql)
+
+
+def drop_search_index(using=connection):
+    if not has_search_index(using):
+        return
+    with using.cursor() as cursor:
+        for sql in DROP_SEARCH_INDEX:
+            cursor.execute(sql)
+
+
+def _match_expression(terms):
+    return " AND ".join('"{}"'.format(term.replace('"', '""')) for term in terms)
+
+
+def _like_pattern(term):
+    escaped = term.replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_")
+    return f"%{escaped}%"
+
+
+def search_tweets(query, page=1):
+    """
+    Return ``(tweets, has_next)`` for the ``page``-th page of tweets containing every term of ``query``.
+
+    Terms of three or more characters are looked up in the trigram index, and two-character words in the
+    bigram index; tweets are ranked by bm25 on the first of them that has terms. Other terms, such as single
+    characters, only filter those matches. Queries made only of such terms, and databases other than SQLite,
+    fall back to scanning the newest TWEETS_SEARCH_SCAN_LIMIT tweets.
+    """
+    terms = query.split()
+    if not terms:
+        return [], False
+    page_size = settings.TWEETS_SEARCH_PAGE_SIZE
+    offset = (page - 1) * page_size
+    trigrams = [term for term in terms if len(term) >= MIN_INDEXED_LENGTH]
+    bigram_terms = [term for term in terms if len(term) == 2 and _WORD.fullmatch(term)]
+    if (trigrams or bigram_terms) and has_search_index():
+        # The remaining terms are checked with LIKE on the rows MATCH found.
+        other = [term for term in terms if term not in trigrams and term not in bigram_terms]
+        table = SEARCH_TABLE if trigrams else BIGRAM_TABLE
+        sql = f"SELECT {table}.rowid FROM {table} JOIN tweets_tweet ON tweets_tweet.id = {table}.rowid"
+        sql += f" WHERE {table} MATCH %s"
+        params = [_match_expression(trigrams or bigram_terms)]
+        if trigrams and bigram_terms:
+            sql += f" AND {table}.rowid IN (SELECT rowid FROM {BIGRAM_TABLE} WHERE {BIGRAM_TABLE} MATCH %s)"
+            params.append(_match_expression(bigram_terms))
+        sql += " AND tweets_tweet.content LIKE %s ESCAPE '\\'" * len(other)
+        sql += f" ORDER BY {table}.rank, {table}.rowid DESC LIMIT %s OFFSET %s"
+        with connection.cursor() as cursor:
+            cursor.execute(sql, [*params, *map(_like_pattern, other), page_size + 1, offset])
+            ids = [row[0] for row in cursor.fetchall()]
+        tweets = Tweet.objects.select_related("user").in_bulk(ids)
+        results = [tweets[pk] for pk in ids if pk in tweets]
+    else:
+        # Bounded by primary key, so that the scan stops after the newest tweets however many there are.
+        recent = Tweet.all_objects.order_by("-id").values("pk")[: settings.TWEETS_SEARCH_SCAN_LIMIT]
+        queryset = Tweet.objects.select_related("user").filter(pk__in=recent).order_by("-created_at", "-id")
+        for term in terms:
+            queryset = queryset.filter(content__icontains=term)
+        results = list(queryset[offset : offset + page_size + 1])
+    return results[:page_size], len(results) > page_size
@@ -0,0 +1,240 @@
+import random
+from collections import Counter, defaultdict
+
+from django.conf import settings
+from django.core.cache import cache
+from django.db import transaction
+from django.db.models import F, Sum, Value
+from django.db.models.functions import Greatest
+from django.utils import timezone
+
+from accounts.services import add_user_stats, bulk_add_user_stats
+from mysite.middleware import allow_queries
+
+from .events import publish_new_tweet
+from .models import Like, LikeCountShard, Tweet
+from .purge import schedule_purge
+from .tags import index_tweets
+from .timeline import fan_out_tweet
+from .trending import record_likes, record_new_tweet
+
+
+def _like_count_shards(tweet):
+    """Return the number of counter shards to spread ``tweet``'s like count over (0 = no sharding)."""
+    shards = settings.TWEETS_LIKE_COUNT_SHARDS
+    if shards > 1 and tweet.like_count >= settings.TWEETS_LIKE_COUNT_SHARD_THRESHOLD:
+        return shards
+    return 0
+
+
+def add_like_count(tweet, delta):
+    """Apply ``delta`` to the like count of ``tweet``. Must run inside the transaction that wrote the likes."""
+    shards = _like_count_shards(tweet)
+    if shards:
+        shard = random.randrange(shards)
+        rows = LikeCountShard.objects.filter(tweet=tweet, shard=shard)
+        if not rows.update(count=F("count") + delta):
+            LikeCountShard.objects.bulk_create([LikeCountShard(tweet=tweet, shard=shard)], ignore_conflicts=True)
+            rows.update(count=F("count") + delta)
+    else:
+        Tweet.objects.filter(pk=tweet.pk).update(
+            like_count=Greatest(F("like_count") + delta, Value(0)), updated_at=timezone.now()
+        )
+
+
+def add_like_counts(tweets, delta):
+    """Apply ``delta`` to the like counts of several tweets, with one UPDATE for those that are not sharded."""
+    unsharded = []
+    for tweet in tweets:
+        if _like_count_shards(tweet):
+            add_like_count(tweet, delta)
+        else:
+            unsharded.append(tweet.pk)
+    if unsharded:
+        Tweet.objects.filter(pk__in=unsharded).update(
+            like_count=Greatest(F("like_count") + delta, Value(0)), updated_at=timezone.now()
+        )
+
+
+def _pending_like_counts(tweet_ids):
+    """Return ``{tweet id: delta}`` still pending in counter shards, read with one grouped query."""
+    return dict(
+        LikeCountShard.objects.filter(tweet_id__in=tweet_ids)
+        .values("tweet_id")
+        .annotate(total=Sum("count"))
+        .values_list("tweet_id", "total")
+    )
+
+
+def get_like_counts(tweet_ids):
+    """
+    Return ``{tweet id: like count}`` for ``tweet_ids``, including deltas still pending in shards. Deleted tweets
+    are included, so that delete_tweet can read the count it takes off the author.
+    """
+    counts = dict(Tweet.all_objects.filter(pk__in=tweet_ids).values_list("pk", "like_count"))
+    if settings.TWEETS_LIKE_COUNT_SHARDS > 1:
+        for tweet_id, total in _pending_like_counts(counts).items():
+            counts[tweet_id] += total
+    return counts
+
+
+def add_pending_like_counts(tweets):
+    """
+    Add the deltas still pending in counter shards to the ``like_count`` of the loaded ``tweets``, so that pages
+    show the same counts as like responses. Costs one query per page while sharding is on, and none otherwise.
+    """
+    tweets = list(tweets)
+    if settings.TWEETS_LIKE_COUNT_SHARDS <= 1 or not tweets:
+        return
+    allow_queries(1)
+    pending = _pending_like_counts([tweet.pk for tweet in tweets])
+    for tweet in tweets:
+        tweet.like_count += pending.get(tweet.pk, 0)
+
+
+def get_like_count(tweet):
+    """Return the current like count of ``tweet``, including deltas still pending in shards."""
+    tweet.refresh_from_db(fields=["like_count"])
+    if _like_count_shards(tweet):
+        pending = tweet.like_count_shards.aggregate(total=Sum("count"))["total"] or 0
+        return tweet.like_count + pending
+    return tweet.like_count
+
+
+def _liked_cache_key(user_id, tweet_id):
+    return f"tweets:liked:{user_id}:{tweet_id}"
+
+
+def liked_tweet_ids(user, tweet_ids):
+    """
+    Return the subset of ``tweet_ids`` that ``user`` has liked.
+
+    Only the given tweets are looked up, in at most one query. When TWEETS_LIKED_CACHE_TIMEOUT is set, the
+    liked state of each (user, tweet) pair is cached and only cache misses reach the database. Toggles still
+    waiting in the write-behind buffer take precedence over both.
+    """
+    from .buffer import get_like_buffer
+
+    tweet_ids = set(tweet_ids)
+    if not tweet_ids or not user.is_authenticated:
+        return set()
+    liked = _stored_liked_tweet_ids(user, tweet_ids)
+    buffer = get_like_buffer()
+    if buffer is not None:
+        for tweet_id, is_liked in buffer.pending_states(user.pk, tweet_ids).items():
+            if is_liked:
+                liked.add(tweet_id)
+            else:
+                liked.discard(tweet_id)
+    return liked
+
+
+def _stored_liked_tweet_ids(user, tweet_ids):
+    timeout = settings.TWEETS_LIKED_CACHE_TIMEOUT
+    if not timeout:
+        return set(Like.objects.filter(user=user, tweet_id__in=tweet_ids).values_list("tweet_id", flat=True))
+
+    keys = {_liked_cache_key(user.pk, tweet_id): tweet_id for tweet_id in tweet_ids}
+    cached = cache.get_many(keys)
+    liked = {keys[key] for key, is_liked in cached.items() if is_liked}
+    missing = [tweet_id for key, tweet_id in keys.items() if key not in cached]
+    if missing:
+        found = set(Like.objects.filter(user=user, tweet_id__in=missing).values_list("tweet_id", flat=True))
+        cache.set_many({_liked_cache_key(user.pk, tweet_id): tweet_id in found for tweet_id in missing}, timeout)
+        liked |= found
+    return liked
+
+
+def _invalidate_liked_cache(user, tweets):
+    if settings.TWEETS_LIKED_CACHE_TIMEOUT:
+        keys = [_liked_cache_key(user.pk, tweet.pk) for tweet in tweets]
+        transaction.on_commit(lambda: cache.delete_many(keys))
+
+
+def like_tweet(user, tweet):
+    """Record that ``user`` likes ``tweet``. Return True if a new like was created."""
+    with transaction.atomic():
+        _, created = Like.objects.get_or_create(user=user, tweet=tweet)
+        if created:
+            add_like_count(tweet, 1)
+            add_user_stats(tweet.user_id, likes_received_count=1)
+            add_user_stats(user.pk, likes_count=1)
+            _invalidate_liked_cache(user, [tweet])
+            record_likes({tweet.pk: 1})
+    return created
+
+
+def unlike_tweet(user, tweet):
+    """Remove ``user``'s like on ``tweet``. Return True if a like was deleted."""
+    with transaction.atomic():
+        deleted, _ = Like.objects.filter(user=user, tweet=tweet).delete()
+        if deleted:
+            add_like_count(tweet, -deleted)
+            add_user_stats(tweet.user_id, likes_received_count=-deleted)
+            add_user_stats(user.pk, likes_count=-deleted)
+            _invalidate_liked_cache(user, [tweet])
+            record_likes({tweet.pk: -deleted})
+    return bool(deleted)
+
+
+def set_like_states(user, states):
+    """
+    Make ``user``'s likes match ``states``, a mapping of tweet id to the desired liked state.
+
+    Applying the same states twice is a no-op. All changes are written with one bulk insert and one delete,
+    and ids of tweets that do not exist are ignored. Return ``{tweet id: like count}`` for the existing tweets.
+    """
+    with transaction.atomic():
+        tweets = {tweet.pk: tweet for tweet in Tweet.objects.filter(pk__in=states).only("user_id", "like_count")}
+        liked = set(Like.objects.filter(user=user, tweet_id__in=tweets).values_list("tweet_id", flat=True))
+        to_like = [tweet for pk, tweet in tweets.items() if states[pk] and pk not in liked]
+        to_unlike = [tweet for pk, tweet in tweets.items() if not states[pk] and pk in liked]
+
+        if to_like:
+            Like.objects.bulk_create([Like(user=user, tweet=tweet) for tweet in to_like], ignore_conflicts=True)
+            add_like_counts(to_like, 1)
+        if to_unlike:
+            Like.objects.filter(user=user, tweet__in=to_unlike).delete()
+            add_like_counts(to_unlike, -1)
+        received = Counter(tweet.user_id for tweet in to_like)
+        received.subtract(tweet.user_id for tweet in to_unlike)
+        authors_by_delta = defaultdict(list)
+        for author_id, delta in received.items():
+            authors_by_delta[delta].append(author_id)
+        for delta, author_ids in authors_by_delta.items():
+            bulk_add_user_stats(author_ids, likes_received_count=delta)
+        if to_like or to_unlike:
+            add_user_stats(user.pk, likes_count=len(to_like) - len(to_unlike))
+        _invalidate_liked_cache(user, to_like + to_unlike)
+        record_likes({**{tweet.pk: 1 for tweet in to_like}, **{tweet.pk: -1 for tweet in to_unlike}})
+        return get_like_counts(tweets)
+
+
+def publish_tweet(tweet):
+    """
+    Update counters, timelines and the hashtag and mention index for a newly saved ``tweet``. Must run in the
+    transaction that saved it.
+    """
+    add_user_stats(tweet.user_id, tweets_count=1)
+    index_tweets([tweet])
+    fan_out_tweet(tweet)
+    publish_new_tweet(tweet)
+    record_new_tweet(tweet)
+
+
+def delete_tweet(tweet):
+    """
+    Hide ``tweet`` from every read path at once. Its likes, timeline entries and index rows are removed later
+    by tweets.purge, so that deleting a popular tweet costs as little as deleting any other. Return False if
+    it was already deleted.
+    """
+    with transaction.atomic():
+        if not Tweet.objects.filter(pk=tweet.pk).update(deleted_at=timezone.now()):
+            return False
+        # Read after the UPDATE, which blocks further likes, rather than from ``tweet``: the count then includes
+        # likes committed since it was loaded and deltas pending in shards. Likers' likes_count drops as the
+        # purge removes their likes.
+        like_count = get_like_counts([tweet.pk])[tweet.pk]
+        add_user_stats(tweet.user_id, tweets_count=-1, likes_received_count=-like_count)
+        schedule_purge()
+    return True
@@ -0,0 +1,70 @@
+import re
+import unicodedata
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+
+from mysite.pagination import KeysetPaginator
+
+from .models import Hashtag, Mention, Tweet
+
+User = get_user_model()
+
+# A tag or mention must not follow a word, a dot or a slash, so that email addresses (taro@example.com) and URL
+# fragments (https://example.com/#section) are not picked up.
+HASHTAG_RE = re.compile(r"(?<![\w.@＠#＃/])[#＃](\w+)")
+MENTION_RE = re.compile(r"(?<![\w.@＠#＃/])[@＠]([\w.+-]*\w)")
+
+
+def normalize_tag(tag):
+    """Fold full-width characters and case, so that ``#Django`` and ``#ｄｊａｎｇｏ`` are the same tag."""
+    return unicodedata.normalize("NFKC", tag).casefold()
+
+
+def extract_hashtags(content):
+    return list(dict.fromkeys(normalize_tag(tag) for tag in HASHTAG_RE.findall(content)))
+
+
+def extract_mentions(content):
+    return list(dict.fromkeys(MENTION_RE.findall(content)))
+
+
+def index_tweets(tweets):
+    """Store the hashtags and mentions of ``tweets``. Mentions of usernames that do not exist are ignored."""
+    hashtags = []
+    mentions = {}
+    for tweet in tweets:
+        hashtags.extend(
+            Hashtag(tweet=tweet, tag=tag, created_at=tweet.created_at) for tag in extract_hashtags(tweet.content)
+        )
+        mentions[tweet] = extract_mentions(tweet.content)
+    usernames = {username for names in mentions.values() for username in names}
+    user_ids = dict(User.objects.filter(username__in=usernames).values_list("username", "pk")) if usernames else {}
+    Hashtag.objects.bulk_create(hashtags, ignore_conflicts=True)
+    Mention.objects.bulk_create(
+        [
+            Mention(tweet=tweet, user_id=user_ids[username], created_at=tweet.created_at)
+            for tweet, names in mentions.items()
+            for username in names
+            if username in user_ids
+        ],
+        ignore_conflicts=True,
+    )
+
+
+def _tweet_page(queryset, before, after):
+    paginator = KeysetPaginator(settings.TWEETS_TIMELINE_PAGE_SIZE, fields=("created_at", "tweet_id"))
+    page = paginator.paginate(queryset.values("created_at", "tweet_id"), before=before, after=after)
+    tweets = Tweet.objects.select_related("user").in_bulk([row["tweet_id"] for row in page])
+    page.object_list = [tweets[row["tweet_id"]] for row in page if row["tweet_id"] in tweets]
+    return page
+
+
+def hashtag_page(tag, before=None, after=None):
+    """Return a page of the tweets tagged with ``tag``, newest first, read from hashtag_tag_created_idx."""
+    return _tweet_page(Hashtag.objects.filter(tag=normalize_tag(tag)), before, after)
+
+
+def mentions_page(user, before=None, after=None):
+    """Return a page of the tweets mentioning ``user``, newest first, read from mention_user_created_idx."""
+    return _tweet_page(Mention.objects.filter(user=user), before, after)
@@ -1,8 +1,36 @@
+import asyncio
+import json
+import os
+import tempfile
+import threading
+from io import StringIO
+from unittest import mock
+
+from asgiref.sync import sync_to_async
 from django.contrib.auth import get_user_model
-from django.test import TestCase
+from django.core.cache import cache
+from django.core.management import call_command
+from django.db import DatabaseError, connection
+from django.test import TestCase, override_settings
+from django.test.client import MULTIPART_CONTENT
+from django.test.utils import CaptureQueriesContext
 from django.urls import reverse
 
-from .models import Like, Tweet
+from accounts.deletion import request_account_deletion, run_account_deletion
+from accounts.models import FriendShip, UserStats
+from accounts.services import follow
+from mysite.middleware import QueryBudgetExceeded, get_query_stats, reset_query_stats
+from mysite.testing import QueryBudgetTestMixin, QueryPlanTestMixin, explain_query_plan
+
+from .buffer import LikeBuffer, get_like_buffer, stop_like_buffer
+from .events import EventBroker, get_event_broker
+from .models import Hashtag, Like, LikeCountShard, Mention, TimelineEntry, Tweet
+from .purge import get_purger, purge_deleted_tweets, stop_purger
+from .services import delete_tweet, like_tweet, liked_tweet_ids, publish_tweet, set_like_states, unlike_tweet
+from .tags import extract_hashtags, extract_mentions
+from .timeline import fan_out_tweet
+from .trending import TrendingCounter, get_trending, stop_trending
+from .views import HomeView, TweetCreateView
 
 User = get_user_model()
 
@@ -27,6 +55,78 @@ class TestHomeView(TestCase):
             ordered=False,
         )
 
+    @override_settings(TWEETS_TIMELINE_PAGE_SIZE=2)
+    def test_keyset_pagination(self):
+        tweets = [Tweet.objects.create(user=self.user, content=f"tweet{i}") for i in range(5)]
+        for tweet in tweets:
+            fan_out_tweet(tweet)
+        response = self.client.get(self.url)
+        self.assertEqual(list(response.context["tweet_list"]), [tweets[4], tweets[3]])
+        page = response.context["page"]
+        self.assertFalse(page.has_newer)
+
+        response = self.client.get(self.url, {"before": page.older_cursor})
+        self.assertEqual(list(response.context["tweet_list"]), [tweets[2], tweets[1]])
+        page = response.context["page"]
+
+        response = self.client.get(self.url, {"before": page.older_cursor})
+        self.assertEqual(list(response.context["tweet_list"]), [tweets[0]])
+        self.assertFalse(response.context["page"].has_older)
+
+        response = self.client.get(self.url, {"after": page.newer_cursor})
+        self.assertEqual(list(response.context["tweet_list"]), [tweets[4], tweets[3]])
+        self.assertFalse(response.context["page"].has_newer)
+
+    def test_failure_get_with_invalid_cursor(self):
+        response = self.client.get(self.url, {"before": "invalid"})
+        self.assertEqual(response.status_code, 400)
+
+    def test_shows_only_followed_users(self):
+        followed = User.objects.create_user(username="followed", password="testpassword")
+        stranger = User.objects.create_user(username="stranger", password="testpassword")
+        FriendShip.objects.create(follower=self.user, following=followed)
+        own = Tweet.objects.create(user=self.user, content="own")
+        followed_tweet = Tweet.objects.create(user=followed, content="followed")
+        stranger_tweet = Tweet.objects.create(user=stranger, content="stranger")
+        for tweet in (own, followed_tweet, stranger_tweet):
+            fan_out_tweet(tweet)
+        response = self.client.get(self.url)
+        self.assertEqual(list(response.context["tweet_list"]), [followed_tweet, own])
+
+    @override_settings(TWEETS_FANOUT_MAX_FOLLOWERS=1)
+    def test_celebrity_tweets_are_merged_at_read_time(self):
+        celebrity = User.objects.create_user(username="celebrity", password="testpassword")
+        follow(self.user, celebrity)
+        own = Tweet.objects.create(user=self.user, content="own")
+        fan_out_tweet(own)
+        celebrity_tweet = Tweet.objects.create(user=celebrity, content="celebrity")
+        fan_out_tweet(celebrity_tweet)
+        self.assertFalse(TimelineEntry.objects.filter(owner=self.user, tweet=celebrity_tweet).exists())
+        response = self.client.get(self.url)
+        self.assertEqual(list(response.context["tweet_list"]), [celebrity_tweet, own])
+
+
+class TestHomeJsonView(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.login(username="testuser", password="testpassword")
+
+    @override_settings(TWEETS_TIMELINE_PAGE_SIZE=1)
+    def test_success_get(self):
+        older = Tweet.objects.create(user=self.user, content="older")
+        newer = Tweet.objects.create(user=self.user, content="newer")
+        fan_out_tweet(older)
+        fan_out_tweet(newer)
+        Like.objects.create(user=self.user, tweet=older)
+        data = self.client.get(reverse("tweets:home_json")).json()
+        self.assertEqual([tweet["id"] for tweet in data["tweets"]], [newer.id])
+        self.assertIsNone(data["newer_cursor"])
+
+        data = self.client.get(reverse("tweets:home_json"), {"before": data["older_cursor"]}).json()
+        self.assertEqual(data["tweets"][0]["id"], older.id)
+        self.assertTrue(data["tweets"][0]["is_liked"])
+        self.assertIsNone(data["older_cursor"])
+
 
 class TestTweetCreateView(TestCase):
     def setUp(self):
@@ -48,6 +148,18 @@ class TestTweetCreateView(TestCase):
             target_status_code=200,
         )
         self.assertTrue(Tweet.objects.filter(content=data["content"]).exists())
+        self.assertEqual(UserStats.objects.get(user=self.user).tweets_count, 1)
+
+    def test_success_post_fans_out_to_followers(self):
+        follower = User.objects.create_user(username="follower", password="testpassword")
+        FriendShip.objects.create(follower=follower, following=self.user)
+        self.client.post(self.url, {"content": "test"})
+        tweet = Tweet.objects.get(content="test")
+        self.assertQuerysetEqual(
+            TimelineEntry.objects.filter(tweet=tweet).values_list("owner", flat=True),
+            [self.user.pk, follower.pk],
+            ordered=False,
+        )
 
     def test_failure_post_with_empty_content(self):
         empty_data = {"content": ""}
@@ -66,6 +178,230 @@ class TestTweetCreateView(TestCase):
         self.assertFalse(Tweet.objects.exists())
 
 
+class TestTweetSearchView(TestCase):
+    def setUp(self):
+        self.url = reverse("tweets:search")
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.force_login(self.user)
+        self.tower = Tweet.objects.create(user=self.user, content="東京タワーに行きました")
+        self.station = Tweet.objects.create(user=self.user, content="東京駅で待ち合わせ")
+        self.osaka = Tweet.objects.create(user=self.user, content="大阪城を見ました")
+
+    def search(self, query, **params):
+        response = self.client.get(self.url, {"q": query, **params})
+        self.assertEqual(response.status_code, 200)
+        return list(response.context["tweet_list"])
+
+    def test_success_get(self):
+        response = self.client.get(self.url)
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, "tweets/search.html")
+        self.assertEqual(list(response.context["tweet_list"]), [])
+
+    def test_indexed_terms(self):
+        self.assertEqual(self.search("タワー"), [self.tower])
+        self.assertEqual(self.search("東京タ"), [self.tower])
+        self.assertEqual(self.search("ました"), [self.osaka, self.tower])
+        self.assertEqual(self.search("ました 大阪"), [self.osaka])
+        self.assertEqual(self.search("名古屋"), [])
+
+    def test_short_terms(self):
+        self.assertEqual(self.search("東京"), [self.station, self.tower])
+        self.assertEqual(self.search("東京 駅"), [self.station])
+        self.assertEqual(self.search("タワー 東京"), [self.tower])
+        self.assertEqual(self.search("駅"), [self.station])
+        self.assertEqual(self.search("%"), [])
+
+    def test_two_character_terms_use_the_index(self):
+        with CaptureQueriesContext(connection) as context:
+            self.assertEqual(self.search("東京"), [self.station, self.tower])
+        sql = next(query["sql"] for query in context.captured_queries if "MATCH" in query["sql"])
+        plan = explain_query_plan(sql)
+        self.assertIn("SCAN tweets_tweet_search_bigrams VIRTUAL TABLE INDEX 0:M1", plan)
+        self.assertFalse([detail for detail in plan if detail.startswith("SCAN tweets_tweet ")], plan)
+
+    @override_settings(TWEETS_SEARCH_SCAN_LIMIT=2)
+    def test_single_characters_search_newest_tweets(self):
+        self.assertEqual(self.search("駅"), [self.station])
+        self.assertEqual(self.search("京"), [self.station])
+
+    def test_index_follows_updates_and_deletes(self):
+        Tweet.objects.filter(pk=self.tower.pk).update(content="スカイツリーに行きました")
+        self.assertEqual(self.search("タワー"), [])
+        self.assertEqual(self.search("スカイツリー"), [self.tower])
+        self.assertEqual(self.search("ツリ"), [self.tower])
+        self.tower.delete()
+        self.assertEqual(self.search("スカイツリー"), [])
+        self.assertEqual(self.search("ツリ"), [])
+
+    @override_settings(TWEETS_SEARCH_PAGE_SIZE=2)
+    def test_pagination(self):
+        Tweet.objects.create(user=self.user, content="京都に行きました")
+        response = self.client.get(self.url, {"q": "ました"})
+        self.assertEqual(len(response.context["tweet_list"]), 2)
+        self.assertTrue(response.context["has_next"])
+        response = self.client.get(self.url, {"q": "ました", "page": 2})
+        self.assertEqual(len(response.context["tweet_list"]), 1)
+        self.assertFalse(response.context["has_next"])
+
+    def test_failure_with_invalid_page(self):
+        for page in ["0", "x"]:
+            with self.subTest(page=page):
+                self.assertEqual(self.client.get(self.url, {"q": "東京", "page": page}).status_code, 404)
+
+    def test_rebuild_command(self):
+        with connection.cursor() as cursor:
+            cursor.execute("DROP TRIGGER tweets_tweet_search_insert")
+            cursor.execute("DROP TRIGGER tweets_tweet_search_bigrams_insert")
+        kyoto = Tweet.objects.create(user=self.user, content="京都に行きました")
+        self.assertEqual(self.search("京都に"), [])
+        self.assertEqual(self.search("京都"), [])
+        call_command("rebuild_search_index", stdout=StringIO())
+        self.assertEqual(self.search("京都に"), [kyoto])
+        self.assertEqual(self.search("京都"), [kyoto])
+        kobe = Tweet.objects.create(user=self.user, content="神戸に行きました")
+        self.assertEqual(self.search("神戸に"), [kobe])
+        self.assertEqual(self.search("神戸"), [kobe])
+
+
+class TestHashtags(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.other = User.objects.create_user(username="other.user", password="testpassword")
+        self.client.force_login(self.user)
+
+    def post(self, content):
+        self.client.post(reverse("tweets:create"), {"content": content})
+        return Tweet.objects.latest("pk")
+
+    def test_extraction(self):
+        self.assertEqual(extract_hashtags("#Django と ＃ｄｊａｎｇｏ と #東京 #django"), ["django", "東京"])
+        self.assertEqual(
+            extract_mentions("@other.user. こんにちは ＠testuser @other.user"), ["other.user", "testuser"]
+        )
+        self.assertEqual(extract_mentions("連絡は taro@example.com まで"), [])
+        self.assertEqual(extract_mentions("@@testuser #@testuser (@testuser)"), ["testuser"])
+        self.assertEqual(extract_hashtags("https://example.com/#section"), [])
+        self.assertEqual(extract_hashtags("C## a.#b @#c （#東京）"), ["東京"])
+
+    def test_create_indexes_tags_and_mentions(self):
+        tweet = self.post("#Django の話 @other.user @nobody")
+        self.assertQuerysetEqual(Hashtag.objects.values_list("tweet", "tag"), [(tweet.pk, "django")])
+        self.assertQuerysetEqual(Mention.objects.values_list("tweet", "user"), [(tweet.pk, self.other.pk)])
+
+    def test_hashtag_view(self):
+        first = self.post("#東京 一つ目")
+        self.post("#大阪")
+        second = self.post("二つ目 #東京")
+        response = self.client.get(reverse("tweets:hashtag", kwargs={"tag": "東京"}))
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, "tweets/hashtag.html")
+        self.assertEqual(list(response.context["tweet_list"]), [second, first])
+
+    @override_settings(TWEETS_TIMELINE_PAGE_SIZE=2)
+    def test_hashtag_view_pagination(self):
+        tweets = [self.post(f"#test {i}") for i in range(3)]
+        url = reverse("tweets:hashtag", kwargs={"tag": "TEST"})
+        page = self.client.get(url).context["page"]
+        self.assertEqual(list(page), tweets[:0:-1])
+        response = self.client.get(url, {"before": page.older_cursor})
+        self.assertEqual(list(response.context["tweet_list"]), [tweets[0]])
+        self.assertEqual(self.client.get(url, {"before": "invalid"}).status_code, 400)
+
+    def test_mentions_view(self):
+        self.client.force_login(self.other)
+        tweet = self.post("@testuser こんにちは")
+        self.post("@other.user 自分宛て")
+        self.client.force_login(self.user)
+        response = self.client.get(reverse("tweets:mentions"))
+        self.assertEqual(response.status_code, 200)
+        self.assertTemplateUsed(response, "tweets/mentions.html")
+        self.assertEqual(list(response.context["tweet_list"]), [tweet])
+
+    def test_deleting_tweet_removes_index_rows(self):
+        tweet = self.post("#test @other.user")
+        self.client.post(reverse("tweets:delete", kwargs={"pk": tweet.pk}))
+        response = self.client.get(reverse("tweets:hashtag", kwargs={"tag": "test"}))
+        self.assertEqual(list(response.context["tweet_list"]), [])
+        purge_deleted_tweets()
+        self.assertFalse(Hashtag.objects.exists())
+        self.assertFalse(Mention.objects.exists())
+
+    def test_backfill_command(self):
+        tweet = Tweet.objects.create(user=self.user, content="#test @other.user")
+        call_command("backfill_tags", "--batch-size", "1", stdout=StringIO())
+        call_command("backfill_tags", stdout=StringIO())
+        self.assertQuerysetEqual(Hashtag.objects.values_list("tweet", "tag"), [(tweet.pk, "test")])
+        self.assertQuerysetEqual(Mention.objects.values_list("tweet", "user"), [(tweet.pk, self.other.pk)])
+
+
+class TestTrendingCounter(TestCase):
+    def setUp(self):
+        self.counter = TrendingCounter(window=600, bucket_seconds=60, half_life=60, top_k=2)
+
+    def test_top_k_by_count(self):
+        for key, count in [("a", 1), ("b", 3), ("c", 2)]:
+            self.counter.add(key, count, now=0)
+        self.counter.refresh(now=0)
+        self.assertEqual(self.counter.top(), [("b", 3), ("c", 2)])
+        self.assertEqual(self.counter.top(1), [("b", 3)])
+
+    def test_decay(self):
+        self.counter.add("old", 3, now=0)
+        self.counter.add("new", 2, now=120)
+        self.counter.refresh(now=120)
+        self.assertEqual(self.counter.top(), [("new", 2), ("old", 0.75)])
+
+    def test_window(self):
+        self.counter.add("old", 100, now=0)
+        self.counter.add("new", 1, now=600)
+        self.counter.refresh(now=600)
+        self.assertEqual(self.counter.top(), [("new", 1)])
+
+    def test_negative_counts(self):
+        self.counter.add("a", 1, now=0)
+        self.counter.add("a", -1, now=0)
+        self.counter.refresh(now=0)
+        self.assertEqual(self.counter.top(), [])
+
+
+class TestTrendingViews(TestCase):
+    def setUp(self):
+        stop_trending()
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.force_login(self.user)
+        self.tweets = [Tweet.objects.create(user=self.user, content=f"test {i}") for i in range(3)]
+        self.likers = [User.objects.create_user(username=f"liker{i}", password="testpassword") for i in range(3)]
+
+    def tearDown(self):
+        stop_trending()
+
+    def test_trending_tweets(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for liker in self.likers:
+                like_tweet(liker, self.tweets[1])
+            like_tweet(self.likers[0], self.tweets[2])
+            like_tweet(self.likers[2], self.tweets[2])
+            set_like_states(self.likers[1], {self.tweets[2].pk: True, self.tweets[1].pk: False})
+        get_trending().refresh()
+        response = self.client.get(reverse("tweets:trending"))
+        self.assertEqual(response.status_code, 200)
+        scores = [(tweet["id"], tweet["score"]) for tweet in response.json()["tweets"]]
+        self.assertEqual(scores, [(self.tweets[2].pk, 3), (self.tweets[1].pk, 2)])
+
+    def test_trending_hashtags(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            for content in ["#東京 #大阪", "#東京", "#Tokyo"]:
+                self.client.post(reverse("tweets:create"), {"content": content})
+        get_trending().refresh()
+        response = self.client.get(reverse("tweets:trending_hashtags"))
+        self.assertEqual(response.status_code, 200)
+        hashtags = response.json()["hashtags"]
+        url = reverse("tweets:hashtag", kwargs={"tag": "東京"})
+        self.assertEqual(hashtags[0], {"tag": "東京", "score": 2, "url": url})
+        self.assertEqual(len(hashtags), 3)
+
+
 class TestTweetDetailView(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(
@@ -80,6 +416,73 @@ class TestTweetDetailView(TestCase):
         response = self.client.get(reverse("tweets:detail", kwargs={"pk": self.tweet.pk}))
         self.assertEqual(response.status_code, 200)
         self.assertEqual(response.context["tweet"], self.tweet)
+        self.assertEqual(response.context["liked_list"], set())
+
+    def test_liked_list_only_contains_this_tweet(self):
+        other = Tweet.objects.create(user=self.user, content="other")
+        Like.objects.create(user=self.user, tweet=self.tweet)
+        Like.objects.create(user=self.user, tweet=other)
+        response = self.client.get(reverse("tweets:detail", kwargs={"pk": self.tweet.pk}))
+        self.assertEqual(response.context["liked_list"], {self.tweet.id})
+
+
+@override_settings(ACCOUNTS_USER_CACHE_TIMEOUT=300)
+class TestConditionalGet(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.other = User.objects.create_user(username="other", password="testpassword")
+        follow(self.user, self.other)
+        self.tweet = Tweet.objects.create(user=self.other, content="test")
+        publish_tweet(self.tweet)
+        self.client.force_login(self.user)
+
+    def assertNotModified(self, url, num_queries):
+        etag = self.client.get(url)["ETag"]
+        # Session and the validator queries; the user comes from the user cache and nothing is rendered.
+        with self.assertNumQueries(num_queries):
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 304)
+        self.assertEqual(response.content, b"")
+        return etag
+
+    def test_detail_not_modified(self):
+        self.assertNotModified(reverse("tweets:detail", kwargs={"pk": self.tweet.pk}), 3)
+
+    def test_home_not_modified(self):
+        self.assertNotModified(reverse("tweets:home"), 2)
+
+    def test_modified_after_like(self):
+        url = reverse("tweets:detail", kwargs={"pk": self.tweet.pk})
+        home_etag = self.assertNotModified(reverse("tweets:home"), 2)
+        etag = self.assertNotModified(url, 3)
+        like_tweet(self.other, self.tweet)
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+        self.assertContains(response, "いいね数 1")
+        response = self.client.get(reverse("tweets:home"), HTTP_IF_NONE_MATCH=home_etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_modified_after_new_tweet(self):
+        etag = self.assertNotModified(reverse("tweets:home"), 2)
+        publish_tweet(Tweet.objects.create(user=self.other, content="new"))
+        response = self.client.get(reverse("tweets:home"), HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_etag_differs_per_viewer(self):
+        url = reverse("tweets:detail", kwargs={"pk": self.tweet.pk})
+        etag = self.client.get(url)["ETag"]
+        self.client.force_login(self.other)
+        self.assertEqual(self.client.get(url, HTTP_IF_NONE_MATCH=etag).status_code, 200)
+
+    def test_if_modified_since(self):
+        url = reverse("tweets:detail", kwargs={"pk": self.tweet.pk})
+        last_modified = self.client.get(url)["Last-Modified"]
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=last_modified)
+        self.assertEqual(response.status_code, 304)
+
+    def test_not_exist_tweet(self):
+        response = self.client.get(reverse("tweets:detail", kwargs={"pk": 999}), HTTP_IF_NONE_MATCH="*")
+        self.assertEqual(response.status_code, 404)
 
 
 class TestTweetDeleteView(TestCase):
@@ -107,6 +510,7 @@ class TestTweetDeleteView(TestCase):
             status_code=302,
         )
         self.assertFalse(Tweet.objects.filter(content="test1").exists())
+        self.assertEqual(UserStats.objects.get(user=self.user1).tweets_count, 0)
 
     def test_failure_post_with_not_exist_tweet(self):
         response = self.client.post(reverse("tweets:delete", kwargs={"pk": 500}))
@@ -119,6 +523,95 @@ class TestTweetDeleteView(TestCase):
         self.assertEqual(Tweet.objects.count(), 2)
 
 
+class TestSoftDelete(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.likers = [User.objects.create_user(username=f"liker{i}", password="testpassword") for i in range(3)]
+        for liker in self.likers:
+            follow(liker, self.user)
+        self.tweet = Tweet.objects.create(user=self.user, content="削除するツイート #test")
+        publish_tweet(self.tweet)
+        for liker in self.likers:
+            like_tweet(liker, self.tweet)
+        self.client.force_login(self.user)
+
+    def delete(self):
+        response = self.client.post(reverse("tweets:delete", kwargs={"pk": self.tweet.pk}))
+        self.assertEqual(response.status_code, 302)
+
+    def test_hides_tweet_on_read_paths(self):
+        self.delete()
+        self.assertTrue(Tweet.all_objects.filter(pk=self.tweet.pk).exists())
+        self.assertEqual(Like.objects.filter(tweet=self.tweet).count(), 3)
+        self.assertEqual(self.client.get(reverse("tweets:detail", kwargs={"pk": self.tweet.pk})).status_code, 404)
+        self.assertEqual(self.client.post(reverse("tweets:like", kwargs={"pk": self.tweet.pk})).status_code, 404)
+        profile = reverse("accounts:user_profile", kwargs={"username": "testuser"})
+        for url in [reverse("tweets:search") + "?q=削除する", profile]:
+            with self.subTest(url=url):
+                self.assertEqual(list(self.client.get(url).context["tweet_list"]), [])
+        self.client.force_login(self.likers[0])
+        self.assertEqual(list(self.client.get(reverse("tweets:home")).context["tweet_list"]), [])
+        stats = UserStats.objects.get(user=self.user)
+        self.assertEqual((stats.tweets_count, stats.likes_received_count), (0, 0))
+        call_command("verify_user_stats", stdout=StringIO())
+
+    @override_settings(TWEETS_LIKE_COUNT_SHARDS=4, TWEETS_LIKE_COUNT_SHARD_THRESHOLD=2)
+    def test_takes_current_like_count_off_author(self):
+        # Loaded before the likes, two of which then went to shards.
+        stale = Tweet.objects.create(user=self.user, content="stale")
+        publish_tweet(stale)
+        for liker in self.likers + [self.user]:
+            like_tweet(liker, Tweet.objects.get(pk=stale.pk))
+        self.assertTrue(LikeCountShard.objects.filter(tweet=stale).exists())
+        self.assertTrue(delete_tweet(stale))
+        self.assertEqual(UserStats.objects.get(user=self.user).likes_received_count, 3)
+        call_command("verify_user_stats", stdout=StringIO())
+
+    def test_delete_cost_does_not_grow_with_likes(self):
+        warm_up, unliked = [Tweet.objects.create(user=self.user, content="いいねなし") for _ in range(2)]
+        self.client.post(reverse("tweets:delete", kwargs={"pk": warm_up.pk}))
+        with CaptureQueriesContext(connection) as queries:
+            self.client.post(reverse("tweets:delete", kwargs={"pk": unliked.pk}))
+        with self.assertNumQueries(len(queries)):
+            self.delete()
+
+    def test_purge(self):
+        self.delete()
+        self.assertEqual(purge_deleted_tweets(chunk_size=2), 1)
+        self.assertFalse(Tweet.all_objects.exists())
+        for model in [Like, TimelineEntry, Hashtag]:
+            self.assertFalse(model.objects.exists())
+        self.assertEqual(UserStats.objects.get(user=self.likers[0]).likes_count, 0)
+        with connection.cursor() as cursor:
+            cursor.execute("SELECT count(*) FROM tweets_tweet_search")
+            self.assertEqual(cursor.fetchone()[0], 0)
+        call_command("verify_user_stats", stdout=StringIO())
+
+    def test_command(self):
+        self.delete()
+        out = StringIO()
+        call_command("purge_deleted_tweets", "--batch-size", "1", stdout=out)
+        self.assertEqual(out.getvalue(), "Purged 1 tweet(s).\n")
+
+    @override_settings(TWEETS_PURGE={"ENABLED": True, "INTERVAL": 60, "CHUNK_SIZE": 10})
+    @mock.patch("tweets.purge.purge_deleted_tweets")
+    def test_purger_runs_when_woken(self, purge):
+        purged = threading.Event()
+        purge.side_effect = lambda chunk_size: purged.set()
+        stop_purger()
+        try:
+            get_purger().wake()
+            self.assertTrue(purged.wait(5))
+        finally:
+            stop_purger()
+        purge.assert_called_with(10)
+
+    @override_settings(TWEETS_PURGE={"ENABLED": False, "INTERVAL": 60, "CHUNK_SIZE": 10})
+    def test_no_purger_when_disabled(self):
+        stop_purger()
+        self.assertIsNone(get_purger())
+
+
 class TestFavoriteView(TestCase):
     def setUp(self):
         self.user = User.objects.create_user(
@@ -134,6 +627,10 @@ class TestFavoriteView(TestCase):
         response = self.client.post(self.url)
         self.assertEqual(response.status_code, 200)
         self.assertTrue(Like.objects.count(), 1)
+        self.data.refresh_from_db()
+        self.assertEqual(self.data.like_count, 1)
+        self.assertEqual(response.json()["liked_count"], 1)
+        self.assertEqual(UserStats.objects.get(user=self.user).likes_received_count, 1)
 
     def test_failure_post_with_not_exist_tweet(self):
         response = self.client.post(reverse("tweets:like", kwargs={"pk": "999"}))
@@ -141,10 +638,11 @@ class TestFavoriteView(TestCase):
         self.assertEqual(Like.objects.count(), 0)
 
     def test_failure_post_with_favorited_tweet(self):
-        Like.objects.create(tweet=self.data, user=self.user)
+        self.client.post(self.url)
         response = self.client.post(self.url)
         self.assertEqual(response.status_code, 200)
         self.assertEqual(Like.objects.count(), 1)
+        self.assertEqual(response.json()["liked_count"], 1)
 
 
 class TestUnfavoriteView(TestCase):
@@ -156,13 +654,16 @@ class TestUnfavoriteView(TestCase):
         )
         self.client.login(username="testuser", password="testpassword")
         self.data = Tweet.objects.create(user=self.user, content="test.tweet")
-        Like.objects.create(user=self.user, tweet=self.data)
+        self.client.post(reverse("tweets:like", kwargs={"pk": self.data.pk}))
         self.url = reverse("tweets:unlike", kwargs={"pk": self.data.pk})
 
     def test_success_post(self):
         response = self.client.post(self.url)
         self.assertEqual(response.status_code, 200)
         self.assertEqual(Like.objects.count(), 0)
+        self.data.refresh_from_db()
+        self.assertEqual(self.data.like_count, 0)
+        self.assertEqual(response.json()["liked_count"], 0)
 
     def test_failure_post_with_not_exist_tweet(self):
         response = self.client.post(reverse("tweets:like", kwargs={"pk": "999"}))
@@ -173,3 +674,539 @@ class TestUnfavoriteView(TestCase):
         Like.objects.filter(tweet=self.data, user=self.user).delete()
         response = self.client.post(self.url)
         self.assertEqual(response.status_code, 200)
+
+
+class TestLikeBatchView(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.author = User.objects.create_user(username="author", password="testpassword")
+        self.client.force_login(self.user)
+        self.tweets = [Tweet.objects.create(user=self.author, content=f"tweet{i}") for i in range(3)]
+        like_tweet(self.user, self.tweets[2])
+        self.url = reverse("tweets:like_batch")
+
+    def post(self, likes):
+        return self.client.post(self.url, {"likes": likes}, content_type="application/json")
+
+    def test_success_post(self):
+        likes = [
+            {"tweet_id": self.tweets[0].id, "liked": True},
+            {"tweet_id": self.tweets[1].id, "liked": True},
+            {"tweet_id": self.tweets[1].id, "liked": False},
+            {"tweet_id": self.tweets[2].id, "liked": False},
+            {"tweet_id": 999, "liked": True},
+        ]
+        response = self.post(likes)
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(
+            sorted(response.json()["results"], key=lambda result: result["tweet_id"]),
+            [
+                {"tweet_id": self.tweets[0].id, "liked_count": 1, "is_liked": True},
+                {"tweet_id": self.tweets[1].id, "liked_count": 0, "is_liked": False},
+                {"tweet_id": self.tweets[2].id, "liked_count": 0, "is_liked": False},
+            ],
+        )
+        self.assertQuerysetEqual(Like.objects.values_list("tweet", flat=True), [self.tweets[0].id])
+        self.assertEqual(UserStats.objects.get(user=self.author).likes_received_count, 1)
+
+    def test_success_post_is_idempotent(self):
+        likes = [{"tweet_id": self.tweets[0].id, "liked": True}]
+        self.post(likes)
+        response = self.post(likes)
+        self.assertEqual(response.json()["results"][0]["liked_count"], 1)
+        self.assertEqual(Like.objects.filter(tweet=self.tweets[0]).count(), 1)
+        self.assertEqual(UserStats.objects.get(user=self.author).likes_received_count, 2)
+
+    def test_failure_post_with_invalid_payload(self):
+        for likes in ([{"tweet_id": self.tweets[0].id, "liked": "true"}], [{"tweet_id": "1"}], {"tweet_id": 1}):
+            response = self.post(likes)
+            self.assertEqual(response.status_code, 400)
+        self.assertEqual(Like.objects.count(), 1)
+
+    def test_failure_post_with_too_many_tweets(self):
+        response = self.post([{"tweet_id": i, "liked": True} for i in range(101)])
+        self.assertEqual(response.status_code, 400)
+
+
+class TestAsyncLikeViews(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.tweet = Tweet.objects.create(user=self.user, content="test")
+        fan_out_tweet(self.tweet)
+        self.async_client.force_login(self.user)
+
+    async def test_like_and_unlike(self):
+        response = await self.async_client.post(reverse("tweets:like_async", kwargs={"pk": self.tweet.pk}))
+        self.assertEqual(response.json(), {"liked_count": 1, "tweet_id": self.tweet.pk, "is_liked": True})
+        self.assertEqual(await Like.objects.acount(), 1)
+        response = await self.async_client.post(reverse("tweets:unlike_async", kwargs={"pk": self.tweet.pk}))
+        self.assertEqual(response.json()["liked_count"], 0)
+        self.assertFalse(await Like.objects.aexists())
+
+    async def test_failure_post_with_not_exist_tweet(self):
+        response = await self.async_client.post(reverse("tweets:like_async", kwargs={"pk": 999}))
+        self.assertEqual(response.status_code, 404)
+
+    async def test_timeline(self):
+        response = await self.async_client.get(reverse("tweets:home_json_async"))
+        self.assertEqual([tweet["id"] for tweet in response.json()["tweets"]], [self.tweet.pk])
+
+    async def test_failure_without_login(self):
+        self.async_client.cookies.clear()
+        response = await self.async_client.get(reverse("tweets:home_json_async"))
+        self.assertEqual(response.status_code, 302)
+
+
+class TestEventBroker(TestCase):
+    def test_events_since(self):
+        broker = EventBroker(buffer_size=2)
+        for i in range(3):
+            broker.publish("like", {"tweet_id": i, "count": i})
+        events, complete = broker.events_since(1)
+        self.assertEqual([event_id for event_id, _, _ in events], [2, 3])
+        self.assertTrue(complete)
+        self.assertFalse(broker.events_since(0)[1])
+        self.assertEqual(broker.events_since(3), ([], True))
+        self.assertEqual(broker.events_since(5), ([], False))
+
+    async def test_wait_is_woken_by_publish_from_another_thread(self):
+        broker = EventBroker()
+        threading.Timer(0.05, broker.publish, args=("tweet", {"tweet_id": 1, "author_id": 1})).start()
+        events, complete = await asyncio.wait_for(broker.wait(0, timeout=5), 1)
+        self.assertEqual(events, [(1, "tweet", {"tweet_id": 1, "author_id": 1})])
+        self.assertTrue(complete)
+
+
+@override_settings(TWEETS_EVENTS_TIMEOUT=0.1)
+class TestAsyncEventsView(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.followed = User.objects.create_user(username="followed", password="testpassword")
+        self.stranger = User.objects.create_user(username="stranger", password="testpassword")
+        follow(self.user, self.followed)
+        self.tweet = Tweet.objects.create(user=self.user, content="test")
+        self.other_tweet = Tweet.objects.create(user=self.followed, content="test")
+        self.client.force_login(self.followed)
+        self.async_client.force_login(self.user)
+        self.url = reverse("tweets:events")
+
+    def like(self, tweet):
+        with self.captureOnCommitCallbacks(execute=True):
+            self.client.post(reverse("tweets:like", kwargs={"pk": tweet.pk}))
+
+    def post_tweet(self, user):
+        with self.captureOnCommitCallbacks(execute=True):
+            publish_tweet(Tweet.objects.create(user=user, content="new"))
+
+    async def poll(self, since, tweets=""):
+        response = await self.async_client.get(self.url, {"since": since, "tweets": tweets})
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    async def test_without_since(self):
+        response = await self.async_client.get(self.url)
+        self.assertEqual(response.json()["last_id"], get_event_broker().last_id)
+
+    async def test_without_since_reads_counts(self):
+        await sync_to_async(self.like)(self.tweet)
+        response = await self.async_client.get(self.url, {"tweets": str(self.tweet.pk)})
+        self.assertEqual(response.json()["likes"], [{"tweet_id": self.tweet.pk, "liked_count": 1}])
+
+    async def test_reset_when_since_is_ahead_of_broker(self):
+        # As after a server restart, when the new broker has published fewer events than the page has seen.
+        last_id = get_event_broker().last_id
+        data = await self.poll(last_id + 500)
+        self.assertEqual(data, {"last_id": last_id, "likes": [], "new_tweets": 0, "reset": True})
+
+    async def test_like_counts_of_subscribed_tweets(self):
+        since = get_event_broker().last_id
+        await sync_to_async(self.like)(self.tweet)
+        await sync_to_async(self.like)(self.other_tweet)
+        data = await self.poll(since, str(self.tweet.pk))
+        self.assertEqual(data["likes"], [{"tweet_id": self.tweet.pk, "liked_count": 1}])
+        self.assertEqual(data["last_id"], since + 2)
+        self.assertFalse(data["reset"])
+
+    async def test_new_tweets_from_followed_users(self):
+        since = get_event_broker().last_id
+        for user in (self.followed, self.stranger, self.user):
+            await sync_to_async(self.post_tweet)(user)
+        data = await self.poll(since)
+        self.assertEqual(data["new_tweets"], 1)
+        self.assertEqual(data["likes"], [])
+
+    async def test_timeout_without_events(self):
+        since = get_event_broker().last_id
+        data = await self.poll(since)
+        self.assertEqual(data, {"last_id": since, "likes": [], "new_tweets": 0, "reset": False})
+
+    async def test_failure_with_invalid_parameters(self):
+        response = await self.async_client.get(self.url, {"since": "abc"})
+        self.assertEqual(response.status_code, 400)
+        response = await self.async_client.get(self.url, {"since": 0, "tweets": "1,x"})
+        self.assertEqual(response.status_code, 400)
+
+
+@override_settings(
+    TWEETS_LIKE_WRITE_BEHIND={
+        "ENABLED": True,
+        "FLUSH_INTERVAL": 3600,
+        "MAX_PENDING": 10000,
+        "JOURNAL": None,
+        "FSYNC": False,
+    }
+)
+class TestLikeWriteBehind(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username="author", password="testpassword")
+        self.tweet = Tweet.objects.create(user=self.author, content="viral")
+        self.users = [User.objects.create_user(username=f"fan{i}", password="testpassword") for i in range(3)]
+
+    def tearDown(self):
+        stop_like_buffer()
+
+    def like(self, user, url_name="tweets:like"):
+        self.client.force_login(user)
+        return self.client.post(reverse(url_name, kwargs={"pk": self.tweet.pk})).json()
+
+    def test_likes_are_acknowledged_before_flush(self):
+        counts = [self.like(user)["liked_count"] for user in self.users]
+        self.assertEqual(counts, [1, 2, 3])
+        self.assertFalse(Like.objects.exists())
+        self.assertEqual(liked_tweet_ids(self.users[0], [self.tweet.pk]), {self.tweet.pk})
+
+        self.assertEqual(get_like_buffer().flush(), 3)
+        self.assertEqual(Like.objects.count(), 3)
+        self.tweet.refresh_from_db()
+        self.assertEqual(self.tweet.like_count, 3)
+        self.assertEqual(self.like(self.users[0])["liked_count"], 3)
+
+    def test_toggles_are_coalesced(self):
+        self.like(self.users[0])
+        self.like(self.users[0], "tweets:unlike")
+        self.assertEqual(self.like(self.users[1])["liked_count"], 1)
+        get_like_buffer().flush()
+        self.assertQuerysetEqual(Like.objects.values_list("user", flat=True), [self.users[1].pk])
+
+    def test_no_likes_lost_on_graceful_shutdown(self):
+        for user in self.users:
+            self.like(user)
+        get_like_buffer().flush()
+        self.like(self.users[0], "tweets:unlike")
+        stop_like_buffer()
+        self.assertEqual(Like.objects.count(), 2)
+        self.tweet.refresh_from_db()
+        self.assertEqual(self.tweet.like_count, 2)
+
+    def test_journal_is_replayed_after_crash(self):
+        with tempfile.TemporaryDirectory() as directory:
+            journal = os.path.join(directory, "likes.journal")
+            buffer = LikeBuffer(flush_interval=3600, journal_path=journal)
+            buffer.start()
+            buffer.record(self.users[0].pk, self.tweet, True)
+            buffer.record(self.users[1].pk, self.tweet, True)
+            buffer._worker.stop()  # Simulate a crash: the flusher exits without flushing.
+            buffer._journal.close()
+            self.assertFalse(Like.objects.exists())
+
+            replayed = LikeBuffer(flush_interval=3600, journal_path=journal)
+            replayed.start()
+            self.assertEqual(Like.objects.count(), 2)
+            self.assertFalse(os.path.exists(journal + ".flushing"))
+            replayed.stop()
+
+    def test_flush_drops_likes_of_deleted_user(self):
+        buffer = get_like_buffer()
+        for user in self.users[:2]:
+            buffer.record(user.pk, self.tweet, True)
+        job = request_account_deletion(self.users[1])
+        self.assertTrue(run_account_deletion(job))
+
+        with self.assertLogs("tweets.buffer", "WARNING"):
+            self.assertEqual(buffer.flush(), 1)
+        self.assertQuerysetEqual(Like.objects.values_list("user", flat=True), [self.users[0].pk])
+        self.assertEqual(buffer.pending_states(self.users[1].pk, [self.tweet.pk]), {})
+        self.tweet.refresh_from_db()
+        self.assertEqual(self.tweet.like_count, 1)
+
+    def test_flush_keeps_failed_user_and_writes_others(self):
+        buffer = get_like_buffer()
+        for user in self.users[:2]:
+            buffer.record(user.pk, self.tweet, True)
+
+        def failing_set_like_states(user, states):
+            if user.pk == self.users[1].pk:
+                raise DatabaseError("locked")
+            return set_like_states(user, states)
+
+        with mock.patch("tweets.buffer.set_like_states", failing_set_like_states), self.assertLogs("tweets.buffer"):
+            self.assertEqual(buffer.flush(), 1)
+        self.assertQuerysetEqual(Like.objects.values_list("user", flat=True), [self.users[0].pk])
+        self.assertEqual(buffer.pending_states(self.users[1].pk, [self.tweet.pk]), {self.tweet.pk: True})
+        self.tweet.refresh_from_db()
+        self.assertEqual(buffer.record(self.users[2].pk, self.tweet, True), 3)
+
+        self.assertEqual(buffer.flush(), 2)
+        self.assertEqual(Like.objects.count(), 3)
+
+
+@override_settings(TWEETS_LIKE_COUNT_SHARDS=4, TWEETS_LIKE_COUNT_SHARD_THRESHOLD=1)
+class TestShardedLikeCount(TestCase):
+    def setUp(self):
+        self.author = User.objects.create_user(username="author", password="testpassword")
+        self.tweet = Tweet.objects.create(user=self.author, content="hot tweet", like_count=1)
+        Like.objects.create(user=self.author, tweet=self.tweet)
+        self.users = [User.objects.create_user(username=f"fan{i}", password="testpassword") for i in range(3)]
+
+    def test_hot_tweet_likes_go_to_shards(self):
+        for user in self.users:
+            self.client.force_login(user)
+            response = self.client.post(reverse("tweets:like", kwargs={"pk": self.tweet.pk}))
+        self.assertEqual(response.json()["liked_count"], 4)
+        self.tweet.refresh_from_db()
+        self.assertEqual(self.tweet.like_count, 1)
+        self.assertTrue(LikeCountShard.objects.filter(tweet=self.tweet).exists())
+
+        call_command("reconcile_like_counts", "--shards-only", stdout=StringIO())
+        self.tweet.refresh_from_db()
+        self.assertEqual(self.tweet.like_count, 4)
+        self.assertFalse(LikeCountShard.objects.exists())
+
+    def test_pages_show_pending_shard_counts(self):
+        fan_out_tweet(self.tweet)
+        for user in self.users:
+            like_tweet(user, self.tweet)
+        self.client.force_login(self.author)
+        for url in [
+            reverse("tweets:home"),
+            reverse("tweets:detail", kwargs={"pk": self.tweet.pk}),
+            reverse("accounts:user_profile", kwargs={"username": "author"}),
+        ]:
+            with self.subTest(url=url):
+                self.assertContains(self.client.get(url), "いいね数 4")
+        self.assertEqual(self.client.get(reverse("tweets:home_json")).json()["tweets"][0]["liked_count"], 4)
+
+
+@override_settings(TWEETS_LIKED_CACHE_TIMEOUT=60)
+class TestLikedTweetIdsCache(TestCase):
+    def setUp(self):
+        cache.clear()
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.tweets = [Tweet.objects.create(user=self.user, content=f"tweet{i}") for i in range(3)]
+        self.ids = [tweet.id for tweet in self.tweets]
+        Like.objects.create(user=self.user, tweet=self.tweets[0])
+
+    def test_cached_after_first_lookup(self):
+        with self.assertNumQueries(1):
+            self.assertEqual(liked_tweet_ids(self.user, self.ids), {self.ids[0]})
+        with self.assertNumQueries(0):
+            self.assertEqual(liked_tweet_ids(self.user, self.ids), {self.ids[0]})
+
+    def test_like_and_unlike_invalidate(self):
+        liked_tweet_ids(self.user, self.ids)
+        with self.captureOnCommitCallbacks(execute=True):
+            like_tweet(self.user, self.tweets[1])
+        self.assertEqual(liked_tweet_ids(self.user, self.ids), {self.ids[0], self.ids[1]})
+        with self.captureOnCommitCallbacks(execute=True):
+            unlike_tweet(self.user, self.tweets[0])
+        self.assertEqual(liked_tweet_ids(self.user, self.ids), {self.ids[1]})
+
+
+class TestReconcileLikeCountsCommand(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.tweets = [Tweet.objects.create(user=self.user, content=f"tweet{i}") for i in range(3)]
+
+    def test_fixes_drifted_counts(self):
+        Like.objects.create(user=self.user, tweet=self.tweets[0])
+        Tweet.objects.filter(pk=self.tweets[1].pk).update(like_count=5)
+        out = StringIO()
+        call_command("reconcile_like_counts", "--batch-size", "2", stdout=out)
+        self.assertEqual(
+            list(Tweet.objects.order_by("pk").values_list("like_count", flat=True)),
+            [1, 0, 0],
+        )
+        self.assertIn("fixed 2", out.getvalue())
+
+
+class TestRebuildTimelinesCommand(TestCase):
+    def test_rebuilds_from_follow_graph(self):
+        user = User.objects.create_user(username="testuser", password="testpassword")
+        followed = User.objects.create_user(username="followed", password="testpassword")
+        stranger = User.objects.create_user(username="stranger", password="testpassword")
+        FriendShip.objects.create(follower=user, following=followed)
+        own = Tweet.objects.create(user=user, content="own")
+        followed_tweet = Tweet.objects.create(user=followed, content="followed")
+        Tweet.objects.create(user=stranger, content="stranger")
+        call_command("rebuild_timelines", "testuser", stdout=StringIO())
+        self.assertQuerysetEqual(
+            TimelineEntry.objects.filter(owner=user).values_list("tweet", flat=True),
+            [own.pk, followed_tweet.pk],
+            ordered=False,
+        )
+
+
+class TestQueryBudgets(QueryBudgetTestMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.tweets = []
+        for i in range(5):
+            author = User.objects.create_user(username=f"author{i}", password="testpassword")
+            follow(self.user, author)
+            for _ in range(4):
+                tweet = Tweet.objects.create(user=author, content="test")
+                publish_tweet(tweet)
+                like_tweet(self.user, tweet)
+                self.tweets.append(tweet)
+        self.own_tweet = Tweet.objects.create(user=self.user, content="own")
+        publish_tweet(self.own_tweet)
+        self.client.force_login(self.user)
+        self.async_client.force_login(self.user)
+
+    def test_pages(self):
+        for url in [
+            reverse("tweets:home"),
+            reverse("tweets:home_json"),
+            reverse("tweets:create"),
+            reverse("tweets:search") + "?q=test",
+            reverse("tweets:hashtag", kwargs={"tag": "test"}),
+            reverse("tweets:mentions"),
+            reverse("tweets:trending"),
+            reverse("tweets:trending_hashtags"),
+            reverse("tweets:detail", kwargs={"pk": self.own_tweet.pk}),
+            reverse("tweets:delete", kwargs={"pk": self.own_tweet.pk}),
+        ]:
+            with self.subTest(url=url):
+                response = self.client.get(url)
+                self.assertEqual(response.status_code, 200)
+                self.assertWithinQueryBudget(response)
+
+    def test_writes(self):
+        tweet = self.tweets[0]
+        likes = json.dumps({"likes": [{"tweet_id": tweet.pk, "liked": False} for tweet in self.tweets]})
+        for url, data, content_type in [
+            (reverse("tweets:create"), {"content": "new #test @author0"}, MULTIPART_CONTENT),
+            (reverse("tweets:unlike", kwargs={"pk": tweet.pk}), {}, MULTIPART_CONTENT),
+            (reverse("tweets:like", kwargs={"pk": tweet.pk}), {}, MULTIPART_CONTENT),
+            (reverse("tweets:like_batch"), likes, "application/json"),
+            (reverse("tweets:delete", kwargs={"pk": self.own_tweet.pk}), {}, MULTIPART_CONTENT),
+        ]:
+            with self.subTest(url=url):
+                self.assertWithinQueryBudget(self.client.post(url, data, content_type=content_type))
+
+    async def test_async_views(self):
+        self.assertWithinQueryBudget(await self.async_client.get(reverse("tweets:home_json_async")))
+        url = reverse("tweets:unlike_async", kwargs={"pk": self.tweets[0].pk})
+        self.assertWithinQueryBudget(await self.async_client.post(url))
+
+    @override_settings(TWEETS_FANOUT_MAX_FOLLOWERS=1)
+    def test_home_budget_grows_with_followed_celebrities(self):
+        response = self.client.get(reverse("tweets:home"))
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.wsgi_request.query_metrics.allowance, 5)
+        self.assertWithinQueryBudget(response)
+
+    @override_settings(TWEETS_FANOUT_BATCH_SIZE=2)
+    def test_fan_out_is_left_out_of_budget(self):
+        for i in range(30):
+            follow(User.objects.create_user(username=f"follower{i}", password="testpassword"), self.user)
+        response = self.client.post(reverse("tweets:create"), {"content": "new"})
+        self.assertEqual(response.status_code, 302)
+        self.assertEqual(TimelineEntry.objects.filter(tweet__content="new").count(), 31)
+        self.assertWithinQueryBudget(response)
+
+
+class TestQueryMetricsMiddleware(TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.client.force_login(self.user)
+        reset_query_stats()
+
+    @override_settings(DEBUG=True)
+    def test_debug_headers(self):
+        response = self.client.get(reverse("tweets:home"))
+        count = response.wsgi_request.query_metrics.count
+        self.assertEqual(response["X-Query-Count"], str(count))
+        self.assertRegex(response["Server-Timing"], rf'^db;dur=[0-9.]+;desc="{count} queries"$')
+
+    def test_no_headers_without_debug(self):
+        response = self.client.get(reverse("tweets:home"))
+        self.assertNotIn("X-Query-Count", response)
+
+    def test_stats_per_url_name(self):
+        self.client.get(reverse("tweets:home"))
+        self.client.get(reverse("tweets:home"))
+        stats = get_query_stats()["tweets:home"]
+        self.assertEqual(stats["requests"], 2)
+        self.assertGreater(stats["max_queries"], 0)
+        self.assertLessEqual(stats["max_queries"], stats["queries"])
+
+    @override_settings(QUERY_BUDGET_STRICT=True)
+    def test_over_budget_raises_when_strict(self):
+        with mock.patch.object(HomeView, "query_budget", 1):
+            with self.assertRaises(QueryBudgetExceeded):
+                self.client.get(reverse("tweets:home"))
+
+    @override_settings(QUERY_BUDGET_STRICT=True)
+    def test_over_budget_after_a_write_is_logged_when_strict(self):
+        with mock.patch.object(TweetCreateView, "query_budget", 1):
+            with self.assertLogs("mysite.middleware", "WARNING"):
+                response = self.client.post(reverse("tweets:create"), {"content": "test"})
+        self.assertEqual(response.status_code, 302)
+
+    @override_settings(QUERY_BUDGET_STRICT=False)
+    def test_over_budget_is_logged(self):
+        with mock.patch.object(HomeView, "query_budget", 1):
+            with self.assertLogs("mysite.middleware", "WARNING") as logs:
+                response = self.client.get(reverse("tweets:home"))
+        self.assertEqual(response.status_code, 200)
+        self.assertIn("tweets:home ran", logs.output[0])
+
+
+class TestQueryPlans(QueryPlanTestMixin, TestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(username="testuser", password="testpassword")
+        self.author = User.objects.create_user(username="author", password="testpassword")
+        follow(self.user, self.author)
+        self.tweet = Tweet.objects.create(user=self.author, content="test")
+        publish_tweet(self.tweet)
+        like_tweet(self.user, self.tweet)
+        self.client.force_login(self.user)
+
+    def test_home(self):
+        with self.assertUsesIndexes():
+            self.client.get(reverse("tweets:home"))
+            self.client.get(reverse("tweets:home_json"))
+
+    @override_settings(TWEETS_FANOUT_MAX_FOLLOWERS=1)
+    def test_home_with_celebrities(self):
+        celebrity = User.objects.create_user(username="celebrity", password="testpassword")
+        follow(self.user, celebrity)
+        Tweet.objects.create(user=celebrity, content="celebrity")
+        with self.assertUsesIndexes():
+            self.client.get(reverse("tweets:home"))
+
+    def test_detail(self):
+        with self.assertUsesIndexes():
+            self.client.get(reverse("tweets:detail", kwargs={"pk": self.tweet.pk}))
+
+    def test_hashtag_and_mentions(self):
+        publish_tweet(Tweet.objects.create(user=self.author, content="#test @testuser"))
+        with self.assertUsesIndexes():
+            self.client.get(reverse("tweets:hashtag", kwargs={"tag": "test"}))
+            self.client.get(reverse("tweets:mentions"))
+
+    def test_create(self):
+        with self.assertUsesIndexes():
+            self.client.post(reverse("tweets:create"), {"content": "test"})
+
+    def test_like_and_unlike(self):
+        with self.assertUsesIndexes():
+            self.client.post(reverse("tweets:unlike", kwargs={"pk": self.tweet.pk}))
+            self.client.post(reverse("tweets:like", kwargs={"pk": self.tweet.pk}))
+
+    def test_delete_and_purge(self):
+        self.client.force_login(self.author)
+        with self.assertUsesIndexes():
+            self.client.post(reverse("tweets:delete", kwargs={"pk": self.tweet.pk}))
+            purge_deleted_tweets()
@@ -0,0 +1,118 @@
+from django.conf import settings
+from django.db.models import F, Max, Q
+
+from accounts.models import FriendShip, UserStats
+from mysite.middleware import allow_queries, unbudgeted
+from mysite.pagination import KeysetPaginator
+
+from .models import TimelineEntry, Tweet
+
+
+def is_celebrity(user_id):
+    """Return True if tweets of ``user_id`` are pulled at read time instead of being fanned out."""
+    return UserStats.objects.filter(
+        user_id=user_id, followers_count__gte=settings.TWEETS_FANOUT_MAX_FOLLOWERS
+    ).exists()
+
+
+def followed_celebrity_ids(user):
+    return list(
+        FriendShip.objects.filter(
+            follower=user, following__stats__followers_count__gte=settings.TWEETS_FANOUT_MAX_FOLLOWERS
+        ).values_list("following_id", flat=True)
+    )
+
+
+def _entry(owner_id, tweet):
+    return TimelineEntry(owner_id=owner_id, tweet=tweet, author_id=tweet.user_id, created_at=tweet.created_at)
+
+
+def fan_out_tweet(tweet):
+    """Deliver a new tweet to its author's timeline and, unless the author is a celebrity, to every follower's."""
+    TimelineEntry.objects.bulk_create([_entry(tweet.user_id, tweet)], ignore_conflicts=True)
+    if is_celebrity(tweet.user_id):
+        return
+    batch_size = settings.TWEETS_FANOUT_BATCH_SIZE
+    follower_ids = FriendShip.objects.filter(following_id=tweet.user_id).values_list("follower_id", flat=True)
+    # The number of INSERTs grows with the author's followers, so they are left out of the request's budget.
+    with unbudgeted():
+        batch = []
+        for follower_id in follower_ids.iterator(chunk_size=batch_size):
+            batch.append(_entry(follower_id, tweet))
+            if len(batch) >= batch_size:
+                TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+                batch = []
+        TimelineEntry.objects.bulk_create(batch, ignore_conflicts=True)
+
+
+def backfill_timeline(owner, author_ids):
+    """
+    Copy the latest tweets of newly followed ``author_ids``, except celebrities, into ``owner``'s timeline. As in
+    rebuild_timeline, only the newest TWEETS_TIMELINE_BACKFILL_SIZE tweets of all of them together are copied.
+    """
+    celebrities = set(
+        UserStats.objects.filter(
+            user_id__in=author_ids, followers_count__gte=settings.TWEETS_FANOUT_MAX_FOLLOWERS
+        ).values_list("user_id", flat=True)
+    )
+    authors = [author_id for author_id in author_ids if author_id not in celebrities]
+    if not authors:
+        return
+    tweets = Tweet.objects.filter(user_id__in=authors).order_by("-created_at", "-id")
+    TimelineEntry.objects.bulk_create(
+        [_entry(owner.pk, tweet) for tweet in tweets[: settings.TWEETS_TIMELINE_BACKFILL_SIZE]], ignore_conflicts=True
+    )
+
+
+def prune_timeline(owner, author_ids):
+    """Remove the tweets of unfollowed ``author_ids`` from ``owner``'s timeline."""
+    TimelineEntry.objects.filter(owner=owner, author_id__in=author_ids).delete()
+
+
+def rebuild_timeline(user):
+    """Recreate ``user``'s timeline from their own tweets and those of the non-celebrities they follow."""
+    authors = [user.pk]
+    celebrities = set(followed_celebrity_ids(user))
+    for author_id in FriendShip.objects.filter(follower=user).values_list("following_id", flat=True):
+        if author_id not in celebrities:
+            authors.append(author_id)
+    tweets = Tweet.objects.filter(user_id__in=authors).order_by("-created_at", "-id")
+    TimelineEntry.objects.filter(owner=user).delete()
+    TimelineEntry.objects.bulk_create(
+        [_entry(user.pk, tweet) for tweet in tweets[: settings.TWEETS_TIMELINE_BACKFILL_SIZE]],
+        batch_size=settings.TWEETS_FANOUT_BATCH_SIZE,
+    )
+
+
+def home_timeline_page(user, before=None, after=None):
+    """
+    Return a page of ``user``'s home timeline as Tweet objects.
+
+    The page is a range scan over the materialized timeline, merged with the latest tweets of followed
+    celebrities whose tweets are not fanned out.
+    """
+    paginator = KeysetPaginator(settings.TWEETS_TIMELINE_PAGE_SIZE, fields=("created_at", "tweet_id"))
+    sources = [TimelineEntry.objects.filter(owner=user).values("created_at", "tweet_id")]
+    celebrity_ids = followed_celebrity_ids(user)
+    allow_queries(len(celebrity_ids))
+    for celebrity_id in celebrity_ids:
+        # One source per author, so that each is a range scan on tweet_user_created_idx.
+        sources.append(
+            Tweet.objects.filter(user_id=celebrity_id).annotate(tweet_id=F("id")).values("created_at", "tweet_id")
+        )
+    page = paginator.paginate(*sources, before=before, after=after)
+    tweets = Tweet.objects.select_related("user").in_bulk([row["tweet_id"] for row in page])
+    page.object_list = [tweets[row["tweet_id"]] for row in page if row["tweet_id"] in tweets]
+    return page
+
+
+def home_timeline_version(user):
+    """
+    Return when anything shown on ``user``'s home timeline last changed.
+
+    New and deleted tweets, likes on them and follows all bump ``UserStats.updated_at`` of the viewer or of an
+    author they follow, so the newest of those timestamps covers both the timeline entries and the like counts.
+    """
+    following = FriendShip.objects.filter(follower=user).values("following")
+    stats = UserStats.objects.filter(Q(user=user) | Q(user__in=following))
+    return stats.aggregate(version=Max("updated_at"))["version"]
@@ -0,0 +1,137 @@
+import heapq
+import threading
+import time
+from collections import Counter, deque
+
+from django.conf import settings
+from django.db import transaction
+
+from mysite.workers import PeriodicWorker, ProcessSingleton
+
+from .tags import extract_hashtags
+
+
+class TrendingCounter:
+    """
+    Sliding-window counts of keys with exponential decay.
+
+    ``add`` increments the key in the current time bucket of ``bucket_seconds``; buckets older than ``window``
+    seconds are dropped. ``refresh`` scores every key as the sum of its bucket counts, each halved for every
+    ``half_life`` seconds of age, and keeps the ``top_k`` best in a list that ``top`` returns in O(K).
+    """
+
+    def __init__(self, window=3600, bucket_seconds=60, half_life=900, top_k=20):
+        self.window = window
+        self.bucket_seconds = bucket_seconds
+        self.half_life = half_life
+        self.top_k = top_k
+        self._buckets = deque()
+        self._lock = threading.Lock()
+        self._top = []
+
+    def add(self, key, amount=1, now=None):
+        bucket = int((time.time() if now is None else now) // self.bucket_seconds)
+        with self._lock:
+            if not self._buckets or self._buckets[-1][0] < bucket:
+                self._buckets.append((bucket, Counter()))
+                self._expire(bucket)
+            self._buckets[-1][1][key] += amount
+
+    def refresh(self, now=None):
+        """Recompute the top keys from the buckets in the window."""
+        current = int((time.time() if now is None else now) // self.bucket_seconds)
+        with self._lock:
+            self._expire(current)
+            buckets = [(bucket, counts.copy()) for bucket, counts in self._buckets]
+        scores = Counter()
+        for bucket, counts in buckets:
+            weight = 0.5 ** ((current - bucket) * self.bucket_seconds / self.half_life)
+            for key, count in counts.items():
+                scores[key] += count * weight
+        self._top = heapq.nlargest(
+            self.top_k, ((key, score) for key, score in scores.items() if score > 0), key=lambda item: item[1]
+        )
+
+    def top(self, k=None):
+        """Return ``[(key, score)]`` for the best keys as of the last refresh, best first."""
+        return self._top[:k]
+
+    def _expire(self, current):
+        while self._buckets and self._buckets[0][0] <= current - self.window // self.bucket_seconds:
+            self._buckets.popleft()
+
+
+class TrendingEngine:
+    """
+    Trending tweets, scored by recent likes, and trending hashtags, scored by recent tweets using them.
+
+    A background thread refreshes both rankings every ``refresh_interval`` seconds, so reads never compute
+    anything. Counts live in this process only: with several server processes each ranks what it served.
+    """
+
+    def __init__(self, refresh_interval=10, **counter_options):
+        self.refresh_interval = refresh_interval
+        self.tweets = TrendingCounter(**counter_options)
+        self.hashtags = TrendingCounter(**counter_options)
+        self._worker = PeriodicWorker(self.refresh, refresh_interval, "trending-refresher")
+
+    def start(self):
+        self._worker.start()
+
+    def stop(self):
+        self._worker.stop()
+
+    def refresh(self, now=None):
+        self.tweets.refresh(now)
+        self.hashtags.refresh(now)
+
+
+def _create_engine():
+    config = settings.TWEETS_TRENDING
+    return TrendingEngine(
+        refresh_interval=config["REFRESH_INTERVAL"],
+        window=config["WINDOW"],
+        bucket_seconds=config["BUCKET_SECONDS"],
+        half_life=config["HALF_LIFE"],
+        top_k=config["TOP_K"],
+    )
+
+
+_engine = ProcessSingleton(_create_engine)
+
+
+def get_trending():
+    """Return the process-wide trending engine."""
+    return _engine.get()
+
+
+def stop_trending():
+    """Stop and discard the process-wide trending engine, if one was started."""
+    _engine.stop()
+
+
+def record_likes(deltas):
+    """Count ``{tweet id: like delta}`` towards trending tweets once the current transaction commits."""
+    if not deltas:
+        return
+    counter = get_trending().tweets
+
+    def record():
+        for tweet_id, delta in deltas.items():
+            counter.add(tweet_id, delta)
+
+    transaction.on_commit(record)
+
+
+def record_new_tweet(tweet):
+    """Count the hashtags of ``tweet`` towards trending hashtags once the current transaction commits."""
+    tags = extract_hashtags(tweet.content)
+    if not tags:
+        return
+    counter = get_trending().hashtags
+
+    def record():
+        for tag in tags:
+            counter.add(tag)
+
+    transaction.on_commit(record)
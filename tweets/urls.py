@@ -5,9 +5,20 @@ from . import views
 app_name = "tweets"
 urlpatterns = [
     path("home/", views.HomeView.as_view(), name="home"),
+    path("home/json/", views.HomeJsonView.as_view(), name="home_json"),
+    path("home/json/async/", views.AsyncHomeJsonView.as_view(), name="home_json_async"),
     path("create/", views.TweetCreateView.as_view(), name="create"),
+    path("search/", views.TweetSearchView.as_view(), name="search"),
+    path("tags/<str:tag>/", views.HashtagView.as_view(), name="hashtag"),
+    path("mentions/", views.MentionsView.as_view(), name="mentions"),
+    path("trending/", views.TrendingTweetsView.as_view(), name="trending"),
+    path("trending/hashtags/", views.TrendingHashtagsView.as_view(), name="trending_hashtags"),
     path("<int:pk>/", views.TweetDetailView.as_view(), name="detail"),
     path("<int:pk>/delete/", views.TweetDeleteView.as_view(), name="delete"),
     path("<int:pk>/like/", views.LikeView.as_view(), name="like"),
     path("<int:pk>/unlike/", views.UnlikeView.as_view(), name="unlike"),
+    path("<int:pk>/like/async/", views.AsyncLikeView.as_view(), name="like_async"),
+    path("<int:pk>/unlike/async/", views.AsyncUnlikeView.as_view(), name="unlike_async"),
+    path("likes/", views.LikeBatchView.as_view(), name="like_batch"),
+    path("events/", views.AsyncEventsView.as_view(), name="events"),
 ]
@@ -1,44 +1,325 @@
+import asyncio
+import json
+
+from asgiref.sync import sync_to_async
+from django.conf import settings
 from django.contrib.auth.mixins import LoginRequiredMixin, UserPassesTestMixin
-from django.http import JsonResponse
+from django.db import transaction
+from django.http import Http404, HttpResponseBadRequest, HttpResponseRedirect, JsonResponse
 from django.shortcuts import get_object_or_404
-from django.urls import reverse_lazy
+from django.urls import reverse, reverse_lazy
 from django.views import View, generic
 
+from accounts.models import FriendShip
+from accounts.services import get_stats_versions
+from mysite.mixins import AsyncLoginRequiredMixin, ConditionalGetMixin
+
+from .buffer import get_like_buffer, pending_likes_version
+from .events import get_event_broker, publish_like_counts
 from .forms import TweetForm
-from .models import Like, Tweet
+from .models import Tweet
+from .search import search_tweets
+from .services import (
+    add_pending_like_counts,
+    delete_tweet,
+    get_like_count,
+    get_like_counts,
+    like_tweet,
+    liked_tweet_ids,
+    publish_tweet,
+    set_like_states,
+    unlike_tweet,
+)
+from .tags import hashtag_page, mentions_page
+from .timeline import home_timeline_page, home_timeline_version
+from .trending import get_trending
 
+MAX_LIKE_BATCH_SIZE = 100
 
-class HomeView(LoginRequiredMixin, generic.ListView):
-    model = Tweet
+
+def tweet_to_dict(tweet, liked_list):
+    return {
+        "id": tweet.id,
+        "user": tweet.user.username,
+        "content": tweet.content,
+        "created_at": tweet.created_at.isoformat(),
+        "liked_count": tweet.like_count,
+        "is_liked": tweet.id in liked_list,
+        "url": reverse("tweets:detail", kwargs={"pk": tweet.pk}),
+    }
+
+
+def set_liked(user, tweet, liked):
+    """Like or unlike ``tweet`` as ``user``, through the write-behind buffer if enabled. Return the like count."""
+    buffer = get_like_buffer()
+    if buffer is not None:
+        count = buffer.record(user.pk, tweet, liked)
+    else:
+        if liked:
+            like_tweet(user, tweet)
+        else:
+            unlike_tweet(user, tweet)
+        count = get_like_count(tweet)
+    publish_like_counts({tweet.pk: count})
+    return count
+
+
+class TimelineMixin:
+    def get_timeline_page(self):
+        return home_timeline_page(
+            self.request.user,
+            before=self.request.GET.get("before"),
+            after=self.request.GET.get("after"),
+        )
+
+    def get_timeline_json(self):
+        page = self.get_timeline_page()
+        add_pending_like_counts(page)
+        liked_list = liked_tweet_ids(self.request.user, [tweet.id for tweet in page])
+        return {
+            "tweets": [tweet_to_dict(tweet, liked_list) for tweet in page],
+            "older_cursor": page.older_cursor,
+            "newer_cursor": page.newer_cursor,
+        }
+
+
+class HomeView(LoginRequiredMixin, ConditionalGetMixin, TimelineMixin, generic.ListView):
     template_name = "tweets/home.html"
-    ordering = "created_at"
     context_object_name = "tweet_list"
-    queryset = Tweet.objects.select_related("user").all()
+    # Tweets of followed celebrities are read with one more query per celebrity, added by home_timeline_page.
+    query_budget = 8
+
+    def get_validators(self):
+        version = home_timeline_version(self.request.user)
+        return (version, pending_likes_version()), version
+
+    def get_queryset(self):
+        self.page = self.get_timeline_page()
+        return self.page.object_list
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["liked_list"] = Like.objects.filter(user=self.request.user).values_list("tweet", flat=True)
+        context["page"] = self.page
+        add_pending_like_counts(self.page)
+        context["liked_list"] = liked_tweet_ids(self.request.user, [tweet.id for tweet in self.page])
         return context
 
 
+class HomeJsonView(LoginRequiredMixin, TimelineMixin, View):
+    query_budget = 9
+
+    def get(self, request, *args, **kwargs):
+        return JsonResponse(self.get_timeline_json())
+
+
+class AsyncHomeJsonView(AsyncLoginRequiredMixin, TimelineMixin, View):
+    query_budget = 9
+
+    async def get(self, request, *args, **kwargs):
+        return JsonResponse(await sync_to_async(self.get_timeline_json)())
+
+
+class AsyncEventsView(AsyncLoginRequiredMixin, View):
+    """
+    Long-poll for live updates after the event id ``since``.
+
+    Answers as soon as there are like counts for the tweets listed in ``tweets`` (comma separated ids) or new
+    tweets from followed users, or after TWEETS_EVENTS_TIMEOUT seconds with nothing. Without ``since`` it
+    answers immediately with the current event id to poll from and the current counts of the listed tweets.
+
+    ``reset`` is true when events after ``since`` are no longer known, because they fell out of the broker's
+    buffer or the server restarted. The client should then poll again without ``since`` to re-read the counts.
+    """
+
+    async def get(self, request, *args, **kwargs):
+        broker = get_event_broker()
+        try:
+            since = int(request.GET["since"]) if "since" in request.GET else None
+            tweet_ids = {int(pk) for pk in request.GET.get("tweets", "").split(",") if pk}
+        except ValueError:
+            return HttpResponseBadRequest("リクエストの形式が正しくありません。")
+        if len(tweet_ids) > MAX_LIKE_BATCH_SIZE:
+            return HttpResponseBadRequest(f"一度に購読できるツイートは{MAX_LIKE_BATCH_SIZE}件までです。")
+        if since is None:
+            # The event id is read first, so that counts changed while they are read are sent by the next poll.
+            last_id = broker.last_id
+            likes = await sync_to_async(get_like_counts)(tweet_ids) if tweet_ids else {}
+            return JsonResponse(
+                {
+                    "last_id": last_id,
+                    "likes": [{"tweet_id": tweet_id, "liked_count": count} for tweet_id, count in likes.items()],
+                    "new_tweets": 0,
+                    "reset": False,
+                }
+            )
+
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + settings.TWEETS_EVENTS_TIMEOUT
+        following = None
+        likes, new_tweets, complete = {}, 0, True
+        while True:
+            events, complete = await broker.wait(since, max(deadline - loop.time(), 0))
+            for event_id, kind, data in events:
+                since = event_id
+                if kind == "like" and data["tweet_id"] in tweet_ids:
+                    likes[data["tweet_id"]] = data["count"]
+                elif kind == "tweet":
+                    if following is None:
+                        following = {
+                            pk
+                            async for pk in FriendShip.objects.filter(follower=request.user).values_list(
+                                "following_id", flat=True
+                            )
+                        }
+                    new_tweets += data["author_id"] in following
+            # Events nobody on this page cares about do not end the poll.
+            if likes or new_tweets or not complete or loop.time() >= deadline:
+                break
+        return JsonResponse(
+            {
+                # After a reset ``since`` may be ahead of the broker, e.g. after a restart, and would be answered
+                # at once again.
+                "last_id": since if complete else broker.last_id,
+                "likes": [{"tweet_id": tweet_id, "liked_count": count} for tweet_id, count in likes.items()],
+                "new_tweets": new_tweets,
+                "reset": not complete,
+            }
+        )
+
+
 class TweetCreateView(LoginRequiredMixin, generic.CreateView):
     model = Tweet
     template_name = "tweets/create.html"
     form_class = TweetForm
     success_url = reverse_lazy("tweets:home")
+    query_budget = 12
 
     def form_valid(self, form):
         form.instance.user = self.request.user
-        return super().form_valid(form)
+        with transaction.atomic():
+            response = super().form_valid(form)
+            publish_tweet(self.object)
+        return response
 
 
-class TweetDetailView(LoginRequiredMixin, generic.DetailView):
+class TweetSearchView(LoginRequiredMixin, generic.ListView):
+    template_name = "tweets/search.html"
+    context_object_name = "tweet_list"
+    query_budget = 6
+
+    def get_queryset(self):
+        self.query = self.request.GET.get("q", "").strip()
+        try:
+            self.page_number = int(self.request.GET.get("page", 1))
+        except ValueError:
+            raise Http404
+        if self.page_number < 1:
+            raise Http404
+        tweets, self.has_next = search_tweets(self.query, self.page_number)
+        return tweets
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["query"] = self.query
+        context["page_number"] = self.page_number
+        context["has_next"] = self.has_next
+        add_pending_like_counts(self.object_list)
+        context["liked_list"] = liked_tweet_ids(self.request.user, [tweet.id for tweet in self.object_list])
+        return context
+
+
+class TrendingTweetsView(LoginRequiredMixin, View):
+    query_budget = 5
+
+    def get(self, request, *args, **kwargs):
+        top = get_trending().tweets.top()
+        tweets = Tweet.objects.select_related("user").in_bulk([tweet_id for tweet_id, _ in top])
+        add_pending_like_counts(tweets.values())
+        liked_list = liked_tweet_ids(request.user, list(tweets))
+        return JsonResponse(
+            {
+                "tweets": [
+                    {**tweet_to_dict(tweets[tweet_id], liked_list), "score": round(score, 3)}
+                    for tweet_id, score in top
+                    if tweet_id in tweets
+                ]
+            }
+        )
+
+
+class TrendingHashtagsView(LoginRequiredMixin, View):
+    query_budget = 2
+
+    def get(self, request, *args, **kwargs):
+        return JsonResponse(
+            {
+                "hashtags": [
+                    {"tag": tag, "score": round(score, 3), "url": reverse("tweets:hashtag", kwargs={"tag": tag})}
+                    for tag, score in get_trending().hashtags.top()
+                ]
+            }
+        )
+
+
+class TweetPageListView(LoginRequiredMixin, generic.ListView):
+    """A keyset-paginated list of tweets; subclasses return the page in ``get_page``."""
+
+    context_object_name = "tweet_list"
+    query_budget = 6
+
+    def get_page(self, before, after):
+        raise NotImplementedError
+
+    def get_queryset(self):
+        self.page = self.get_page(before=self.request.GET.get("before"), after=self.request.GET.get("after"))
+        return self.page.object_list
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["page"] = self.page
+        add_pending_like_counts(self.page)
+        context["liked_list"] = liked_tweet_ids(self.request.user, [tweet.id for tweet in self.page])
+        return context
+
+
+class HashtagView(TweetPageListView):
+    template_name = "tweets/hashtag.html"
+
+    def get_page(self, before, after):
+        return hashtag_page(self.kwargs["tag"], before=before, after=after)
+
+    def get_context_data(self, **kwargs):
+        context = super().get_context_data(**kwargs)
+        context["tag"] = self.kwargs["tag"]
+        return context
+
+
+class MentionsView(TweetPageListView):
+    template_name = "tweets/mentions.html"
+
+    def get_page(self, before, after):
+        return mentions_page(self.request.user, before=before, after=after)
+
+
+class TweetDetailView(LoginRequiredMixin, ConditionalGetMixin, generic.DetailView):
     model = Tweet
     template_name = "tweets/detail.html"
+    query_budget = 8
+
+    def get_validators(self):
+        tweet = Tweet.objects.filter(pk=self.kwargs["pk"]).values_list("user_id", "like_count", "updated_at").first()
+        if tweet is None:
+            return None, None
+        author_id, like_count, updated_at = tweet
+        # The author's stats also change with likes counted in shards, which leave the tweet row untouched.
+        stats = get_stats_versions({author_id, self.request.user.pk})
+        version = (like_count, updated_at, sorted(stats.items()), pending_likes_version())
+        return version, max([updated_at, *stats.values()])
 
     def get_context_data(self, **kwargs):
         context = super().get_context_data(**kwargs)
-        context["liked_list"] = Like.objects.filter(user=self.request.user).values_list("tweet", flat=True)
+        add_pending_like_counts([self.object])
+        context["liked_list"] = liked_tweet_ids(self.request.user, [self.object.id])
         return context
 
 
@@ -46,18 +327,29 @@ class TweetDeleteView(LoginRequiredMixin, UserPassesTestMixin, generic.DeleteVie
     model = Tweet
     template_name = "tweets/delete.html"
     success_url = reverse_lazy("tweets:home")
+    query_budget = 16
+
+    def get_object(self, queryset=None):
+        # test_func and the deletion both need the tweet; read it once.
+        if not hasattr(self, "object"):
+            self.object = super().get_object(queryset)
+        return self.object
 
     def test_func(self, **kwargs):
-        tweet = self.get_object()
-        return tweet.user == self.request.user
+        return self.get_object().user_id == self.request.user.pk
+
+    def form_valid(self, form):
+        delete_tweet(self.object)
+        return HttpResponseRedirect(self.get_success_url())
 
 
 class LikeView(LoginRequiredMixin, View):
+    query_budget = 16
+
     def post(self, request, *args, **kwargs):
         tweet = get_object_or_404(Tweet, pk=self.kwargs["pk"])
-        Like.objects.get_or_create(user=self.request.user, tweet=tweet)
         context = {
-            "liked_count": tweet.like_tweet.count(),
+            "liked_count": set_liked(self.request.user, tweet, True),
             "tweet_id": tweet.id,
             "is_liked": True,
         }
@@ -65,12 +357,69 @@ class LikeView(LoginRequiredMixin, View):
 
 
 class UnlikeView(LoginRequiredMixin, View):
+    query_budget = 16
+
     def post(self, request, *args, **kwargs):
         tweet = get_object_or_404(Tweet, pk=kwargs["pk"])
-        Like.objects.filter(user=self.request.user, tweet=tweet).delete()
         context = {
-            "liked_count": tweet.like_tweet.count(),
+            "liked_count": set_liked(self.request.user, tweet, False),
             "tweet_id": tweet.id,
             "is_liked": False,
         }
         return JsonResponse(context)
+
+
+class AsyncLikeView(AsyncLoginRequiredMixin, View):
+    liked = True
+    query_budget = 16
+
+    async def post(self, request, *args, **kwargs):
+        try:
+            tweet = await Tweet.objects.aget(pk=kwargs["pk"])
+        except Tweet.DoesNotExist:
+            raise Http404
+        # The like and its counters are written in one transaction, which Django 4.1 cannot run asynchronously.
+        context = {
+            "liked_count": await sync_to_async(set_liked)(request.user, tweet, self.liked),
+            "tweet_id": tweet.id,
+            "is_liked": self.liked,
+        }
+        return JsonResponse(context)
+
+
+class AsyncUnlikeView(AsyncLikeView):
+    liked = False
+
+
+class LikeBatchView(LoginRequiredMixin, View):
+    """Set the liked state of several tweets from ``{"likes": [{"tweet_id": 1, "liked": true}, ...]}``."""
+
+    query_budget = 16
+
+    def post(self, request, *args, **kwargs):
+        try:
+            states = {}
+            for like in json.loads(request.body)["likes"]:
+                if not isinstance(like["tweet_id"], int) or not isinstance(like["liked"], bool):
+                    raise TypeError
+                states[like["tweet_id"]] = like["liked"]
+        except (ValueError, KeyError, TypeError):
+            return HttpResponseBadRequest("リクエストの形式が正しくありません。")
+        if len(states) > MAX_LIKE_BATCH_SIZE:
+            return HttpResponseBadRequest(f"一度に変更できるいいねは{MAX_LIKE_BATCH_SIZE}件までです。")
+        buffer = get_like_buffer()
+        if buffer is not None:
+            counts = {
+                tweet.pk: buffer.record(request.user.pk, tweet, states[tweet.pk])
+                for tweet in Tweet.objects.filter(pk__in=states).only("like_count")
+            }
+        else:
+            counts = set_like_states(request.user, states)
+        publish_like_counts(counts)
+        context = {
+            "results": [
+                {"tweet_id": tweet_id, "liked_count": liked_count, "is_liked": states[tweet_id]}
+                for tweet_id, liked_count in counts.items()
+            ],
+        }
+        return JsonResponse(context)